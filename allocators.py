@@ -0,0 +1,119 @@
+SEQUENCES_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS sequences (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )
+'''
+
+TRANSACTION_SEQUENCE = 'transaction'
+REGISTRATION_SEQUENCE = 'registration_no'
+
+# Registration numbers are 8 digits: 10000000-99999999. The n-th number is
+# n run through a keyed permutation of that range: a four-round Feistel
+# network on two 4-digit halves permutes 0-99999999, and values that land
+# past the range are fed through again (cycle walking) until one fits.
+# Numbers are unique by construction, and neighbouring n share no pattern.
+REGISTRATION_BASE = 10000000
+REGISTRATION_RANGE = 90000000
+REGISTRATION_HALF = 10000
+REGISTRATION_KEYS = (0x3C6EF372, 0xA54FF53A, 0x510E527F, 0x1F83D9AB)
+# Keep IN (...) lists under SQLite's default host-parameter limit.
+LOOKUP_CHUNK = 500
+
+
+def create_sequences_table(conn):
+    """Create the sequences table, continuing after the highest transaction ID in use"""
+    conn.execute(SEQUENCES_SCHEMA)
+    highest = conn.execute(
+        '''SELECT MAX(COALESCE((SELECT MAX(id) FROM transactions), 0),
+                      COALESCE((SELECT MAX(CAST(SUBSTR(transaction_id, 4) AS INTEGER))
+                                FROM transactions WHERE transaction_id LIKE 'TXN%'), 0))'''
+    ).fetchone()[0]
+    conn.execute(
+        'INSERT OR IGNORE INTO sequences (name, value) VALUES (?, ?)',
+        (TRANSACTION_SEQUENCE, highest)
+    )
+
+
+def allocate(conn, name, count=1):
+    """Reserve ``count`` consecutive values from a sequence; returns the first.
+
+    Runs on the caller's connection, so it takes part in the caller's write
+    transaction: the values are unique across concurrent writers and are
+    released again if that transaction rolls back. Reserving a block for a
+    batch costs the same single UPDATE as reserving one value.
+    """
+    row = conn.execute(
+        'UPDATE sequences SET value = value + ? WHERE name = ? RETURNING value',
+        (count, name)
+    ).fetchone()
+    if row is None:
+        raise LookupError(f'Unknown sequence: {name}')
+    return row[0] - count + 1
+
+
+def create_registration_sequence(conn):
+    conn.execute(SEQUENCES_SCHEMA)
+    conn.execute(
+        'INSERT OR IGNORE INTO sequences (name, value) VALUES (?, 0)',
+        (REGISTRATION_SEQUENCE,)
+    )
+
+
+def format_transaction_id(number):
+    return f'TXN{str(number).zfill(4)}'
+
+
+def allocate_transaction_ids(conn, count=1):
+    """Reserve ``count`` transaction IDs (TXN0001, ...) in the caller's transaction"""
+    first = allocate(conn, TRANSACTION_SEQUENCE, count)
+    return [format_transaction_id(number) for number in range(first, first + count)]
+
+
+def _feistel_round(half, key):
+    mixed = (half * 0x9E3779B1 + key) & 0xFFFFFFFF
+    mixed = ((mixed ^ (mixed >> 15)) * 0x85EBCA6B) & 0xFFFFFFFF
+    return (mixed ^ (mixed >> 13)) % REGISTRATION_HALF
+
+
+def _feistel(value):
+    left, right = divmod(value, REGISTRATION_HALF)
+    for key in REGISTRATION_KEYS:
+        left, right = right, (left + _feistel_round(right, key)) % REGISTRATION_HALF
+    return left * REGISTRATION_HALF + right
+
+
+def permute_registration_number(n):
+    value = _feistel(n % REGISTRATION_RANGE)
+    while value >= REGISTRATION_RANGE:
+        value = _feistel(value)
+    return str(REGISTRATION_BASE + value)
+
+
+def allocate_registration_numbers(conn, count=1):
+    """Reserve ``count`` unique registration numbers in the caller's transaction.
+
+    Costs one sequence UPDATE per block plus an indexed lookup per
+    LOOKUP_CHUNK numbers. The lookup only matters for databases that still
+    hold randomly generated legacy numbers: a permuted number that happens to
+    be taken is skipped and replaced from the next block.
+    """
+    numbers = []
+    while len(numbers) < count:
+        needed = count - len(numbers)
+        first = allocate(conn, REGISTRATION_SEQUENCE, needed)
+        candidates = [permute_registration_number(n) for n in range(first, first + needed)]
+        taken = set()
+        for start in range(0, len(candidates), LOOKUP_CHUNK):
+            chunk = candidates[start:start + LOOKUP_CHUNK]
+            placeholders = ', '.join('?' * len(chunk))
+            taken.update(row[0] for row in conn.execute(
+                f'SELECT registration_no FROM students WHERE registration_no IN ({placeholders})', chunk
+            ))
+        numbers.extend(number for number in candidates if number not in taken)
+    return numbers
+
+
+def generate_registration_number(conn):
+    """Next unique 8-digit registration number, allocated in the caller's transaction"""
+    return allocate_registration_numbers(conn, 1)[0]
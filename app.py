@@ -2,30 +2,54 @@
 import random
 import os
 import asyncio
-import re
-from datetime import datetime, timedelta
+import time
+import json
+from datetime import date, datetime, timedelta
 from typing import Optional, List
 from functools import wraps
 from fastapi import Request
-from fastapi import FastAPI, Depends, HTTPException, status, Query, Body, Path
+from fastapi import FastAPI, Depends, HTTPException, status, Query, Body, Path, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 import jwt
 # from jwt.exceptions import PyJWTError
 from pydantic import BaseModel
 import traceback
 from contextlib import asynccontextmanager
 
-from database import (
-    get_db_connection,
-    hash_password,
-    verify_password,
-    generate_registration_number,
-)
+from database import DATABASE_NAME, add_default_data, get_db_connection
+from db_pool import get_read_pool
+from data_access import WriteBusy
+from writer import WriteTimeout, WriterBusy, get_writer
+from repositories import DuplicateKey, create_storage
+from hashing import HashingBusy, password_hasher
+from search import DEFAULT_SEARCH_LIMIT, normalize_isbn, search_cache
+from book_import import IMPORT_FORMATS, ImportFormatError, detect_format, import_books, iter_rows, validate_isbn13
+from auth_cache import token_cache
+from structured_logging import RequestContextMiddleware, get_logger, logging_stats, start_logging, stop_logging
+import metrics
+from metrics import MetricsMiddleware
+from catalog_cache import catalog_cache, etag_matches
+from fines import FINE_ACCRUAL_INTERVAL
+from circulation import (MAX_BOOKS_PER_STUDENT, RETURN_DAYS, CirculationError, borrow_book, borrow_books, check_borrow,
+                         check_return, contended, return_book, return_books)
+from export import EXPORT_FORMATS, EXPORT_MEDIA_TYPES, export_transactions
+from enroll import enroll_students, iter_roster
+from migrations import run_migrations
+from pagination import DEFAULT_PAGE_SIZE, InvalidCursor, MAX_PAGE_SIZE
 from fastapi.security import OAuth2PasswordBearer
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+auth_logger = get_logger('auth')
+circulation_logger = get_logger('circulation')
+fines_logger = get_logger('fines')
+
+# Every route reads and writes through the repositories (see repositories.py);
+# STORAGE=memory runs the whole API without library.db.
+storage = create_storage()
+
 
 SECRET_KEY = "your-very-secret-key"
 ALGORITHM = "HS256"
@@ -45,30 +69,64 @@ def decode_access_token(token: str):
         return None
 
 
+async def accrue_fines_periodically():
+    """Run the fine accrual job now and then every FINE_ACCRUAL_INTERVAL seconds"""
+    while True:
+        try:
+            result = await storage.write(lambda repos: repos.accrue_fines(int(time.time())))
+            fines_logger.info('fines accrued', extra={'fields': result})
+        except Exception:
+            fines_logger.exception('fine accrual failed')
+        await asyncio.sleep(FINE_ACCRUAL_INTERVAL)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
- 
+    start_logging()
+
     try:
         from database import init_database
-        if not os.path.exists('library.db'):
+        if storage.name == 'memory':
+            await storage.write(add_default_data)
+            print("✅ Using an in-memory store with the default data")
+        elif not os.path.exists(DATABASE_NAME):
             print("🔄 Initializing new database...")
             init_database()
             print("✅ Database created with default admin user")
         else:
             print("✅ Using existing database")
+            conn = get_db_connection()
+            try:
+                applied = run_migrations(conn)
+            finally:
+                conn.close()
+            for version, description in applied:
+                print(f"⬆️  Applied migration {version}: {description}")
     except Exception:
         print("❌ Database startup error:")
         traceback.print_exc()
         raise
 
+    accrual_task = asyncio.create_task(accrue_fines_periodically()) if FINE_ACCRUAL_INTERVAL > 0 else None
+
     yield  # application runs after this
 
     # optional shutdown logic
     try:
         print("🔌 Shutting down application...")
+        if accrual_task is not None:
+            accrual_task.cancel()
+            try:
+                await accrual_task
+            except asyncio.CancelledError:
+                pass
+        storage.close()
+        password_hasher.shutdown()
     except Exception:
         print("❌ Error during shutdown:")
         traceback.print_exc()
+    finally:
+        stop_logging()
 
 app = FastAPI(
     title="Library Management System",
@@ -86,6 +144,23 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestContextMiddleware)
+
+# Read from the pool, the writer and the hasher at scrape time rather than tracked per call.
+metrics.registry.register(metrics.Gauge(
+    'library_db_pool_connections', 'Pooled SQLite connections by pool and state.', ('pool', 'state'),
+    callback=lambda: {('read', state): get_read_pool().stats()[state] for state in ('in_use', 'idle', 'open')}))
+metrics.registry.register(metrics.Gauge(
+    'library_db_write_queue_depth', 'Write operations waiting for the writer thread.',
+    callback=lambda: {(): get_writer().stats()['queued']}))
+metrics.registry.register(metrics.Gauge(
+    'library_db_writer', 'Writer thread totals: group commits, operations rejected with a full queue, failed commits.',
+    ('state',),
+    callback=lambda: {(state,): get_writer().stats()[state] for state in ('groups', 'rejected', 'commits_failed')}))
+metrics.registry.register(metrics.Gauge(
+    'library_password_hash_jobs', 'bcrypt jobs on the hashing pool by state.', ('state',),
+    callback=lambda: {(state,): password_hasher.stats()[state] for state in ('running', 'queued')}))
 
 
 
@@ -109,12 +184,6 @@ def create_access_token(subject: str, user_claims: dict, expires_delta: timedelt
 
 
 
-# Constants
-FINE_PER_DAY = 10
-MAX_BOOKS_PER_STUDENT = 3
-RETURN_DAYS = 7
-
-
 class LoginRequest(BaseModel):
     username: str
     password: str
@@ -162,13 +231,12 @@ class BorrowBookRequest(BaseModel):
 class ReturnBookRequest(BaseModel):
     transaction_id: int
 
+class BatchBorrowRequest(BaseModel):
+    book_ids: List[int]
+
+class BatchReturnRequest(BaseModel):
+    transaction_ids: List[int]
 
-def validate_isbn13(isbn: str) -> bool:
-    """Validate ISBN-13 format"""
-    isbn = re.sub(r'[-\s]', '', isbn)
-    if len(isbn) != 13 or not isbn.isdigit():
-        return False
-    return True
 
 def row_to_dict(row):
     """Convert sqlite3.Row to dictionary"""
@@ -180,26 +248,133 @@ def rows_to_dict_list(rows):
     """Convert list of sqlite3.Row to list of dictionaries"""
     return [dict(row) for row in rows]
 
-def calculate_fine(due_date_str: str) -> float:
-    """Calculate fine for overdue books"""
-    if isinstance(due_date_str, str):
-        due_date = datetime.fromisoformat(due_date_str)
-    else:
-        due_date = due_date_str
-    today = datetime.now()
-    if today > due_date:
-        days_overdue = (today - due_date).days
-        return days_overdue * FINE_PER_DAY
-    return 0
+def batch_response(results, done):
+    """Body for a batch borrow/return: per-item results plus counts"""
+    succeeded = sum(1 for result in results if result['status'] == done)
+    return {
+        'success': succeeded > 0,
+        done: succeeded,
+        'failed': len(results) - succeeded,
+        'results': results
+    }
+
+def paginated(rows, next_cursor, limit):
+    """Response body for a keyset-paginated listing"""
+    return {'items': rows, 'next_cursor': next_cursor, 'limit': limit}
+
+# Read units of work, run via storage.read.
+
+def list_books(repos):
+    return repos.books.list_all()
+
+def list_books_page(repos, limit, cursor):
+    return repos.books.list_page(limit, cursor)
+
+def search_books(repos, text, limit):
+    return repos.books.search(text, limit)
+
+def list_students(repos):
+    return repos.students.list_all()
+
+def list_students_page(repos, limit, cursor):
+    return repos.students.list_page(limit, cursor)
+
+def search_students(repos, text, limit):
+    return repos.students.search(text, limit)
+
+def get_student(repos, student_id):
+    return repos.students.get(student_id)
+
+def list_transactions(repos):
+    return repos.transactions.list_all()
+
+def list_transactions_page(repos, limit, cursor):
+    return repos.transactions.list_page(limit, cursor)
+
+def list_overdue(repos, now_ts):
+    return repos.transactions.overdue(now_ts)
+
+def list_open_loans(repos, student_id):
+    return repos.transactions.open_for_student(student_id)
+
+def list_history(repos, student_id):
+    return repos.transactions.history_for_student(student_id)
+
+def server_busy():
+    """503 for a request turned away by the hashing pool or the writer"""
+    return HTTPException(status_code=503, detail="Server is busy, please retry shortly", headers={"Retry-After": "1"})
+
+async def hash_password(password: str) -> str:
+    """Hash a password on the hashing process pool"""
+    try:
+        return await password_hasher.hash(password)
+    except HashingBusy:
+        raise server_busy()
+
+async def verify_password(password: str, hashed: str) -> bool:
+    """Check a password on the hashing process pool"""
+    try:
+        return await password_hasher.verify(password, hashed)
+    except HashingBusy:
+        raise server_busy()
+
+async def queue_write(fn, *args):
+    """Run a mutating unit of work on the writer thread (see writer.py)"""
+    try:
+        return await storage.write(fn, *args)
+    except (WriterBusy, WriteBusy, WriteTimeout):
+        raise server_busy()
+
+async def queue_catalog_write(fn, *args):
+    """queue_write for a unit of work that changes books or copies.
+
+    The catalog cache is dropped however the write ends. One that timed out
+    (503) may still commit on the writer afterwards, so the cache is dropped
+    again when the writer is done with it.
+    """
+    try:
+        return await storage.write(fn, *args)
+    except WriteTimeout as e:
+        invalidate_catalog_when_done(e)
+        raise server_busy()
+    except (WriterBusy, WriteBusy):
+        raise server_busy()
+    finally:
+        catalog_cache.invalidate()
+
+async def queue_circulation(book, fn, *args):
+    """queue_catalog_write for a borrow or return of ``book``, its row from a pre-check.
+
+    A contended title (see circulation.contended) is borrowed and returned in
+    a write transaction of its own, so a holder's return frees the copy at
+    once instead of waiting for a group commit on the writer.
+    """
+    if not contended(book):
+        return await queue_catalog_write(fn, *args)
+    try:
+        return await storage.circulate(fn, *args)
+    except WriteBusy:
+        raise server_busy()
+    finally:
+        catalog_cache.invalidate()
+
+def invalidate_catalog_when_done(timeout):
+    """Drop the catalog cache once the write behind a WriteTimeout has finished"""
+    if timeout.future is not None:
+        timeout.future.add_done_callback(lambda _: catalog_cache.invalidate())
 
 
 async def extract_claims(token: str = Depends(oauth2_scheme)):
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached
     try:
         raw = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_claims = raw.get("user_claims") or raw.get("claims") or {}
         merged = raw.copy()
         if isinstance(user_claims, dict):
             merged.update(user_claims)
+        token_cache.put(token, merged)
         return merged
     except jwt.exceptions.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid or expired JWT token")
@@ -211,7 +386,7 @@ async def verify_admin(
 ):
     if request is not None and request.method == "OPTIONS":
         return {}
-    print("DEBUG verify_admin claims:", claims)
+    auth_logger.debug('verify_admin', extra={'fields': {'sub': claims.get('sub'), 'role': claims.get('role')}})
     if claims.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     return claims
@@ -221,7 +396,7 @@ async def verify_student(
 ):
     if request is not None and request.method == "OPTIONS":
         return {}
-    print("DEBUG verify_student claims:", claims)
+    auth_logger.debug('verify_student', extra={'fields': {'sub': claims.get('sub'), 'role': claims.get('role')}})
     if claims.get("role") != "student":
         raise HTTPException(status_code=403, detail="Student access required")
     if not claims.get("id"):
@@ -233,7 +408,7 @@ async def verify_any_user(
 ):
     if request is not None and request.method == "OPTIONS":
         return {}
-    print("DEBUG verify_any_user claims:", claims)
+    auth_logger.debug('verify_any_user', extra={'fields': {'sub': claims.get('sub'), 'role': claims.get('role')}})
     return claims
 
 
@@ -251,10 +426,24 @@ async def root():
 async def health_check():
     return {
         "status": "healthy",
-        "timestamp": datetime.now().isoformat()
+        "timestamp": datetime.now().isoformat(),
+        "storage": storage.name,
+        "db_read_pool": get_read_pool().stats(),
+        "writer": get_writer().stats(),
+        "password_hashing": password_hasher.stats(),
+        "catalog_cache": catalog_cache.stats(),
+        "auth_cache": token_cache.stats(),
+        "search_cache": search_cache.stats(),
+        "logging": logging_stats()
     }
 
 
+@app.get("/api/metrics")
+async def get_metrics():
+    """Runtime metrics in the Prometheus text exposition format"""
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
 @app.post("/api/auth/login")
 async def login(data: LoginRequest):
     """Login endpoint for admin or student"""
@@ -265,18 +454,19 @@ async def login(data: LoginRequest):
         if not username or not password:
             raise HTTPException(status_code=400, detail="Username and password are required")
 
-        conn = get_db_connection()
+        def fetch_accounts(repos):
+            return repos.admins.get_by_username(username), repos.students.get_by_username(username)
+
+        admin, student = await storage.read(fetch_accounts)
 
         # Check admin
-        admin = conn.execute('SELECT * FROM admins WHERE username = ?', (username,)).fetchone()
-        if admin and verify_password(password, admin['password']):
+        if admin and await verify_password(password, admin['password']):
             user_claims = {
                 'role': admin['role'],
                 'name': admin['name'],
                 'id': admin['id']
             }
             access_token = create_access_token(username, user_claims)
-            conn.close()
             return {
                 'success': True,
                 'token': access_token,
@@ -288,8 +478,7 @@ async def login(data: LoginRequest):
             }
 
         # Check student
-        student = conn.execute('SELECT * FROM students WHERE username = ?', (username,)).fetchone()
-        if student and verify_password(password, student['password']):
+        if student and await verify_password(password, student['password']):
             user_claims = {
                 'role': student['role'],
                 'id': student['id'],
@@ -298,7 +487,6 @@ async def login(data: LoginRequest):
                 'fine_amount': student['fine_amount']
             }
             access_token = create_access_token(username, user_claims)
-            conn.close()
             return {
                 'success': True,
                 'token': access_token,
@@ -312,8 +500,9 @@ async def login(data: LoginRequest):
                 }
             }
 
-        conn.close()
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Login failed: {str(e)}")
 
@@ -321,35 +510,28 @@ async def login(data: LoginRequest):
 async def register(data: RegisterRequest):
     """Register new student"""
     try:
-        conn = get_db_connection()
-        existing = conn.execute('SELECT id FROM students WHERE username = ?', (data.username,)).fetchone()
-        if existing:
-            conn.close()
-            raise HTTPException(status_code=400, detail="Username already exists")
-        reg_no = generate_registration_number()
-        
         # Hash password
-        hashed_pw = hash_password(data.password)
-        
-        # Insert student
-        cursor = conn.execute(
-            '''INSERT INTO students (registration_no, username, password, name, email, phone, role)
-               VALUES (?, ?, ?, ?, ?, ?, ?)''',
-            (reg_no, data.username, hashed_pw, data.name, data.email, data.phone, 'student')
-        )
-        conn.commit()
-        
-        new_student = conn.execute('SELECT * FROM students WHERE id = ?', (cursor.lastrowid,)).fetchone()
-        conn.close()
-        
+        hashed_pw = await hash_password(data.password)
+
+        def insert_student(repos):
+            if repos.students.get_by_username(data.username):
+                raise HTTPException(status_code=400, detail="Username already exists")
+            return repos.students.add(data.username, hashed_pw, data.name, data.email, data.phone)
+
+        new_student = await queue_write(insert_student)
+
         student_dict = row_to_dict(new_student)
         student_dict.pop('password', None)
-        
+
         return {
             'success': True,
             'message': 'Student registered successfully',
             'student': student_dict
         }
+    except DuplicateKey:
+        raise HTTPException(status_code=400, detail="Username already exists")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Registration failed: {str(e)}")
 
@@ -357,27 +539,32 @@ async def register(data: RegisterRequest):
 async def check_username(username: str = Query(...)):
     """Check if username is available"""
     try:
-        conn = get_db_connection()
-        
-        admin = conn.execute('SELECT id FROM admins WHERE username = ?', (username,)).fetchone()
-        student = conn.execute('SELECT id FROM students WHERE username = ?', (username,)).fetchone()
-        
-        conn.close()
-        
-        if admin or student:
+        def username_taken(repos):
+            return bool(repos.admins.get_by_username(username) or repos.students.get_by_username(username))
+
+        if await storage.read(username_taken):
             return {'available': False}
         return {'available': True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Check failed: {str(e)}")
 
 @app.get("/api/admin/books")
-async def admin_get_books(claims = Depends(verify_admin)):
-    """Get all books (admin only)"""
+async def admin_get_books(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    claims = Depends(verify_admin)
+):
+    """Get all books (admin only); pass limit/cursor for keyset pagination"""
     try:
-        conn = get_db_connection()
-        books = conn.execute('SELECT * FROM books ORDER BY created_at DESC').fetchall()
-        conn.close()
-        return rows_to_dict_list(books)
+        if limit is None and cursor is None:
+            books = await storage.read(list_books)
+            return rows_to_dict_list(books)
+
+        limit = limit or DEFAULT_PAGE_SIZE
+        books, next_cursor = await storage.read(list_books_page, limit, cursor)
+        return paginated(rows_to_dict_list(books), next_cursor, limit)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch books: {str(e)}")
 
@@ -386,93 +573,100 @@ async def admin_get_books(claims = Depends(verify_admin)):
 async def admin_add_book(data: AddBookRequest, claims = Depends(verify_admin)):
     """Add new book (admin only)"""
     try:
-        isbn = data.isbn.strip()
-        
+        # Stored as bare digits, as the importer and the ISBN search expect.
+        isbn = normalize_isbn(data.isbn)
+
         if not validate_isbn13(isbn):
             raise HTTPException(status_code=400, detail="Invalid ISBN-13 format")
-        
-        conn = get_db_connection()
-        
-        existing = conn.execute(
-            'SELECT id FROM books WHERE isbn = ? OR title = ?',
-            (isbn, data.title.strip())
-        ).fetchone()
-        
-        if existing:
-            conn.close()
-            raise HTTPException(status_code=400, detail="Book with this ISBN or title already exists")
-        
-        quantity = int(data.quantity)
-        cursor = conn.execute(
-            '''INSERT INTO books (title, author, isbn, pages, price, category, quantity, available)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-            (
+
+        def insert_book(repos):
+            if repos.books.find_by_isbn_or_title(isbn, data.title.strip()):
+                raise HTTPException(status_code=400, detail="Book with this ISBN or title already exists")
+
+            return repos.books.add(
                 data.title.strip(),
                 data.author.strip(),
                 isbn,
                 int(data.pages),
                 round(float(data.price), 2),
                 data.category.strip(),
-                quantity,
-                quantity
+                int(data.quantity)
             )
-        )
-        conn.commit()
-        
-        new_book = conn.execute('SELECT * FROM books WHERE id = ?', (cursor.lastrowid,)).fetchone()
-        conn.close()
-        
+
+        new_book = await queue_catalog_write(insert_book)
+
         return {'success': True, 'book': row_to_dict(new_book)}
+    except DuplicateKey:
+        raise HTTPException(status_code=400, detail="Book with this ISBN or title already exists")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to add book: {str(e)}")
 
 
+@app.post("/api/admin/books/import")
+async def admin_import_books(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, pattern=f"^({'|'.join(IMPORT_FORMATS)})$"),
+    claims = Depends(verify_admin)
+):
+    """Bulk-import books from a CSV or JSONL upload (admin only)"""
+    try:
+        fmt = detect_format(file.filename, format)
+        try:
+            report = await import_books(iter_rows(file.file, fmt), storage)
+        except WriteTimeout as e:
+            invalidate_catalog_when_done(e)
+            raise
+        finally:
+            # Batches written before a failure stay imported.
+            catalog_cache.invalidate()
+
+        return {'success': True, **report}
+    except ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (WriterBusy, WriteBusy, WriteTimeout):
+        raise server_busy()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to import books: {str(e)}")
+
+
 @app.put("/api/admin/books/{book_id}")
 async def admin_update_book(book_id: int = Path(...), data: UpdateBookRequest = Body(...), claims = Depends(verify_admin)):
     """Update book (admin only)"""
     try:
-        conn = get_db_connection()
-        
-        book = conn.execute('SELECT * FROM books WHERE id = ?', (book_id,)).fetchone()
-        if not book:
-            conn.close()
-            raise HTTPException(status_code=404, detail="Book not found")
-        
-        update_fields, update_values = [], []
-        
-        if data.title is not None:
-            update_fields.append('title = ?')
-            update_values.append(data.title.strip())
-        if data.author is not None:
-            update_fields.append('author = ?')
-            update_values.append(data.author.strip())
-        if data.pages is not None:
-            update_fields.append('pages = ?')
-            update_values.append(int(data.pages))
-        if data.price is not None:
-            update_fields.append('price = ?')
-            update_values.append(round(float(data.price), 2))
-        if data.category is not None:
-            update_fields.append('category = ?')
-            update_values.append(data.category.strip())
-        if data.quantity is not None:
-            new_quantity = int(data.quantity)
-            diff = new_quantity - book['quantity']
-            update_fields.append('quantity = ?')
-            update_values.append(new_quantity)
-            update_fields.append('available = ?')
-            update_values.append(max(0, book['available'] + diff))
-        
-        if update_fields:
-            update_values.append(book_id)
-            query = f"UPDATE books SET {', '.join(update_fields)} WHERE id = ?"
-            conn.execute(query, update_values)
-            conn.commit()
-        
-        updated_book = conn.execute('SELECT * FROM books WHERE id = ?', (book_id,)).fetchone()
-        conn.close()
-        
+        def update_book(repos):
+            book = repos.books.get(book_id)
+            if not book:
+                raise HTTPException(status_code=404, detail="Book not found")
+
+            changes = {}
+
+            if data.title is not None:
+                changes['title'] = data.title.strip()
+            if data.author is not None:
+                changes['author'] = data.author.strip()
+            if data.pages is not None:
+                changes['pages'] = int(data.pages)
+            if data.price is not None:
+                changes['price'] = round(float(data.price), 2)
+            if data.category is not None:
+                changes['category'] = data.category.strip()
+            if data.quantity is not None:
+                new_quantity = int(data.quantity)
+                diff = new_quantity - book['quantity']
+                changes['quantity'] = new_quantity
+                changes['available'] = max(0, book['available'] + diff)
+
+            return repos.books.update(book_id, changes)
+
+        updated_book = await queue_catalog_write(update_book)
+
         return {'success': True, 'book': row_to_dict(updated_book)}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update book: {str(e)}")
 
@@ -481,62 +675,54 @@ async def admin_update_book(book_id: int = Path(...), data: UpdateBookRequest =
 async def admin_delete_book(book_id: int = Path(...), claims = Depends(verify_admin)):
     """Delete book (admin only)"""
     try:
-        conn = get_db_connection()
-        
-        book = conn.execute('SELECT * FROM books WHERE id = ?', (book_id,)).fetchone()
-        if not book:
-            conn.close()
-            raise HTTPException(status_code=404, detail="Book not found")
-        
-        borrowed = conn.execute(
-            'SELECT id FROM transactions WHERE book_id = ? AND status = ?',
-            (book_id, 'borrowed')
-        ).fetchone()
-        
-        if borrowed:
-            conn.close()
-            raise HTTPException(status_code=400, detail="Cannot delete book that is currently borrowed")
-        
-        conn.execute('DELETE FROM books WHERE id = ?', (book_id,))
-        conn.commit()
-        conn.close()
-        
+        def delete_book(repos):
+            if not repos.books.get(book_id):
+                raise HTTPException(status_code=404, detail="Book not found")
+
+            if repos.transactions.has_open_loans(book_id=book_id):
+                raise HTTPException(status_code=400, detail="Cannot delete book that is currently borrowed")
+
+            repos.books.delete(book_id)
+
+        await queue_catalog_write(delete_book)
+
         return {'success': True, 'message': 'Book deleted successfully'}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete book: {str(e)}")
 
 
 @app.get("/api/admin/books/search")
-async def admin_search_books(query: str = Query(...), claims = Depends(verify_admin)):
-    """Search books by title, author, or ISBN"""
+async def admin_search_books(
+    query: str = Query(...),
+    limit: int = Query(DEFAULT_SEARCH_LIMIT, ge=1, le=MAX_PAGE_SIZE),
+    claims = Depends(verify_admin)
+):
+    """Search books by title, author, or ISBN, best matches first"""
     try:
-        conn = get_db_connection()
-        search_term = f"%{query}%"
-        
-        books = conn.execute(
-            '''SELECT * FROM books WHERE title LIKE ? OR author LIKE ? OR isbn LIKE ?
-               ORDER BY created_at DESC''',
-            (search_term, search_term, search_term)
-        ).fetchall()
-        
-        conn.close()
+        books = await storage.read(search_books, query, limit)
         return rows_to_dict_list(books)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
 
 @app.get("/api/admin/students")
-async def admin_get_students(claims = Depends(verify_admin)):
-    """Get all students (admin only)"""
+async def admin_get_students(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    claims = Depends(verify_admin)
+):
+    """Get all students (admin only); pass limit/cursor for keyset pagination"""
     try:
-        conn = get_db_connection()
-        students = conn.execute('SELECT * FROM students ORDER BY created_at DESC').fetchall()
-        conn.close()
-        
-        students_list = rows_to_dict_list(students)
-        for student in students_list:
-            student.pop('password', None)
-        
-        return students_list
+        if limit is None and cursor is None:
+            students = await storage.read(list_students)
+            return rows_to_dict_list(students)
+
+        limit = limit or DEFAULT_PAGE_SIZE
+        students, next_cursor = await storage.read(list_students_page, limit, cursor)
+        return paginated(rows_to_dict_list(students), next_cursor, limit)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch students: {str(e)}")
 
@@ -545,73 +731,97 @@ async def admin_get_students(claims = Depends(verify_admin)):
 async def admin_add_student(data: AddStudentRequest, claims = Depends(verify_admin)):
     """Add new student (admin only)"""
     try:
-        conn = get_db_connection()
-        
-        existing = conn.execute('SELECT id FROM students WHERE username = ?', (data.username,)).fetchone()
-        if existing:
-            conn.close()
-            raise HTTPException(status_code=400, detail="Username already exists")
-        
-        reg_no = generate_registration_number()
-        hashed_pw = hash_password(data.password)
-        
-        cursor = conn.execute(
-            '''INSERT INTO students (registration_no, username, password, name, email, phone, role)
-               VALUES (?, ?, ?, ?, ?, ?, ?)''',
-            (reg_no, data.username, hashed_pw, data.name, data.email, data.phone, 'student')
-        )
-        conn.commit()
-        
-        new_student = conn.execute('SELECT * FROM students WHERE id = ?', (cursor.lastrowid,)).fetchone()
-        conn.close()
-        
+        hashed_pw = await hash_password(data.password)
+
+        def insert_student(repos):
+            if repos.students.get_by_username(data.username):
+                raise HTTPException(status_code=400, detail="Username already exists")
+            return repos.students.add(data.username, hashed_pw, data.name, data.email, data.phone)
+
+        new_student = await queue_write(insert_student)
+
         student_dict = row_to_dict(new_student)
         student_dict.pop('password', None)
-        
+
         return {'success': True, 'student': student_dict}
+    except DuplicateKey:
+        raise HTTPException(status_code=400, detail="Username already exists")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to add student: {str(e)}")
 
 
+@app.post("/api/admin/students/enroll")
+async def admin_enroll_students(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, pattern=f"^({'|'.join(IMPORT_FORMATS)})$"),
+    claims = Depends(verify_admin)
+):
+    """Bulk-enroll students from a CSV or JSONL roster (admin only).
+
+    Streams one NDJSON result per roster line as each batch is committed,
+    with the registration number and any generated password, then a summary.
+    """
+    try:
+        fmt = detect_format(file.filename, format)
+        results = enroll_students(iter_roster(file.file, fmt), storage, password_hasher)
+        # The first batch runs before the response starts, so an unreadable
+        # roster is still reported as a 400.
+        first = await results.__anext__()
+    except ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (WriterBusy, WriteBusy, WriteTimeout):
+        raise server_busy()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to enroll students: {str(e)}")
+
+    async def stream():
+        yield json.dumps(first) + '\n'
+        try:
+            async for result in results:
+                yield json.dumps(result) + '\n'
+        except Exception as e:
+            yield json.dumps({'error': f"Enrollment stopped: {str(e)}"}) + '\n'
+
+    return StreamingResponse(stream(), media_type='application/x-ndjson')
+
+
 @app.put("/api/admin/students/{student_id}")
 async def admin_update_student(student_id: int = Path(...), data: UpdateStudentRequest = Body(...), claims = Depends(verify_admin)):
     """Update student (admin only)"""
     try:
-        conn = get_db_connection()
-        
-        student = conn.execute('SELECT * FROM students WHERE id = ?', (student_id,)).fetchone()
-        if not student:
-            conn.close()
-            raise HTTPException(status_code=404, detail="Student not found")
-        
-        update_fields, update_values = [], []
-        
-        if data.name is not None:
-            update_fields.append('name = ?')
-            update_values.append(data.name)
-        if data.email is not None:
-            update_fields.append('email = ?')
-            update_values.append(data.email)
-        if data.phone is not None:
-            update_fields.append('phone = ?')
-            update_values.append(data.phone)
+        hashed_pw = None
         if data.password is not None and data.password != "":
-            update_fields.append('password = ?')
-            update_values.append(hash_password(data.password))
-        
-        if update_fields:
-            update_values.append(student_id)
-            query = f"UPDATE students SET {', '.join(update_fields)} WHERE id = ?"
-            conn.execute(query, update_values)
-            conn.commit()
-        
-        updated_student = conn.execute('SELECT * FROM students WHERE id = ?', (student_id,)).fetchone()
-        conn.close()
-        
+            hashed_pw = await hash_password(data.password)
+
+        def update_student(repos):
+            if not repos.students.get(student_id):
+                raise HTTPException(status_code=404, detail="Student not found")
+
+            changes = {}
+
+            if data.name is not None:
+                changes['name'] = data.name
+            if data.email is not None:
+                changes['email'] = data.email
+            if data.phone is not None:
+                changes['phone'] = data.phone
+            if hashed_pw is not None:
+                changes['password'] = hashed_pw
+
+            return repos.students.update(student_id, changes)
+
+        updated_student = await queue_write(update_student)
+
         student_dict = row_to_dict(updated_student)
         student_dict.pop('password', None)
-        
+
         return {'success': True, 'student': student_dict}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update student: {str(e)}")
 
@@ -620,134 +830,125 @@ async def admin_update_student(student_id: int = Path(...), data: UpdateStudentR
 async def admin_delete_student(student_id: int = Path(...), claims = Depends(verify_admin)):
     """Delete student (admin only)"""
     try:
-        conn = get_db_connection()
-        
-        student = conn.execute('SELECT * FROM students WHERE id = ?', (student_id,)).fetchone()
-        if not student:
-            conn.close()
-            raise HTTPException(status_code=404, detail="Student not found")
-        
-        borrowed = conn.execute(
-            'SELECT id FROM transactions WHERE student_id = ? AND status = ?',
-            (student_id, 'borrowed')
-        ).fetchone()
-        
-        if borrowed:
-            conn.close()
-            raise HTTPException(status_code=400, detail="Cannot delete student with borrowed books")
-        
-        conn.execute('DELETE FROM students WHERE id = ?', (student_id,))
-        conn.commit()
-        conn.close()
-        
+        def delete_student(repos):
+            if not repos.students.get(student_id):
+                raise HTTPException(status_code=404, detail="Student not found")
+
+            if repos.transactions.has_open_loans(student_id=student_id):
+                raise HTTPException(status_code=400, detail="Cannot delete student with borrowed books")
+
+            repos.students.delete(student_id)
+
+        await queue_write(delete_student)
+
         return {'success': True, 'message': 'Student deleted successfully'}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete student: {str(e)}")
 
 
 @app.get("/api/admin/students/search")
-async def admin_search_students(query: str = Query(...), claims = Depends(verify_admin)):
+async def admin_search_students(
+    query: str = Query(...),
+    limit: int = Query(DEFAULT_SEARCH_LIMIT, ge=1, le=MAX_PAGE_SIZE),
+    claims = Depends(verify_admin)
+):
     """Search students by name, email, username, or registration number"""
     try:
-        conn = get_db_connection()
-        search_term = f"%{query}%"
-        
-        students = conn.execute(
-            '''SELECT * FROM students WHERE name LIKE ? OR email LIKE ? OR username LIKE ? OR registration_no LIKE ?
-               ORDER BY created_at DESC''',
-            (search_term, search_term, search_term, search_term)
-        ).fetchall()
-        
-        conn.close()
-        
-        students_list = rows_to_dict_list(students)
-        for student in students_list:
-            student.pop('password', None)
-        
-        return students_list
+        students = await storage.read(search_students, query, limit)
+        return rows_to_dict_list(students)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
 
 
 @app.get("/api/admin/transactions")
-async def admin_get_transactions(claims = Depends(verify_admin)):
-    """Get all transactions (admin only)"""
+async def admin_get_transactions(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    claims = Depends(verify_admin)
+):
+    """Get all transactions (admin only); pass limit/cursor for keyset pagination"""
     try:
-        conn = get_db_connection()
-        transactions = conn.execute(
-            '''SELECT t.*, s.name as student_name, s.registration_no, b.title as book_title
-               FROM transactions t
-               JOIN students s ON t.student_id = s.id
-               JOIN books b ON t.book_id = b.id
-               ORDER BY t.created_at DESC'''
-        ).fetchall()
-        conn.close()
-        return rows_to_dict_list(transactions)
+        if limit is None and cursor is None:
+            transactions = await storage.read(list_transactions)
+            return rows_to_dict_list(transactions)
+
+        limit = limit or DEFAULT_PAGE_SIZE
+        transactions, next_cursor = await storage.read(list_transactions_page, limit, cursor)
+        return paginated(rows_to_dict_list(transactions), next_cursor, limit)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch transactions: {str(e)}")
 
 
+@app.get("/api/admin/transactions/export")
+async def admin_export_transactions(
+    format: str = Query('csv', pattern=f"^({'|'.join(EXPORT_FORMATS)})$"),
+    date_from: Optional[date] = Query(None, alias='from'),
+    date_to: Optional[date] = Query(None, alias='to'),
+    gzip: bool = Query(False),
+    claims = Depends(verify_admin)
+):
+    """Stream the transaction ledger as CSV or NDJSON (admin only)"""
+    if date_from and date_to and date_from > date_to:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+
+    filename = f"transactions.{format}" + ('.gz' if gzip else '')
+    chunks = storage.stream(export_transactions, format, date_from, date_to, compress=gzip)
+    # Runs after the last chunk or after the client disconnects, and closes
+    # the stream's read connection if it was abandoned partway.
+    return StreamingResponse(
+        chunks,
+        media_type='application/gzip' if gzip else EXPORT_MEDIA_TYPES[format],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+        background=BackgroundTask(chunks.close)
+    )
+
+
 @app.get("/api/admin/overdue")
 async def admin_get_overdue(claims = Depends(verify_admin)):
     """Get overdue books (admin only)"""
     try:
-        conn = get_db_connection()
-        overdue = conn.execute(
-            '''SELECT t.*, s.name as student_name, s.registration_no, b.title as book_title,
-                      strftime('%s', 'now') - strftime('%s', t.due_date) as days_overdue
-               FROM transactions t
-               JOIN students s ON t.student_id = s.id
-               JOIN books b ON t.book_id = b.id
-               WHERE t.status = 'borrowed' AND t.due_date < datetime('now')
-               ORDER BY t.due_date ASC'''
-        ).fetchall()
-        conn.close()
+        overdue = await storage.read(list_overdue, int(time.time()))
         return rows_to_dict_list(overdue)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch overdue books: {str(e)}")
 
 
+@app.post("/api/admin/return/batch")
+async def admin_return_books(data: BatchReturnRequest, claims = Depends(verify_admin)):
+    """Process several returns in one transaction (admin only); one result per loan"""
+    try:
+        if not data.transaction_ids:
+            raise HTTPException(status_code=400, detail="No transactions given")
+
+        return batch_response(await queue_catalog_write(return_books, data.transaction_ids), 'returned')
+    except CirculationError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to return books: {str(e)}")
+
+
 @app.post("/api/admin/return/{transaction_id}")
 async def admin_return_book(transaction_id: int = Path(...), claims = Depends(verify_admin)):
     """Process book return (admin only)"""
     try:
-        conn = get_db_connection()
-        
-        transaction = conn.execute('SELECT * FROM transactions WHERE id = ?', (transaction_id,)).fetchone()
-        if not transaction:
-            conn.close()
-            raise HTTPException(status_code=404, detail="Transaction not found")
-        
-        if transaction['status'] != 'borrowed':
-            conn.close()
-            raise HTTPException(status_code=400, detail="Book not currently borrowed")
-        
-        fine_amount = calculate_fine(transaction['due_date'])
-        
-        conn.execute(
-            '''UPDATE transactions SET status = ?, return_date = ?, fine_amount = ?
-               WHERE id = ?''',
-            ('returned', datetime.now().isoformat(), fine_amount, transaction_id)
-        )
-        
-        conn.execute(
-            'UPDATE books SET available = available + 1 WHERE id = ?',
-            (transaction['book_id'],)
-        )
-        
-        conn.execute(
-            'UPDATE students SET borrowed_books = borrowed_books - 1, fine_amount = fine_amount + ? WHERE id = ?',
-            (fine_amount, transaction['student_id'])
-        )
-        
-        conn.commit()
-        conn.close()
-        
+        book = await storage.read(check_return, transaction_id)
+        loan = await queue_circulation(book, return_book, transaction_id)
+
         return {
             'success': True,
             'message': 'Book returned successfully',
-            'fine_amount': fine_amount
+            'fine_amount': loan['fine_amount']
         }
+    except CirculationError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to return book: {str(e)}")
 
@@ -756,78 +957,49 @@ async def admin_return_book(transaction_id: int = Path(...), claims = Depends(ve
 async def admin_get_stats(claims = Depends(verify_admin)):
     """Get admin dashboard statistics"""
     try:
-        conn = get_db_connection()
-        
-        total_books = conn.execute('SELECT COUNT(*) as count FROM books').fetchone()['count']
-        total_students = conn.execute('SELECT COUNT(*) as count FROM students').fetchone()['count']
-        active_borrows = conn.execute(
-            'SELECT COUNT(*) as count FROM transactions WHERE status = ?', ('borrowed',)
-        ).fetchone()['count']
-        overdue_books = conn.execute(
-            '''SELECT COUNT(*) as count FROM transactions
-               WHERE status = ? AND due_date < datetime('now')''', ('borrowed',)
-        ).fetchone()['count']
-        total_transactions = conn.execute(
-            'SELECT COUNT(*) as count FROM transactions'
-        ).fetchone()['count']
-        total_fines = conn.execute(
-            'SELECT SUM(fine_amount) as total FROM transactions WHERE fine_amount > 0'
-        ).fetchone()['total']
-        conn.close()
-        
-        return {
-            'total_books': total_books,
-            'total_students': total_students,
-            'active_borrows': active_borrows,
-            'overdue_books': overdue_books,
-            'total_transactions': total_transactions,
-            'total_fines': total_fines if total_fines is not None else 0
-        }
+        def collect_stats(repos):
+            stats = repos.stats(int(time.time()))
+
+            return {
+                'total_books': stats['total_books'],
+                'total_students': stats['total_students'],
+                'active_borrows': stats['active_borrows'],
+                'overdue_books': stats['overdue_books'],
+                'total_transactions': stats['total_transactions'],
+                'total_fines': stats['total_fines'],
+                'accrued_fines': stats['accrued_fines'],
+                'fines_accrued_at': stats['fines_accrued_at']
+            }
+
+        return await storage.read(collect_stats)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch stats: {str(e)}")
 
 
 @app.get("/api/student/books")
-async def student_get_available_books(claims = Depends(verify_student)):
-    """Get available books for borrowing"""
+async def student_get_available_books(request: Request, claims = Depends(verify_student)):
+    """Get available books for borrowing; answers If-None-Match from the catalog cache"""
     try:
-        conn = get_db_connection()
-        books = conn.execute('SELECT * FROM books ORDER BY title ASC').fetchall()
-        conn.close()
-        return rows_to_dict_list(books)
+        etag = catalog_cache.etag
+        if etag_matches(request.headers.get('if-none-match'), etag):
+            catalog_cache.record_not_modified()
+            return Response(status_code=304, headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+
+        snapshot = catalog_cache.current() or await storage.read(catalog_cache.build)
+        return Response(
+            content=snapshot.body,
+            media_type='application/json',
+            headers={'ETag': snapshot.etag, 'Cache-Control': 'no-cache'}
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch books: {str(e)}")
 
-def get_next_transaction_id():
-    """Generate next transaction ID in form TXN0001 based on highest id."""
-    conn = get_db_connection()
-    try:
-        last_id_row = conn.execute('SELECT MAX(id) as max_id FROM transactions').fetchone()
-        max_id = last_id_row['max_id'] if last_id_row else None
-        if not max_id:
-            next_num = 1
-        else:
-            next_num = int(max_id) + 1
-        return f'TXN{str(next_num).zfill(4)}'
-    finally:
-        conn.close()
-
-
 @app.get("/api/student/my-books")
 async def student_get_my_books(claims = Depends(verify_student)):
     """Get student's borrowed books"""
     try:
         student_id = claims.get('id')
-        conn = get_db_connection()
-        transactions = conn.execute(
-            '''SELECT t.*, b.title as book_title, b.author as book_author, b.isbn
-               FROM transactions t
-               JOIN books b ON t.book_id = b.id
-               WHERE t.student_id = ? AND t.status = 'borrowed'
-               ORDER BY t.borrow_date DESC''',
-            (student_id,)
-        ).fetchall()
-        conn.close()
+        transactions = await storage.read(list_open_loans, student_id)
         return [
             {
                 "id": row["id"],
@@ -853,12 +1025,16 @@ async def student_borrow_book(data: BorrowBookRequest = Body(...), claims = Depe
     
     Changes:
     - Validates all inputs before DB operations
-    - Retries on transient database locks
+    - Refuses a borrow that cannot succeed from a read-only snapshot first, so
+      attempts on a title with no copy left never wait for the write lock
+    - Takes the write lock itself for a title down to its last few copies,
+      rather than waiting for a group commit on the writer
+    - Applies the borrow as conditional UPDATEs with RETURNING (see circulation.py),
+      so the write lock is held for a few statements
+    - Retries a busy write lock with jittered backoff before answering 503
     - Checks for duplicate borrow attempts
-    - Logs detailed error messages
-    - Better transaction rollback handling
+    - Logs failures as structured records with the request ID
     """
-    conn = None
     try:
        
         student_id = claims.get('id')
@@ -873,175 +1049,28 @@ async def student_borrow_book(data: BorrowBookRequest = Body(...), claims = Depe
                 status_code=400,
                 detail="Invalid book ID: must be a positive integer"
             )
-        
-     
-        max_retries = 3
-        retry_count = 0
-        last_error = None
-        
-        while retry_count < max_retries:
-            try:
-                conn = get_db_connection()
-                break
-            except Exception as db_error:
-                last_error = db_error
-                retry_count += 1
-                if retry_count < max_retries:
-                    await asyncio.sleep(0.1)  # Small backoff
-        
-        if not conn:
-            raise HTTPException(
-                status_code=503,
-                detail="Database temporarily unavailable. Please try again in a moment."
-            )
-        
-        try:
-            conn.execute("BEGIN IMMEDIATE;")
-        except Exception as lock_error:
-            raise HTTPException(
-                status_code=503,
-                detail=f"Database is busy. Please try again. Error: {str(lock_error)}"
-            )
-        
+
         try:
-        
-            student_row = conn.execute(
-                'SELECT * FROM students WHERE id = ?', 
-                (student_id,)
-            ).fetchone()
-            
-            if not student_row:
-                conn.rollback()
-                raise HTTPException(status_code=404, detail="Student not found in database")
-            
-            student = dict(student_row)
-            borrowed_count = int(student.get('borrowed_books', 0))
-            student_name = student.get('name', 'Unknown')
-            
-       
-            if borrowed_count >= MAX_BOOKS_PER_STUDENT:
-                conn.rollback()
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"Borrow limit reached. You have {borrowed_count}/{MAX_BOOKS_PER_STUDENT} books. Please return a book first."
-                )
-            
-     
-            book_row = conn.execute(
-                'SELECT * FROM books WHERE id = ?', 
-                (data.book_id,)
-            ).fetchone()
-            
-            if not book_row:
-                conn.rollback()
-                raise HTTPException(status_code=404, detail=f"Book with ID {data.book_id} not found")
-            
-            book = dict(book_row)
-            available = int(book.get('available', 0))
-            book_title = book.get('title', 'Unknown')
-            
-            if available <= 0:
-                conn.rollback()
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"'{book_title}' is not available. Total copies: {book.get('quantity', 0)}, Available: {available}"
-                )
-       
-            existing_borrow = conn.execute(
-                'SELECT id FROM transactions WHERE student_id = ? AND book_id = ? AND status = ?',
-                (student_id, data.book_id, 'borrowed')
-            ).fetchone()
-            
-            if existing_borrow:
-                conn.rollback()
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"You have already borrowed '{book_title}'. Please return it before borrowing another copy."
-                )
-            
-          
-            borrow_date = datetime.now()
-            due_date = borrow_date + timedelta(days=RETURN_DAYS)
-            
-            cur = conn.cursor()
-            next_txn_id = get_next_transaction_id()
-          
-            cur.execute('''
-                INSERT INTO transactions
-                (transaction_id, student_id, student_registration_no, book_id, borrow_date, due_date, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                next_txn_id, student_id, student.get('registration_no', ''), data.book_id, borrow_date.isoformat(), due_date.isoformat(), 'borrowed'
-            ))
-
-            
-            trans_id = cur.lastrowid
-            
-            txn_row = conn.execute(
-                'SELECT transaction_id FROM transactions WHERE id = ?', 
-                (trans_id,)
-            ).fetchone()
-            
-            transaction_code = (
-                txn_row['transaction_id'] 
-                if txn_row and txn_row['transaction_id'] 
-                else f"TXN{str(trans_id).zfill(4)}"
-            )
-            
-   
-            conn.execute(
-                'UPDATE books SET available = available - 1 WHERE id = ?', 
-                (data.book_id,)
-            )
-            
-           
-            conn.execute(
-                'UPDATE students SET borrowed_books = borrowed_books + 1 WHERE id = ?', 
-                (student_id,)
-            )
-            
-         
-            conn.commit()
-         
-            return {
-                'success': True,
-                'message': f'Book "{book_title}" borrowed successfully',
-                'transaction_id': transaction_code,
-                'due_date': due_date.isoformat(),
-                'days_to_return': RETURN_DAYS,
-                'book': {
-                    'id': book.get('id'),
-                    'title': book_title,
-                    'author': book.get('author')
-                },
-                'student': {
-                    'id': student_id,
-                    'name': student_name,
-                    'borrowed_count': borrowed_count + 1,
-                    'max_borrow': MAX_BOOKS_PER_STUDENT
-                }
-            }
-        
+            book = await storage.read(check_borrow, student_id, data.book_id)
+            loan = await queue_circulation(book, borrow_book, student_id, data.book_id)
+        except CirculationError as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
         except HTTPException:
-
-            if conn:
-                try:
-                    conn.rollback()
-                except Exception as rb_error:
-                    print(f"WARNING: Rollback failed: {rb_error}", flush=True)
             raise
-        
         except Exception as inner_error:
-          
-            if conn:
-                try:
-                    conn.rollback()
-                except Exception as rb_error:
-                    print(f"WARNING: Rollback failed after inner error: {rb_error}", flush=True)
-            
             error_msg = f"Transaction processing failed: {str(inner_error)}"
-            print(f"ERROR in student_borrow_book (inner): {error_msg}", flush=True)
+            circulation_logger.exception('borrow failed', extra={'fields': {'student_id': student_id, 'book_id': data.book_id}})
             raise HTTPException(status_code=500, detail=error_msg)
+
+        return {
+            'success': True,
+            'message': f'Book "{loan["book"]["title"]}" borrowed successfully',
+            'transaction_id': loan['transaction_id'],
+            'due_date': loan['due_date'],
+            'days_to_return': RETURN_DAYS,
+            'book': loan['book'],
+            'student': {**loan['student'], 'max_borrow': MAX_BOOKS_PER_STUDENT}
+        }
     
     except HTTPException:
         raise
@@ -1049,16 +1078,33 @@ async def student_borrow_book(data: BorrowBookRequest = Body(...), claims = Depe
     except Exception as error:
     
         error_msg = f"Borrow operation failed: {str(error)}"
-        print(f"ERROR in student_borrow_book (outer): {error_msg}", flush=True)
+        circulation_logger.exception('borrow failed', extra={'fields': {'book_id': data.book_id}})
         raise HTTPException(status_code=500, detail=error_msg)
-    
-    finally:
-      
-        if conn:
-            try:
-                conn.close()
-            except Exception as close_error:
-                print(f"WARNING: Error closing database connection: {close_error}", flush=True)
+
+
+@app.post("/api/student/borrow/batch")
+async def student_borrow_books(data: BatchBorrowRequest, claims = Depends(verify_student)):
+    """Borrow several books in one transaction; one result per requested book"""
+    try:
+        student_id = claims.get('id')
+        if not student_id or not isinstance(student_id, int):
+            raise HTTPException(
+                status_code=401,
+                detail="Invalid student credentials: missing or malformed id in token"
+            )
+        if not data.book_ids:
+            raise HTTPException(status_code=400, detail="No books given")
+        if any(book_id <= 0 for book_id in data.book_ids):
+            raise HTTPException(status_code=400, detail="Invalid book ID: must be a positive integer")
+
+        return batch_response(await queue_catalog_write(borrow_books, student_id, data.book_ids), 'borrowed')
+    except CirculationError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except HTTPException:
+        raise
+    except Exception as e:
+        circulation_logger.exception('batch borrow failed', extra={'fields': {'book_ids': data.book_ids}})
+        raise HTTPException(status_code=500, detail=f"Borrow operation failed: {str(e)}")
 
 
 @app.post("/api/student/return")
@@ -1066,53 +1112,50 @@ async def student_return_book(data: ReturnBookRequest, claims = Depends(verify_s
     """Return a borrowed book"""
     try:
         student_id = claims.get('id')
-        conn = get_db_connection()
-        
-        transaction = conn.execute('SELECT * FROM transactions WHERE id = ?', (data.transaction_id,)).fetchone()
-        if not transaction or transaction['student_id'] != student_id:
-            conn.close()
-            raise HTTPException(status_code=404, detail="Transaction not found")
-        
-        if transaction['status'] != 'borrowed':
-            conn.close()
-            raise HTTPException(status_code=400, detail="Book not currently borrowed")
-        
-        fine_amount = calculate_fine(transaction['due_date'])
-        
-        conn.execute(
-            '''UPDATE transactions SET status = ?, return_date = ?, fine_amount = ?
-               WHERE id = ?''',
-            ('returned', datetime.now().isoformat(), fine_amount, data.transaction_id)
-        )
-        
-        conn.execute('UPDATE books SET available = available + 1 WHERE id = ?', (transaction['book_id'],))
-        conn.execute('UPDATE students SET borrowed_books = borrowed_books - 1, fine_amount = fine_amount + ? WHERE id = ?',
-                     (fine_amount, student_id))
-        
-        conn.commit()
-        conn.close()
-        
+
+        book = await storage.read(check_return, data.transaction_id, student_id)
+        loan = await queue_circulation(book, return_book, data.transaction_id, student_id)
+
         return {
             'success': True,
             'message': 'Book returned successfully',
-            'fine_amount': fine_amount
+            'fine_amount': loan['fine_amount']
         }
+    except CirculationError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to return book: {str(e)}")
 
 
+@app.post("/api/student/return/batch")
+async def student_return_books(data: BatchReturnRequest, claims = Depends(verify_student)):
+    """Return several borrowed books in one transaction; one result per loan"""
+    try:
+        student_id = claims.get('id')
+        if not data.transaction_ids:
+            raise HTTPException(status_code=400, detail="No transactions given")
+
+        return batch_response(await queue_catalog_write(return_books, data.transaction_ids, student_id), 'returned')
+    except CirculationError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to return books: {str(e)}")
+
+
 @app.get("/api/student/fines")
 async def student_get_fines(claims = Depends(verify_student)):
     """Get student's fine information"""
     try:
         student_id = claims.get('id')
-        conn = get_db_connection()
-        
-        student = conn.execute('SELECT fine_amount, borrowed_books FROM students WHERE id = ?', (student_id,)).fetchone()
-        conn.close()
-        
+        student = await storage.read(get_student, student_id)
+
         return {
             'fine_amount': student['fine_amount'],
+            'accrued_fine': student['accrued_fine'],
             'borrowed_books': student['borrowed_books']
         }
     except Exception as e:
@@ -1124,18 +1167,8 @@ async def student_get_transaction_history(claims = Depends(verify_student)):
     """Get student's complete transaction history"""
     try:
         student_id = claims.get('id')
-        conn = get_db_connection()
-        
-        transactions = conn.execute(
-            '''SELECT t.*, b.title, b.author
-               FROM transactions t
-               JOIN books b ON t.book_id = b.id
-               WHERE t.student_id = ?
-               ORDER BY t.created_at DESC''',
-            (student_id,)
-        ).fetchall()
-        
-        conn.close()
+        transactions = await storage.read(list_history, student_id)
+
         return rows_to_dict_list(transactions)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch history: {str(e)}")
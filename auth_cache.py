@@ -0,0 +1,64 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', '10000'))
+
+
+class TokenCache:
+    """Bounded LRU of bearer tokens that already passed verification.
+
+    Maps the raw token to its merged claims so a repeat request skips the
+    HMAC check and the JSON parsing. An entry is dropped once the token's
+    ``exp`` has passed, so a cached token is never honoured for longer than
+    ``jwt.decode`` would have honoured it. Tokens without ``exp`` are not
+    cached. Callers get their own copy of the claims.
+    """
+
+    def __init__(self, maxsize=AUTH_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0}
+
+    def get(self, token, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            exp, claims = entry
+            if now >= exp:
+                del self._entries[token]
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(token)
+            self._stats['hits'] += 1
+            return dict(claims)
+
+    def put(self, token, claims):
+        exp = claims.get('exp')
+        if not isinstance(exp, (int, float)) or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[token] = (exp, dict(claims))
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({'size': len(self._entries), 'maxsize': self.maxsize})
+        return stats
+
+
+token_cache = TokenCache()
@@ -0,0 +1,80 @@
+"""Microbenchmark of the auth dependency chain.
+
+Calls extract_claims followed by verify_student or verify_admin directly,
+the way FastAPI resolves them for every authenticated request, with a
+small set of live tokens. One pass clears the verified-token cache before
+every call (a full jwt.decode each time); the other keeps it warm. Output
+from the dependencies themselves is discarded.
+
+    python -m benchmarks.auth --iterations 50000
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import time
+
+from benchmarks import common
+
+import app as app_module
+from auth_cache import token_cache
+
+
+def make_tokens(count):
+    tokens = []
+    for i in range(count):
+        role = 'admin' if i % 5 == 0 else 'student'
+        claims = {'role': role, 'id': i + 1, 'name': f'Bench User {i}'}
+        tokens.append((role, app_module.create_access_token(f'user{i}', claims)))
+    return tokens
+
+
+async def chain(role, token):
+    claims = await app_module.extract_claims(token)
+    if role == 'admin':
+        return await app_module.verify_admin(claims, None)
+    return await app_module.verify_student(claims, None)
+
+
+async def run(tokens, iterations, cached):
+    samples = []
+    token_cache.clear()
+    with contextlib.redirect_stdout(io.StringIO()) as sink:
+        for i in range(iterations):
+            role, token = tokens[i % len(tokens)]
+            if not cached:
+                token_cache.clear()
+            start = time.perf_counter()
+            await chain(role, token)
+            samples.append(time.perf_counter() - start)
+            if i % 1000 == 0:
+                sink.seek(0)
+                sink.truncate()
+    summary = common.summarize(samples)
+    summary['per_call_us'] = round(sum(samples) / len(samples) * 1e6, 2)
+    return summary
+
+
+async def main_async(args):
+    tokens = make_tokens(args.tokens)
+    before = token_cache.stats()
+    report = {
+        'uncached': await run(tokens, args.iterations, cached=False),
+        'cached': await run(tokens, args.iterations, cached=True),
+    }
+    after = token_cache.stats()
+    report['cache'] = {key: after[key] - before[key] for key in ('hits', 'misses')}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=50_000)
+    parser.add_argument('--tokens', type=int, default=100)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Measure /api/admin/books/search query latency on a large synthetic catalog.
+
+Seeds --books rows (1M by default) straight into a scratch database, builds
+the full-text index and times search_books() for typical search-as-you-type
+queries, exact ISBN lookups and multi-word queries. Queries are drawn from a
+Zipf-like vocabulary, so popular ones repeat and hit the search cache;
+--cache-size 0 measures every query cold.
+
+    python -m benchmarks.book_search --books 1000000
+
+The target of under 10ms at 1M books is met for ISBNs, short prefixes and
+3-5 character prefixes, but not for common words, surnames or two-word
+queries. Those match tens of thousands of books, so they skip bm25 (see
+search.RANK_CANDIDATES), but reading their posting lists still costs up to
+three passes. Measured on one core (p50 / p95 / p99 in ms, cold):
+
+                  300k books           1M books
+    prefix        1.4 /  5.4 /  6.9    1.8 /  6.4 / 10.3
+    short_prefix  0.7 /  0.8 /  0.9    0.6 /  1.0 /  2.1
+    word          3.2 /  8.3 /  9.1    5.9 / 22.1 / 25.2
+    two_words     8.7 / 18.1 / 21.3   15.6 / 35.6 / 47.9
+    author        5.5 /  6.2 / 12.3   12.2 / 20.2 / 22.3
+    isbn          0.02 / 0.02 / 0.04  0.01 / 0.02 / 0.02
+
+With the search cache, p50 drops under 0.3ms for word and author queries,
+but p95 at 1M stays at 8.5ms (word) and 11ms (author), and two_words is
+unchanged.
+"""
+import argparse
+import json
+import random
+import time
+
+from benchmarks import common
+
+import database
+from search import create_books_search_index, search_books, search_cache
+
+SYLLABLES = ('ka ri mo ta len dor vel sha ni quo bar tes mi lan gor fe ul pra '
+             'zen ho vik ara sel tum do ine'.split())
+SURNAMES = ('Smith Rao Tanaka Garcia Okafor Novak Larsen Haddad Kim Moreau Silva '
+            'Kowalski Mehta Nguyen Fischer Costa Ivanova Brown Sato Dubois').split()
+
+
+def make_vocabulary(rng, size=50000):
+    return [''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(size)]
+
+
+def pick_word(rng, words):
+    # Zipf-like: the most common word is in roughly 5% of titles, then a long tail.
+    return words[min(len(words) - 1, int((rng.paretovariate(1.0) - 1) * 20))]
+
+
+def seed(conn, count, rng, words):
+    batch = []
+    for i in range(count):
+        title = ' '.join(pick_word(rng, words) for _ in range(rng.randint(2, 5))).title()
+        author = f'{rng.choice(SURNAMES)} {rng.choice(SURNAMES)}'
+        isbn = f'978{i:010d}'
+        batch.append((title, author, isbn, 300, 10.0, 'General', 1, 1))
+        if len(batch) == 10000:
+            conn.executemany('INSERT INTO books (title, author, isbn, pages, price, category, quantity, available) '
+                             'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', batch)
+            batch = []
+    if batch:
+        conn.executemany('INSERT INTO books (title, author, isbn, pages, price, category, quantity, available) '
+                         'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', batch)
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--cache-size', type=int, default=search_cache.maxsize,
+                        help='ranked queries kept by the search cache (0 disables it)')
+    args = parser.parse_args()
+    search_cache.maxsize = args.cache_size
+
+    rng = random.Random(42)
+    words = make_vocabulary(rng)
+    database.init_database()
+    conn = database.get_db_connection()
+    with common.Timer() as seeding:
+        seed(conn, args.books, rng, words)
+    create_books_search_index(conn)
+
+    kinds = {
+        'prefix': lambda: rng.choice(words)[:rng.randint(3, 5)],
+        'short_prefix': lambda: rng.choice(words)[:rng.randint(1, 2)],
+        'word': lambda: pick_word(rng, words),
+        'two_words': lambda: f'{pick_word(rng, words)} {pick_word(rng, words)}',
+        'author': lambda: rng.choice(SURNAMES),
+        'isbn': lambda: f'978{rng.randrange(args.books):010d}',
+    }
+    report = {'books': args.books, 'seed_seconds': round(seeding.elapsed, 1), 'queries': {}}
+    for kind, make_query in kinds.items():
+        samples = []
+        for _ in range(args.queries):
+            query = make_query()
+            start = time.perf_counter()
+            search_books(conn, query, args.limit)
+            samples.append(time.perf_counter() - start)
+        report['queries'][kind] = common.summarize(samples)
+    report['search_cache'] = search_cache.stats()
+    conn.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+"""Borrow throughput when many students race for the same few copies.
+
+--students students loop on borrowing one hot book with --copies copies,
+returning it as soon as they get it and waiting --think seconds between
+attempts. Four engines are compared on the same database:
+
+    legacy   the pre-circulation.py flow: BEGIN IMMEDIATE on the 30s busy
+             handler, then SELECT student, SELECT book, duplicate check,
+             INSERT and two UPDATEs; return is SELECT plus three UPDATEs
+    engine   circulation.check_borrow on a read-only connection, then
+             circulation.borrow_book / return_book in write_transaction, on
+             a write connection: conditional UPDATEs, WRITE_BUSY_TIMEOUT_MS
+             per attempt and jittered retry
+    writer   the same check, then the units of work queued for one
+             writer.Writer: each borrow or return is one operation, and
+             whatever is queued together shares one commit
+    api      what the routes do: check_borrow or check_return, then a
+             contended title (circulation.CONTENDED_COPIES or fewer) to a
+             circulation thread (data_access.circulate_db), any other to
+             the writer
+
+legacy and engine run every student as a process on its own connection,
+so the contention is on SQLite's write lock and not on the GIL; writer and
+api run them as threads of one process, like requests in one API worker.
+
+Reported per engine: successful borrows per second, refusals (no copy
+left), busy failures, borrow latency percentiles and how long each borrow
+or return held the lock before its commit.
+
+Measured with 32 students, 5s per engine, three runs:
+
+    --copies 2    legacy 1.09k-1.52k/s  engine 0.69k-1.08k/s  writer 0.21k-0.28k/s  api 0.39k-0.54k/s
+    --copies 16   legacy 1.24k-1.57k/s  engine 1.01k-1.43k/s  writer 1.19k-1.38k/s  api 1.24k-1.32k/s
+
+With many copies the writer's group commits keep up with legacy, and api
+matches them. With two, taking contended titles off the writer doubles its
+rate, but --copies 2 is still well below legacy on one core. Each student
+returns its copy at once, so a copy is out for well under a millisecond. A
+legacy attempt that finds none waits on the lock behind the return and
+then gets the copy; a checked attempt is refused and its student sleeps
+--think before trying again, while the refusals and the checks (a fresh
+WAL snapshot each) take the CPU the holders need. In one process every
+hand-off between a client thread and a circulation thread also waits for
+the GIL, with 32 client threads and as many circulation threads in it.
+
+    python -m benchmarks.borrow_contention --students 32 --copies 2 --duration 5
+"""
+import argparse
+import json
+import multiprocessing
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from benchmarks import common
+
+import database
+from allocators import allocate_transaction_ids
+from circulation import (MAX_BOOKS_PER_STUDENT, RETURN_DAYS, CirculationError, borrow_book, check_borrow, check_return,
+                         contended, return_book)
+from data_access import (WriteBusy, get_circulation_executor, get_write_connection, run_circulation, shutdown_executor,
+                         write_transaction)
+from database import to_epoch
+from fines import FINE_PER_DAY, days_overdue, release_accrued_fine
+from repositories import with_repositories
+from writer import Writer
+
+
+class Refused(Exception):
+    pass
+
+
+def legacy_borrow_book(conn, student_id, book_id):
+    student = conn.execute('SELECT * FROM students WHERE id = ?', (student_id,)).fetchone()
+    if student['borrowed_books'] >= MAX_BOOKS_PER_STUDENT:
+        raise Refused()
+    book = conn.execute('SELECT * FROM books WHERE id = ?', (book_id,)).fetchone()
+    if book['available'] <= 0:
+        raise Refused()
+    if conn.execute('SELECT id FROM transactions WHERE student_id = ? AND book_id = ? AND status = ?',
+                    (student_id, book_id, 'borrowed')).fetchone():
+        raise Refused()
+    borrow_date = datetime.now()
+    due_date = borrow_date + timedelta(days=RETURN_DAYS)
+    [code] = allocate_transaction_ids(conn)
+    cursor = conn.execute(
+        '''INSERT INTO transactions
+           (transaction_id, student_id, student_registration_no, book_id, borrow_date, due_date, borrow_ts, due_ts, status)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+        (code, student_id, student['registration_no'], book_id, borrow_date.isoformat(), due_date.isoformat(),
+         to_epoch(borrow_date), to_epoch(due_date), 'borrowed')
+    )
+    conn.execute('UPDATE books SET available = available - 1 WHERE id = ?', (book_id,))
+    conn.execute('UPDATE students SET borrowed_books = borrowed_books + 1 WHERE id = ?', (student_id,))
+    return {'id': cursor.lastrowid}
+
+
+def legacy_return_book(conn, transaction_id):
+    loan = conn.execute('SELECT * FROM transactions WHERE id = ?', (transaction_id,)).fetchone()
+    fine = days_overdue(loan['due_ts'], int(time.time())) * FINE_PER_DAY
+    now = datetime.now()
+    conn.execute('UPDATE transactions SET status = ?, return_date = ?, return_ts = ?, fine_amount = ? WHERE id = ?',
+                 ('returned', now.isoformat(), to_epoch(now), fine, transaction_id))
+    conn.execute('UPDATE books SET available = available + 1 WHERE id = ?', (loan['book_id'],))
+    conn.execute('UPDATE students SET borrowed_books = borrowed_books - 1, fine_amount = fine_amount + ? WHERE id = ?',
+                 (fine, loan['student_id']))
+    release_accrued_fine(conn, loan['student_id'], loan['due_ts'])
+
+
+def legacy_transaction(conn, fn, *args):
+    # BEGIN IMMEDIATE straight on the 30s busy handler, as the old endpoints did.
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        result = fn(conn, *args)
+        conn.commit()
+        return result
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+# Time between taking the write lock and starting the commit, per transaction.
+lock_held = []
+
+
+def holding_lock(fn):
+    def timed(conn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(conn, *args)
+        finally:
+            lock_held.append(time.perf_counter() - start)
+    timed.__name__ = fn.__name__
+    return timed
+
+
+ENGINES = {
+    'legacy': (database.get_db_connection, legacy_transaction, None, legacy_borrow_book, legacy_return_book),
+    'engine': (get_write_connection, write_transaction, with_repositories(check_borrow),
+               with_repositories(borrow_book), with_repositories(return_book)),
+}
+
+
+def setup(conn, students, copies):
+    conn.execute('BEGIN')
+    first = conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM students').fetchone()[0]
+    conn.executemany(
+        '''INSERT INTO students (registration_no, username, password, name, email, phone)
+           VALUES (?, ?, 'x', 'Bench Student', 'bench@example.edu', '0')''',
+        ((f'C{i:08d}', f'contention{i}') for i in range(students))
+    )
+    book_id = conn.execute(
+        '''INSERT INTO books (title, author, isbn, pages, price, category, quantity, available)
+           VALUES ('Contended Title', 'Bench', '9790000000001', 100, 1.0, 'Bench', ?, ?)''',
+        (copies, copies)
+    ).lastrowid
+    conn.commit()
+    return list(range(first, first + students)), book_id
+
+
+def student(engine, student_id, book_id, deadline, think, results):
+    connect, transaction, check, borrow, give_back = ENGINES[engine]
+    borrow, give_back = holding_lock(borrow), holding_lock(give_back)
+    counts = {'borrowed': 0, 'refused': 0, 'busy': 0}
+    latencies = []
+    conn = connect()
+    read_conn = database.get_read_connection() if check else None
+    try:
+        while time.time() < deadline:
+            start = time.perf_counter()
+            try:
+                if check:
+                    check(read_conn, student_id, book_id)
+                loan_id = transaction(conn, borrow, student_id, book_id)['id']
+            except (Refused, CirculationError):
+                counts['refused'] += 1
+                loan_id = None
+            except (WriteBusy, sqlite3.OperationalError):
+                counts['busy'] += 1
+                loan_id = None
+            latencies.append(time.perf_counter() - start)
+            if loan_id is not None:
+                counts['borrowed'] += 1
+                # The copy has to come back, or every later attempt is refused.
+                while True:
+                    try:
+                        transaction(conn, give_back, loan_id)
+                        break
+                    except (WriteBusy, sqlite3.OperationalError):
+                        counts['busy'] += 1
+            time.sleep(think)
+    finally:
+        conn.close()
+        if read_conn is not None:
+            read_conn.close()
+    results.put((counts, latencies, lock_held))
+
+
+def threaded_students(engine, student_ids, book_id, deadline, think, results):
+    """Every student as a thread of one process, like requests in one API worker.
+
+    Each checks with check_borrow (check_return before giving the copy back)
+    on a read-only connection of its own, then hands the unit of work to the
+    writer thread and waits for the result. With api, a borrow or return of
+    a contended title goes to a circulation thread instead, as the routes
+    send it to storage.circulate.
+    """
+    check, check_back = with_repositories(check_borrow), with_repositories(check_return)
+    borrow, give_back = holding_lock(with_repositories(borrow_book)), holding_lock(with_repositories(return_book))
+    writer = Writer(database.DATABASE_NAME)
+
+    def submit(book, fn, *args):
+        if engine == 'api' and contended(book):
+            return get_circulation_executor().submit(run_circulation, fn, args, {})
+        return writer.submit(fn, *args)
+
+    outcomes = []
+
+    def run_student(student_id):
+        counts = {'borrowed': 0, 'refused': 0, 'busy': 0}
+        latencies = []
+        # The API's read pool: a read-only connection per request thread.
+        read_conn = database.get_read_connection()
+        while time.time() < deadline:
+            start = time.perf_counter()
+            try:
+                book = check(read_conn, student_id, book_id)
+                loan_id = submit(book, borrow, student_id, book_id).result()['id']
+            except CirculationError:
+                counts['refused'] += 1
+                loan_id = None
+            except (WriteBusy, sqlite3.OperationalError):
+                counts['busy'] += 1
+                loan_id = None
+            latencies.append(time.perf_counter() - start)
+            if loan_id is not None:
+                counts['borrowed'] += 1
+                while True:
+                    try:
+                        submit(check_back(read_conn, loan_id), give_back, loan_id).result()
+                        break
+                    except (WriteBusy, sqlite3.OperationalError):
+                        counts['busy'] += 1
+            time.sleep(think)
+        read_conn.close()
+        outcomes.append((counts, latencies))
+
+    threads = [threading.Thread(target=run_student, args=(student_id,)) for student_id in student_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.stop()
+    shutdown_executor()
+    for counts, latencies in outcomes[:-1]:
+        results.put((counts, latencies, []))
+    counts, latencies = outcomes[-1]
+    results.put((counts, latencies, lock_held))
+
+
+def run(engine, student_ids, book_id, duration, think):
+    results = multiprocessing.Queue()
+    deadline = time.time() + duration
+    if engine in ('writer', 'api'):
+        workers = [multiprocessing.Process(target=threaded_students,
+                                           args=(engine, student_ids, book_id, deadline, think, results))]
+    else:
+        workers = [multiprocessing.Process(target=student, args=(engine, student_id, book_id, deadline, think, results))
+                   for student_id in student_ids]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    counts = {'borrowed': 0, 'refused': 0, 'busy': 0}
+    samples, held = [], []
+    for _ in student_ids:
+        local, latencies, lock_times = results.get()
+        for key, value in local.items():
+            counts[key] += value
+        samples.extend(latencies)
+        held.extend(lock_times)
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    result = dict(counts)
+    result['borrows_per_second'] = round(counts['borrowed'] / elapsed, 1)
+    result['attempts_per_second'] = round(len(samples) / elapsed, 1)
+    result['borrow_latency'] = common.summarize(samples)
+    result['lock_held'] = common.summarize(held)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=32)
+    parser.add_argument('--copies', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--think', type=float, default=0.001,
+                        help='seconds each student waits between attempts')
+    parser.add_argument('--engines', default='legacy,engine,writer,api')
+    args = parser.parse_args()
+
+    database.init_database()
+    conn = database.get_db_connection()
+    student_ids, book_id = setup(conn, args.students, args.copies)
+    conn.close()
+
+    report = {'students': args.students, 'copies': args.copies, 'duration': args.duration, 'think': args.think}
+    for engine in args.engines.split(','):
+        report[engine] = run(engine, student_ids, book_id, args.duration, args.think)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Shared helpers for the benchmark scripts.
+
+Import this module before ``app`` or ``database``: it points DB_PATH at a
+throwaway database so benchmarks never touch ``library.db``.
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+if 'DB_PATH' not in os.environ:
+    _workdir = tempfile.mkdtemp(prefix='library-bench-')
+    os.environ['DB_PATH'] = os.path.join(_workdir, 'library.db')
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Latency summary in milliseconds for a list of durations in seconds."""
+    return {
+        'count': len(samples),
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        'max_ms': round(max(samples) * 1000, 3) if samples else 0.0,
+    }
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+
+
+# The write path the API had before the writer thread, kept as a baseline:
+# one thread per connection of db_pool's read-write pool.
+DB_WORKERS = int(os.environ.get('DB_WORKERS', os.environ.get('DB_POOL_SIZE', '8')))
+_executor = None
+
+
+def _run_pooled(fn, args, kwargs):
+    from db_pool import db_connection
+    from metrics import DB_POOL_WAIT
+
+    requested = time.perf_counter()
+    with db_connection() as conn:
+        DB_POOL_WAIT.observe(time.perf_counter() - requested, 'write')
+        result = fn(conn, *args, **kwargs)
+        if conn.in_transaction:
+            conn.commit()
+        return result
+
+
+async def run_db(fn, *args, **kwargs):
+    """Run ``fn(conn, *args, **kwargs)`` on a pooled read-write connection off the event loop.
+
+    Whatever ``fn`` leaves uncommitted is committed when it returns; if it
+    raises, the pool rolls the connection back. Call ``shutdown()`` when done.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix='db')
+    loop = asyncio.get_running_loop()
+    call = functools.partial(_run_pooled, fn, args, kwargs)
+    return await loop.run_in_executor(_executor, contextvars.copy_context().run, call)
+
+
+def shutdown():
+    """Stop the ``run_db`` threads and close db_pool's pools"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    from db_pool import close_pool
+    close_pool()
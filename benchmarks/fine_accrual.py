@@ -0,0 +1,79 @@
+"""Time the batch fine accrual job over 1M open loans.
+
+Loans are spread over 20k students with due dates from 60 days ago to
+14 days ahead, so most of them are overdue. Three runs are timed: the
+first run on fresh loans, a rerun at the same instant (no student total
+changes, nothing is written) and a run one day later (every student with
+an overdue loan gets a new total).
+
+    python -m benchmarks.fine_accrual --loans 1000000
+"""
+import argparse
+import json
+import random
+import time
+
+from benchmarks import common
+
+import database
+from data_access import write_transaction
+from fines import accrue_fines
+
+
+def populate(conn, loans, students, now_ts):
+    conn.execute('BEGIN')
+    conn.executemany(
+        '''INSERT INTO students (registration_no, username, password, name, email, phone)
+           VALUES (?, ?, 'x', 'Bench Student', 'bench@example.edu', '0')''',
+        ((f'B{i:08d}', f'bench{i}') for i in range(students))
+    )
+    first_student = conn.execute('SELECT MIN(id) FROM students WHERE username = ?', ('bench0',)).fetchone()[0]
+    rng = random.Random(42)
+
+    def rows():
+        for i in range(loans):
+            due_ts = now_ts + rng.randint(-60 * 86400, 14 * 86400)
+            yield (f'BENCH{i}', first_student + rng.randrange(students), 'B', 1,
+                   '', '', due_ts - 7 * 86400, due_ts, 'borrowed')
+
+    conn.executemany(
+        '''INSERT INTO transactions (transaction_id, student_id, student_registration_no, book_id,
+                                     borrow_date, due_date, borrow_ts, due_ts, status)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+        rows()
+    )
+    conn.commit()
+
+
+def timed(conn, now_ts):
+    with common.Timer() as timer:
+        result = write_transaction(conn, accrue_fines, now_ts)
+    result['seconds'] = round(timer.elapsed, 3)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--loans', type=int, default=1_000_000)
+    parser.add_argument('--students', type=int, default=20_000)
+    args = parser.parse_args()
+
+    database.init_database()
+    conn = database.get_db_connection()
+    now_ts = int(time.time())
+    with common.Timer() as setup:
+        populate(conn, args.loans, args.students, now_ts)
+
+    report = {
+        'loans': args.loans,
+        'setup_seconds': round(setup.elapsed, 1),
+        'first_run': timed(conn, now_ts),
+        'rerun_same_instant': timed(conn, now_ts),
+        'next_day': timed(conn, now_ts + 86400),
+    }
+    conn.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
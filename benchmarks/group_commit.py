@@ -0,0 +1,111 @@
+"""Sustained write throughput: pooled write transactions vs the writer thread.
+
+--concurrency coroutines on one event loop (as in a single uvicorn worker)
+each borrow a book and return it again, over and over, for --duration
+seconds. Every student has its own book, so nothing is refused and every
+operation is a real write. Two paths are compared:
+
+    pool     common.run_db + write_transaction: every operation takes the
+             write lock and commits on its own, on a pooled connection
+    writer   SqliteStorage.write: operations queue for the writer thread
+             and share group commits
+
+Reported per path: write operations per second, latency percentiles and,
+for the writer, the mean group size.
+
+    python -m benchmarks.group_commit --concurrency 64 --duration 5
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks import common
+
+import database
+from circulation import borrow_book, return_book
+from data_access import write_transaction
+from metrics import WRITE_GROUP_SIZE
+from repositories import SqliteStorage, with_repositories
+from writer import shutdown_writer
+
+
+def setup(conn, students):
+    conn.execute('BEGIN')
+    pairs = []
+    for i in range(students):
+        student_id = conn.execute(
+            '''INSERT INTO students (registration_no, username, password, name, email, phone)
+               VALUES (?, ?, 'x', 'Bench Student', 'bench@example.edu', '0')''',
+            (f'G{i:08d}', f'groupcommit{i}')
+        ).lastrowid
+        book_id = conn.execute(
+            '''INSERT INTO books (title, author, isbn, pages, price, category, quantity, available)
+               VALUES (?, 'Bench', ?, 100, 1.0, 'Bench', 1, 1)''',
+            (f'Group Commit {i}', f'978{i:010d}')
+        ).lastrowid
+        pairs.append((student_id, book_id))
+    conn.commit()
+    return pairs
+
+
+async def pool_write(fn, *args):
+    return await common.run_db(write_transaction, with_repositories(fn), *args)
+
+
+PATHS = {'pool': pool_write, 'writer': SqliteStorage().write}
+
+
+async def run(path, pairs, duration):
+    write = PATHS[path]
+    samples = []
+    deadline = time.perf_counter() + duration
+
+    async def worker(student_id, book_id):
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            loan = await write(borrow_book, student_id, book_id)
+            samples.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            await write(return_book, loan['id'])
+            samples.append(time.perf_counter() - start)
+
+    groups_before = WRITE_GROUP_SIZE.snapshot()
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(student_id, book_id) for student_id, book_id in pairs))
+    elapsed = time.perf_counter() - start
+    groups, operations = (after - before for after, before in zip(WRITE_GROUP_SIZE.snapshot(), groups_before))
+
+    result = {'writes_per_second': round(len(samples) / elapsed, 1), 'latency': common.summarize(samples)}
+    if path == 'writer':
+        result['mean_group_size'] = round(operations / groups, 2) if groups else 0
+    return result
+
+
+async def main_async(args):
+    database.init_database()
+    conn = database.get_db_connection()
+    pairs = setup(conn, args.concurrency)
+    conn.close()
+
+    report = {'concurrency': args.concurrency, 'duration': args.duration}
+    try:
+        for path in args.paths.split(','):
+            report[path] = await run(path, pairs, args.duration)
+    finally:
+        shutdown_writer()
+        common.shutdown()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--paths', default='pool,writer')
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
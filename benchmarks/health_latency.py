@@ -0,0 +1,103 @@
+"""Check that /api/health stays responsive while the worker is saturated.
+
+Drives the app in-process over ASGI, so every request shares one event loop
+exactly like a single uvicorn worker. The health endpoint is probed on an idle
+app, then again while login and borrow/return workers hammer the database and
+bcrypt. Exits non-zero if the loaded p99 exceeds the idle p99 by more than
+--max-slowdown milliseconds.
+
+    python -m benchmarks.health_latency --duration 5 --workers 16
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from benchmarks import common
+
+import httpx
+
+import app as library_app
+import database
+
+
+async def probe_health(client, duration, interval):
+    samples = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        response = await client.get('/api/health')
+        samples.append(time.perf_counter() - start)
+        response.raise_for_status()
+        await asyncio.sleep(interval)
+    return samples
+
+
+async def login_worker(client, stop):
+    count = 0
+    while not stop.is_set():
+        await client.post('/api/auth/login', json={'username': 'rahul.kumar', 'password': 'pass123'})
+        count += 1
+    return count
+
+
+async def circulation_worker(client, token, book_id, stop):
+    headers = {'Authorization': f'Bearer {token}'}
+    count = 0
+    while not stop.is_set():
+        response = await client.post('/api/student/borrow', json={'book_id': book_id}, headers=headers)
+        if response.status_code == 200:
+            books = (await client.get('/api/student/my-books', headers=headers)).json()
+            for book in books:
+                await client.post('/api/student/return', json={'transaction_id': book['id']}, headers=headers)
+        count += 1
+    return count
+
+
+async def main(args):
+    database.init_database()
+    transport = httpx.ASGITransport(app=library_app.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        logins = {}
+        for username in ('rahul.kumar', 'priya.sharma', 'amit.patel'):
+            response = await client.post('/api/auth/login', json={'username': username, 'password': 'pass123'})
+            logins[username] = response.json()['token']
+
+        idle = await probe_health(client, args.duration, args.interval)
+
+        stop = asyncio.Event()
+        tokens = list(logins.values())
+        workers = []
+        for i in range(args.workers):
+            if i % 2 == 0:
+                workers.append(asyncio.create_task(login_worker(client, stop)))
+            else:
+                workers.append(asyncio.create_task(
+                    circulation_worker(client, tokens[i % len(tokens)], 1 + i % 6, stop)))
+        await asyncio.sleep(0.2)
+        loaded = await probe_health(client, args.duration, args.interval)
+        stop.set()
+        completed = sum(await asyncio.gather(*workers))
+
+    report = {
+        'idle': common.summarize(idle),
+        'loaded': common.summarize(loaded),
+        'background_requests': completed,
+    }
+    print(json.dumps(report, indent=2))
+    slowdown = report['loaded']['p99_ms'] - report['idle']['p99_ms']
+    if slowdown > args.max_slowdown:
+        print(f'FAIL: /api/health p99 grew by {slowdown:.1f}ms under load', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--interval', type=float, default=0.01)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--max-slowdown', type=float, default=50.0,
+                        help='allowed p99 increase in milliseconds')
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,294 @@
+"""Load test the circulation API with a realistic request mix.
+
+Drives the app in-process over ASGI (one event loop, like a single uvicorn
+worker) or, with --url, a running server. Setup goes through the API as
+admin: a fresh set of students is enrolled for this run (one per virtual
+user) and a "hot" book with only a few copies is added. Then --concurrency
+virtual users pick operations from the weighted mix until --duration runs
+out:
+
+    login         student login (bcrypt verify)
+    catalog       GET /api/student/books
+    search        admin book search
+    my_books      GET /api/student/my-books
+    borrow        borrow the hot book; on success its loan is returned
+                  (my_books + return), so all users fight over a few copies
+    stats         GET /api/admin/stats
+
+The report is JSON: throughput and p50/p95/p99 per endpoint plus the run
+configuration. Pass --output to keep it and --baseline to compare against
+an earlier report; the run fails if any endpoint's p95 regressed by more
+than --max-regression (a fraction) or its error rate grew.
+
+    python -m benchmarks.loadtest --duration 20 --concurrency 32 --output run.json
+    python -m benchmarks.loadtest --url http://127.0.0.1:8000 --baseline run.json
+
+--storage memory runs the in-process app on memory_repositories, which
+separates the API's own cost from SQLite's.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import secrets
+import sys
+import time
+from collections import defaultdict
+
+from benchmarks import common
+
+import httpx
+
+OPERATIONS = ('login', 'catalog', 'search', 'my_books', 'borrow', 'stats')
+DEFAULT_MIX = 'login=5,catalog=30,search=15,my_books=10,borrow=30,stats=10'
+SEARCH_TERMS = ('the', 'python', 'data', 'history', 'science', 'art', 'a')
+PASSWORD = 'loadtest-pass'
+ADMIN = {'username': 'admin', 'password': 'admin123'}
+
+
+def parse_mix(spec):
+    """'login=5,catalog=30' -> [('login', 5.0), ('catalog', 30.0)]"""
+    mix = []
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, weight = item.partition('=')
+        if name not in OPERATIONS:
+            raise SystemExit(f'Unknown operation in --mix: {name}')
+        mix.append((name, float(weight)))
+    return mix
+
+
+class Recorder:
+    """Latency samples and status codes per endpoint"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.recording = False
+
+    async def call(self, endpoint, request):
+        start = time.perf_counter()
+        try:
+            response = await request
+            status = response.status_code
+        except httpx.HTTPError:
+            response, status = None, 'transport_error'
+        if self.recording:
+            self.samples[endpoint].append(time.perf_counter() - start)
+            self.statuses[endpoint][status] += 1
+        return response
+
+    def report(self, elapsed):
+        endpoints = {}
+        for endpoint in sorted(self.samples):
+            statuses = self.statuses[endpoint]
+            errors = sum(count for status, count in statuses.items()
+                         if status == 'transport_error' or status >= 500)
+            summary = common.summarize(self.samples[endpoint])
+            summary.update({
+                'throughput_rps': round(summary['count'] / elapsed, 1),
+                'error_rate': round(errors / summary['count'], 4),
+                'statuses': {str(status): count for status, count in sorted(statuses.items(), key=str)},
+            })
+            endpoints[endpoint] = summary
+        total = sum(len(samples) for samples in self.samples.values())
+        return {'requests': total, 'throughput_rps': round(total / elapsed, 1), 'endpoints': endpoints}
+
+
+class VirtualUser:
+    def __init__(self, client, recorder, username, student_token, admin_token, hot_book_id):
+        self.client = client
+        self.recorder = recorder
+        self.username = username
+        self.student = {'Authorization': f'Bearer {student_token}'}
+        self.admin = {'Authorization': f'Bearer {admin_token}'}
+        self.hot_book_id = hot_book_id
+        self.borrowed = 0
+
+    async def login(self, rng):
+        await self.recorder.call('login', self.client.post(
+            '/api/auth/login', json={'username': self.username, 'password': PASSWORD}))
+
+    async def catalog(self, rng):
+        await self.recorder.call('catalog', self.client.get('/api/student/books', headers=self.student))
+
+    async def search(self, rng):
+        await self.recorder.call('search', self.client.get(
+            '/api/admin/books/search', params={'query': rng.choice(SEARCH_TERMS)}, headers=self.admin))
+
+    async def my_books(self, rng):
+        await self.recorder.call('my_books', self.client.get('/api/student/my-books', headers=self.student))
+
+    async def borrow(self, rng):
+        response = await self.recorder.call('borrow', self.client.post(
+            '/api/student/borrow', json={'book_id': self.hot_book_id}, headers=self.student))
+        if response is None or response.status_code != 200:
+            return
+        if self.recorder.recording:
+            self.borrowed += 1
+        transaction_code = response.json()['transaction_id']
+        loans = await self.recorder.call('my_books', self.client.get('/api/student/my-books', headers=self.student))
+        for loan in loans.json() if loans is not None and loans.status_code == 200 else []:
+            if loan['transaction_id'] == transaction_code:
+                await self.recorder.call('return', self.client.post(
+                    '/api/student/return', json={'transaction_id': loan['id']}, headers=self.student))
+
+    async def stats(self, rng):
+        await self.recorder.call('stats', self.client.get('/api/admin/stats', headers=self.admin))
+
+    async def run(self, mix, rng, stop):
+        names = [name for name, _ in mix]
+        weights = [weight for _, weight in mix]
+        while not stop.is_set():
+            await getattr(self, rng.choices(names, weights)[0])(rng)
+
+
+async def login(client, username, password):
+    response = await client.post('/api/auth/login', json={'username': username, 'password': password})
+    response.raise_for_status()
+    return response.json()['token']
+
+
+async def setup(client, args, tag):
+    """Enroll one student per virtual user and add the hot book; returns tokens and its ID"""
+    admin_token = await login(client, ADMIN['username'], ADMIN['password'])
+    admin = {'Authorization': f'Bearer {admin_token}'}
+
+    roster = ''.join(
+        json.dumps({'username': f'lt{tag}u{i}', 'password': PASSWORD, 'name': f'Load Test {i}',
+                    'email': f'lt{tag}u{i}@example.edu', 'phone': '0000000000'}) + '\n'
+        for i in range(args.concurrency)
+    )
+    response = await client.post('/api/admin/students/enroll', headers=admin, timeout=300,
+                                 files={'file': ('roster.jsonl', roster.encode('utf-8'))})
+    response.raise_for_status()
+    enrolled = [json.loads(line) for line in response.text.splitlines()]
+    usernames = [result['username'] for result in enrolled if result.get('status') == 'enrolled']
+    if len(usernames) != args.concurrency:
+        raise SystemExit(f'Enrolled {len(usernames)} of {args.concurrency} load test students')
+
+    response = await client.post('/api/admin/books', headers=admin, json={
+        'title': f'Load Test Hot Book {tag}', 'author': 'Load Test', 'isbn': f'979{int(tag, 16) % 10**10:010d}',
+        'pages': 100, 'price': 1.0, 'category': 'Load Test', 'quantity': args.hot_copies,
+    })
+    response.raise_for_status()
+    hot_book_id = response.json()['book']['id']
+
+    students = []
+    for username in usernames:
+        students.append((username, await login(client, username, PASSWORD)))
+    return admin_token, students, hot_book_id
+
+
+async def run(client, args):
+    tag = secrets.token_hex(4)
+    admin_token, students, hot_book_id = await setup(client, args, tag)
+    recorder = Recorder()
+    rng = random.Random(args.seed)
+    users = [VirtualUser(client, recorder, username, token, admin_token, hot_book_id)
+             for username, token in students]
+
+    stop = asyncio.Event()
+    tasks = [asyncio.create_task(user.run(args.mix, random.Random(rng.random()), stop)) for user in users]
+    await asyncio.sleep(args.warmup)
+    recorder.recording = True
+    start = time.perf_counter()
+    await asyncio.sleep(args.duration)
+    recorder.recording = False
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await asyncio.gather(*tasks)
+
+    report = recorder.report(elapsed)
+    report['successful_borrows'] = sum(user.borrowed for user in users)
+    return report
+
+
+async def run_in_process(args):
+    # Read once, when app builds its storage.
+    os.environ['STORAGE'] = args.storage
+    import database
+    import app as library_app
+
+    if args.storage == 'memory':
+        await library_app.storage.write(database.add_default_data)
+    else:
+        database.init_database()
+    transport = httpx.ASGITransport(app=library_app.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://loadtest', timeout=args.timeout) as client:
+        return await run(client, args)
+
+
+async def run_remote(args):
+    limits = httpx.Limits(max_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        return await run(client, args)
+
+
+def compare(report, baseline, max_regression):
+    """Per-endpoint p95 and error-rate changes; returns (changes, regressed endpoints)"""
+    changes, regressed = {}, []
+    for endpoint, current in report['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(endpoint)
+        if not previous:
+            continue
+        ratio = current['p95_ms'] / previous['p95_ms'] if previous['p95_ms'] else 1.0
+        changes[endpoint] = {
+            'p95_ms': [previous['p95_ms'], current['p95_ms']],
+            'p95_change': round(ratio - 1, 3),
+            'error_rate': [previous['error_rate'], current['error_rate']],
+        }
+        if ratio - 1 > max_regression or current['error_rate'] > previous['error_rate']:
+            regressed.append(endpoint)
+    return changes, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='base URL of a running server; default drives the app in-process')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--warmup', type=float, default=1.0)
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f'operation weights (default {DEFAULT_MIX})')
+    parser.add_argument('--hot-copies', type=int, default=2)
+    parser.add_argument('--storage', choices=('sqlite', 'memory'), default='sqlite',
+                        help='in-process storage backend; memory leaves SQLite out of the measurement')
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='also write the report to this file')
+    parser.add_argument('--baseline', help='report from an earlier run to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.25,
+                        help='allowed p95 increase per endpoint, as a fraction')
+    args = parser.parse_args()
+
+    report = asyncio.run(run_remote(args) if args.url else run_in_process(args))
+    report['config'] = {
+        'target': args.url or 'in-process',
+        'concurrency': args.concurrency,
+        'duration': args.duration,
+        'mix': dict(args.mix),
+        'hot_copies': args.hot_copies,
+        'storage': 'remote' if args.url else args.storage,
+        'seed': args.seed,
+    }
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            changes, regressed = compare(report, json.load(f), args.max_regression)
+        report['comparison'] = {'baseline': args.baseline, 'endpoints': changes, 'regressed': regressed}
+        status = 1 if regressed else 0
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+    if status:
+        print(f"FAIL: regressed endpoints: {', '.join(report['comparison']['regressed'])}", file=sys.stderr)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
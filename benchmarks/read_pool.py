@@ -0,0 +1,109 @@
+"""Read latency while bulk writes keep the read-write pool busy.
+
+--writers coroutines run write transactions on the read-write pool back to
+back (as a book import or fine accrual does), each inserting --rows rows.
+Meanwhile --readers coroutines repeat the student history query. Reads
+are issued two ways:
+
+    shared   common.run_db: reads take the same threads and connections as
+             the writes, and queue behind them
+    read     read_db: reads run on the read-only pool and its own threads
+
+Reported per mode: reads per second, read latency percentiles, and the
+pool wait the reads saw, plus how many write transactions went through.
+
+    python -m benchmarks.read_pool --writers 16 --readers 16 --duration 5
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+
+from benchmarks import common
+
+import database
+from data_access import WriteBusy, fetch_all, read_db, shutdown_executor, write_transaction
+from metrics import DB_POOL_WAIT
+
+HISTORY = '''SELECT t.*, b.title, b.author
+             FROM transactions t
+             JOIN books b ON t.book_id = b.id
+             WHERE t.student_id = ?
+             ORDER BY t.created_at DESC'''
+
+MODES = {'shared': common.run_db, 'read': read_db}
+
+_isbns = itertools.count(9790000000000)
+
+
+def bulk_insert(conn, rows):
+    conn.executemany(
+        '''INSERT INTO books (title, author, isbn, pages, price, category, quantity, available)
+           VALUES ('Bulk Title', 'Bench', ?, 100, 1.0, 'Bench', 1, 1)''',
+        ((str(next(_isbns)),) for _ in range(rows))
+    )
+
+
+async def run(mode, args):
+    read = MODES[mode]
+    pool = 'write' if mode == 'shared' else 'read'
+    samples = []
+    writes = {'committed': 0, 'busy': 0}
+    deadline = time.perf_counter() + args.duration
+
+    async def writer():
+        while time.perf_counter() < deadline:
+            try:
+                await common.run_db(write_transaction, bulk_insert, args.rows)
+                writes['committed'] += 1
+            except WriteBusy:
+                # The writers only exist to keep the pool busy; losing the lock race is fine.
+                writes['busy'] += 1
+
+    async def reader(student_id):
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await read(fetch_all, HISTORY, (student_id,))
+            samples.append(time.perf_counter() - start)
+
+    wait_before = DB_POOL_WAIT.snapshot(pool)
+    start = time.perf_counter()
+    await asyncio.gather(*(writer() for _ in range(args.writers)),
+                         *(reader(1 + i % 3) for i in range(args.readers)))
+    elapsed = time.perf_counter() - start
+    waits, wait_total = (after - before for after, before in zip(DB_POOL_WAIT.snapshot(pool), wait_before))
+
+    return {
+        'reads_per_second': round(len(samples) / elapsed, 1),
+        'read_latency': common.summarize(samples),
+        'mean_pool_wait_ms': round(wait_total / waits * 1000, 3) if waits else 0.0,
+        'write_transactions': writes,
+    }
+
+
+async def main_async(args):
+    database.init_database()
+    report = {'writers': args.writers, 'readers': args.readers, 'rows': args.rows, 'duration': args.duration}
+    try:
+        for mode in args.modes.split(','):
+            report[mode] = await run(mode, args)
+    finally:
+        shutdown_executor()
+        common.shutdown()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=16)
+    parser.add_argument('--readers', type=int, default=16)
+    parser.add_argument('--rows', type=int, default=200, help='rows inserted per write transaction')
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--modes', default='shared,read')
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
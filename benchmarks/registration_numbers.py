@@ -0,0 +1,86 @@
+"""Time 100k sequential registration number allocations.
+
+Every allocation is followed by the student INSERT that uses it, all in one
+transaction, so later allocations see a filling table just like bulk
+enrollment does. Only the allocation calls are timed. The permuted-counter
+allocator is compared with block allocation and with the old random-probe
+loop, which opened its own connection per call and so could not see rows
+still uncommitted in the batch; the INSERT collisions that causes are counted.
+
+    python -m benchmarks.registration_numbers --count 100000
+"""
+import argparse
+import json
+import random
+import sqlite3
+import time
+
+from benchmarks import common
+
+import database
+from allocators import allocate_registration_numbers, generate_registration_number
+
+
+def legacy_generate(conn):
+    probe_conn = database.get_db_connection()
+    try:
+        while True:
+            reg_no = str(random.randint(10000000, 99999999))
+            if not probe_conn.execute('SELECT id FROM students WHERE registration_no = ?', (reg_no,)).fetchone():
+                return reg_no
+    finally:
+        probe_conn.close()
+
+
+def insert_student(conn, reg_no, i, tag):
+    conn.execute(
+        '''INSERT INTO students (registration_no, username, password, name, email, phone)
+           VALUES (?, ?, 'x', 'Bench Student', 'bench@example.edu', '0')''',
+        (reg_no, f'{tag}{i}')
+    )
+
+
+def run(label, count, allocate_one=None, allocate_block=None):
+    database.init_database()
+    conn = database.get_db_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    allocating = 0.0
+    collisions = 0
+    if allocate_block:
+        with common.Timer() as block:
+            numbers = allocate_block(conn, count)
+        allocating = block.elapsed
+    for i in range(count):
+        if allocate_block:
+            reg_no = numbers[i]
+        else:
+            start = time.perf_counter()
+            reg_no = allocate_one(conn)
+            allocating += time.perf_counter() - start
+        try:
+            insert_student(conn, reg_no, i, label)
+        except sqlite3.IntegrityError:
+            collisions += 1
+    conn.rollback()
+    conn.close()
+    return {'allocations': count, 'seconds': round(allocating, 3),
+            'per_allocation_us': round(allocating / count * 1e6, 2), 'collisions': collisions}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=100_000)
+    parser.add_argument('--skip-legacy', action='store_true')
+    args = parser.parse_args()
+
+    report = {
+        'permuted': run('p', args.count, allocate_one=generate_registration_number),
+        'permuted_block': run('b', args.count, allocate_block=allocate_registration_numbers),
+    }
+    if not args.skip_legacy:
+        report['legacy_random_probe'] = run('l', args.count, allocate_one=legacy_generate)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+import asyncio
+import csv
+import io
+import json
+import os
+import re
+import sys
+
+from search import normalize_isbn
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+# Rows per write unit of work: large enough to amortise the commit, small
+# enough that writes queued behind a batch are not kept waiting for long.
+IMPORT_BATCH_SIZE = 1000
+# The report lists at most this many rejected rows; the counts stay exact.
+MAX_REPORTED_ERRORS = 1000
+REQUIRED_FIELDS = ('title', 'author', 'isbn')
+
+
+class ImportFormatError(ValueError):
+    """Raised when an upload cannot be read in the requested format at all."""
+
+
+def validate_isbn13(isbn: str) -> bool:
+    """Validate ISBN-13 format"""
+    isbn = re.sub(r'[-\s]', '', isbn)
+    if len(isbn) != 13 or not isbn.isdigit():
+        return False
+    return True
+
+
+def detect_format(filename, requested=None):
+    """The explicit format if given, otherwise guessed from the file extension"""
+    if requested:
+        return requested
+    extension = os.path.splitext(filename or '')[1].lower()
+    return 'jsonl' if extension in ('.jsonl', '.ndjson') else 'csv'
+
+
+def text_field(record, field, required=False):
+    value = record.get(field)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise ValueError(f'Missing {field}')
+    return value
+
+
+def _number(record, field, cast, default):
+    value = record.get(field)
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return default
+    try:
+        number = cast(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid {field}: {value!r}')
+    if number < 0:
+        raise ValueError(f'Invalid {field}: {value!r}')
+    return number
+
+
+def clean_record(record):
+    """Validate one parsed record; returns the books row as a tuple"""
+    if not isinstance(record, dict):
+        raise ValueError('Expected a JSON object')
+    title = text_field(record, 'title', required=True)
+    author = text_field(record, 'author', required=True)
+    isbn = normalize_isbn(text_field(record, 'isbn', required=True))
+    if not validate_isbn13(isbn):
+        raise ValueError(f'Invalid ISBN-13: {isbn}')
+    pages = _number(record, 'pages', int, None)
+    price = _number(record, 'price', float, None)
+    category = text_field(record, 'category') or None
+    quantity = _number(record, 'quantity', int, 1)
+    return (title, author, isbn, pages, None if price is None else round(price, 2), category, quantity)
+
+
+def _records(text, fmt, required_fields):
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        missing = [field for field in required_fields if field not in (reader.fieldnames or [])]
+        if missing:
+            raise ImportFormatError(f'CSV header is missing: {", ".join(missing)}')
+        for record in reader:
+            yield reader.line_num, record
+    else:
+        for line_number, line in enumerate(text, 1):
+            if line.strip():
+                yield line_number, line
+
+
+def iter_records(stream, fmt, clean, required_fields=()):
+    """Parse a binary CSV or JSONL upload one record at a time.
+
+    Yields ``(line, row, error)`` where ``row`` is ``clean(record)`` or, if
+    that raised ValueError, ``error`` is its message. Only the current record
+    is held in memory, so the file can be any size.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        for line, record in _records(text, fmt, required_fields):
+            try:
+                if fmt == 'jsonl':
+                    try:
+                        record = json.loads(record)
+                    except ValueError as e:
+                        raise ValueError(f'Invalid JSON: {e}')
+                yield line, clean(record), None
+            except ValueError as e:
+                yield line, None, str(e)
+    except UnicodeDecodeError:
+        raise ImportFormatError('File is not UTF-8 encoded')
+    except csv.Error as e:
+        raise ImportFormatError(f'Malformed CSV: {e}')
+    finally:
+        # Leave the underlying upload open; its owner closes it.
+        text.detach()
+
+
+def iter_rows(stream, fmt):
+    """Books rows parsed from an upload, as ``(line, row, error)``"""
+    return iter_records(stream, fmt, clean_record, REQUIRED_FIELDS)
+
+
+def insert_books(repos, batch):
+    """Insert one batch of (line, row) pairs; returns (imported, duplicates).
+
+    Its ISBNs are checked against the catalog first: duplicates, within the
+    file or against existing books, are returned as ``(line, error)`` pairs
+    instead of inserted, and the rest go in together.
+    """
+    existing = repos.books.existing_isbns({row[2] for _, row in batch})
+    seen, fresh, duplicates = set(), [], []
+    for line, row in batch:
+        isbn = row[2]
+        if isbn in existing:
+            duplicates.append((line, f'ISBN {isbn} already exists'))
+        elif isbn in seen:
+            duplicates.append((line, f'ISBN {isbn} appears earlier in the file'))
+        else:
+            seen.add(isbn)
+            fresh.append(row)
+    repos.books.add_many(fresh)
+    return len(fresh), duplicates
+
+
+async def import_books(rows, storage, batch_size=IMPORT_BATCH_SIZE, max_errors=MAX_REPORTED_ERRORS):
+    """Insert the rows from ``iter_rows`` in batches; returns the import report.
+
+    Every batch is its own ``storage.write`` unit of work (see insert_books),
+    so on SQLite it queues on the writer like any other write instead of
+    holding the write lock for the whole file. The upload is parsed off the
+    event loop. Batches that committed stay imported if a later one fails.
+    """
+    report = {'rows': 0, 'imported': 0, 'duplicates': 0, 'invalid': 0, 'errors': [], 'errors_truncated': False}
+    rows = iter(rows)
+
+    def reject(line, error, kind):
+        report[kind] += 1
+        if len(report['errors']) < max_errors:
+            report['errors'].append({'line': line, 'error': error})
+        else:
+            report['errors_truncated'] = True
+
+    def next_batch():
+        batch = []
+        for line, row, error in rows:
+            batch.append((line, row, error))
+            if len(batch) >= batch_size:
+                break
+        return batch
+
+    while True:
+        batch = await asyncio.to_thread(next_batch)
+        if not batch:
+            break
+        valid = [(line, row) for line, row, error in batch if error is None]
+        imported, duplicates = await storage.write(insert_books, valid) if valid else (0, [])
+        report['rows'] += len(batch)
+        report['imported'] += imported
+        duplicates = dict(duplicates)
+        for line, row, error in batch:
+            if error is not None:
+                reject(line, error, 'invalid')
+            elif line in duplicates:
+                reject(line, duplicates[line], 'duplicates')
+    return report
+
+
+async def _main(path):
+    from repositories import SqliteStorage
+
+    storage = SqliteStorage()
+    try:
+        with open(path, 'rb') as upload:
+            report = await import_books(iter_rows(upload, detect_format(path)), storage)
+        for error in report['errors']:
+            print(f"line {error['line']}: {error['error']}")
+        print(f"Imported {report['imported']} of {report['rows']} rows "
+              f"({report['duplicates']} duplicates, {report['invalid']} invalid)")
+    finally:
+        storage.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('usage: python book_import.py <books.csv|books.jsonl>')
+        sys.exit(2)
+    asyncio.run(_main(sys.argv[1]))
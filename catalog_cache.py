@@ -0,0 +1,93 @@
+import json
+import secrets
+import threading
+from collections import namedtuple
+
+Snapshot = namedtuple('Snapshot', 'version etag body')
+
+
+def etag_matches(if_none_match, etag):
+    """True if an If-None-Match header names ``etag`` (weak or strong) or is '*'"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*' or candidate.removeprefix('W/') == etag:
+            return True
+    return False
+
+
+class CatalogCache:
+    """Pre-serialized JSON snapshot of the student catalog.
+
+    Every write that changes what the catalog shows calls ``invalidate()``
+    after it commits, which bumps the version. The ETag is derived from the
+    version alone, so a conditional request can be answered without touching
+    SQLite. The next full request rebuilds the snapshot once; concurrent
+    requests wait for that build instead of repeating it.
+
+    The version lives in this process. Book changes made by another process
+    (a second server worker, or the ``book_import.py`` CLI) are only picked
+    up after a restart.
+    """
+
+    def __init__(self):
+        # Distinguishes this process's versions from a previous run's.
+        self._instance = secrets.token_hex(4)
+        self._version = 0
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._stats = {'hits': 0, 'not_modified': 0, 'rebuilds': 0, 'invalidations': 0}
+
+    def _etag(self, version):
+        return f'"catalog-{self._instance}-{version}"'
+
+    @property
+    def etag(self):
+        with self._lock:
+            return self._etag(self._version)
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+            self._stats['invalidations'] += 1
+
+    def record_not_modified(self):
+        with self._lock:
+            self._stats['not_modified'] += 1
+
+    def current(self):
+        """The snapshot for the current version, or None if it must be rebuilt"""
+        with self._lock:
+            if self._snapshot is not None and self._snapshot.version == self._version:
+                self._stats['hits'] += 1
+                return self._snapshot
+        return None
+
+    def build(self, repos):
+        """Unit of work that rebuilds the snapshot: ``await storage.read(cache.build)``"""
+        with self._build_lock:
+            snapshot = self.current()
+            if snapshot is not None:
+                return snapshot
+            # Read the version before the rows: a write that commits meanwhile
+            # bumps past it, so the snapshot is never labelled newer than it is.
+            with self._lock:
+                version = self._version
+            rows = repos.books.list_by_title()
+            body = json.dumps([dict(row) for row in rows]).encode('utf-8')
+            snapshot = Snapshot(version, self._etag(version), body)
+            with self._lock:
+                self._snapshot = snapshot
+                self._stats['rebuilds'] += 1
+            return snapshot
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['version'] = self._version
+        return stats
+
+
+catalog_cache = CatalogCache()
@@ -0,0 +1,230 @@
+"""Borrow and return as a handful of conditional writes.
+
+Each check that used to be a SELECT followed by an UPDATE is a single
+conditional write in the repositories (``books.take_copy``,
+``students.take_borrow_slot``, ``transactions.open_loan``), which returns
+the row the response needs or None. The write lock is therefore held for a
+few statements instead of a chain of round trips. Only when a condition
+fails is the store queried again, to explain why.
+
+These functions take the repositories (see repositories.py) and do not
+begin or commit anything. They run inside the caller's write transaction,
+and on ``CirculationError`` the caller must roll back, since earlier writes
+may already have been applied. The batch versions do exactly that with a
+savepoint per item, so a desk checkout of several books costs one lock
+acquisition and one commit.
+"""
+from datetime import datetime, timedelta
+
+MAX_BOOKS_PER_STUDENT = 3
+RETURN_DAYS = 7
+# Items per batch borrow or return request.
+MAX_BATCH_ITEMS = 50
+# A title with this many copies or fewer is contended: its borrows and
+# returns skip the writer's group commits (see data_access.circulate_db).
+# Copies owned, not available, so all of a title's loans take the same path.
+CONTENDED_COPIES = 4
+
+
+class CirculationError(Exception):
+    """A borrow or return that was refused; carries the HTTP status to answer with."""
+
+    def __init__(self, status_code, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _unavailable(book):
+    return CirculationError(
+        400,
+        f"'{book['title']}' is not available. Total copies: {book['quantity']}, Available: {book['available']}"
+    )
+
+
+def _over_limit(student):
+    return CirculationError(
+        400,
+        f"Borrow limit reached. You have {student['borrowed_books']}/{MAX_BOOKS_PER_STUDENT} books. Please return a book first."
+    )
+
+
+def check_borrow(repos, student_id, book_id):
+    """Refuse a borrow that cannot succeed, from a read-only snapshot.
+
+    Raises the CirculationError borrow_book would for a book that is unknown
+    or out of copies, or a student who is unknown or at the limit; returns
+    the book row otherwise. Run on the read pool before borrow_book, so
+    when a hot title is out of copies the refused attempts never wait for
+    the write lock and the copy holders are not queued behind them. Passing
+    proves nothing: borrow_book's conditional writes still decide.
+    """
+    book = repos.books.get(book_id)
+    if book is None:
+        raise CirculationError(404, f"Book with ID {book_id} not found")
+    if book['available'] <= 0:
+        raise _unavailable(book)
+    student = repos.students.get(student_id)
+    if student is None:
+        raise CirculationError(404, "Student not found in database")
+    if student['borrowed_books'] >= MAX_BOOKS_PER_STUDENT:
+        raise _over_limit(student)
+    return book
+
+
+def check_return(repos, transaction_id, student_id=None):
+    """Refuse a return that cannot succeed, from a read-only snapshot.
+
+    Raises the CirculationError return_book would for a loan that is unknown,
+    someone else's or already returned; returns the loan's book row (None if
+    the book is gone) otherwise, so the caller can tell if it is contended.
+    """
+    loan = repos.transactions.get(transaction_id)
+    if loan is None or (student_id is not None and loan['student_id'] != student_id):
+        raise CirculationError(404, "Transaction not found")
+    if loan['status'] != 'borrowed':
+        raise CirculationError(400, "Book not currently borrowed")
+    return repos.books.get(loan['book_id'])
+
+
+def contended(book):
+    """True for a book row from check_borrow or check_return with CONTENDED_COPIES or fewer"""
+    return book is not None and book['quantity'] <= CONTENDED_COPIES
+
+
+def borrow_book(repos, student_id, book_id, now=None, transaction_code=None):
+    """Lend one copy of ``book_id`` to ``student_id``.
+
+    Returns the new loan: {'id', 'transaction_id', 'due_date', 'book',
+    'student'}. Raises CirculationError if the book is unknown or has no
+    copy left, the student is unknown or at the borrow limit, or the student
+    already has this book. ``transaction_code`` is one reserved by the
+    caller; without it the next code is allocated.
+    """
+    borrow_date = now or datetime.now()
+    due_date = borrow_date + timedelta(days=RETURN_DAYS)
+
+    # The book goes first: when a popular title runs out, most attempts fail
+    # here, after a single UPDATE that changed nothing.
+    book = repos.books.take_copy(book_id)
+    if book is None:
+        row = repos.books.get(book_id)
+        if row is None:
+            raise CirculationError(404, f"Book with ID {book_id} not found")
+        raise _unavailable(row)
+
+    student = repos.students.take_borrow_slot(student_id, MAX_BOOKS_PER_STUDENT)
+    if student is None:
+        row = repos.students.get(student_id)
+        if row is None:
+            raise CirculationError(404, "Student not found in database")
+        raise _over_limit(row)
+
+    loan = repos.transactions.open_loan(student_id, student['registration_no'] or '', book_id, borrow_date, due_date,
+                                        transaction_code)
+    if loan is None:
+        raise CirculationError(
+            400,
+            f"You have already borrowed '{book['title']}'. Please return it before borrowing another copy."
+        )
+
+    return {
+        'id': loan['id'],
+        'transaction_id': loan['transaction_id'],
+        'due_date': due_date.isoformat(),
+        'book': {'id': book['id'], 'title': book['title'], 'author': book['author']},
+        'student': {'id': student_id, 'name': student['name'], 'borrowed_count': student['borrowed_books']},
+    }
+
+
+def return_book(repos, transaction_id, student_id=None, now=None):
+    """Close the open loan ``transaction_id`` and book its fine.
+
+    With ``student_id`` the loan must belong to that student (a student
+    returning their own book); without it any open loan may be returned (the
+    admin desk). Returns {'id', 'book_id', 'student_id', 'fine_amount'}.
+    """
+    loan = repos.transactions.close_loan(transaction_id, student_id, now or datetime.now())
+    if loan is None:
+        row = repos.transactions.get(transaction_id)
+        if row is None or (student_id is not None and row['student_id'] != student_id):
+            raise CirculationError(404, "Transaction not found")
+        raise CirculationError(400, "Book not currently borrowed")
+
+    repos.books.return_copy(loan['book_id'])
+    repos.students.release_borrow_slot(loan['student_id'], loan['fine_amount'])
+    repos.students.release_accrued_fine(loan['student_id'], loan['due_ts'])
+    return {
+        'id': transaction_id,
+        'book_id': loan['book_id'],
+        'student_id': loan['student_id'],
+        'fine_amount': loan['fine_amount'],
+    }
+
+
+def _each_in_savepoint(repos, items, apply):
+    """Run ``apply(item)`` for every item in its own savepoint.
+
+    A refused item is rolled back on its own and reported; the others are
+    kept. Anything other than CirculationError aborts the whole batch.
+    """
+    results = []
+    for item in items:
+        try:
+            with repos.savepoint():
+                result = apply(item)
+        except CirculationError as e:
+            result = {'status': 'error', 'status_code': e.status_code, 'error': e.detail}
+        results.append(result)
+    return results
+
+
+def borrow_books(repos, student_id, book_ids, now=None):
+    """Lend several books to one student in the caller's transaction.
+
+    The borrow limit is checked for the batch as a whole first: if the new
+    books would take the student past MAX_BOOKS_PER_STUDENT, nothing is
+    borrowed. After that each book succeeds or fails on its own. Returns one
+    result per requested book, in order. The transaction codes for the whole
+    batch are reserved with one allocation; a refused book leaves its code
+    unused.
+    """
+    if len(book_ids) > MAX_BATCH_ITEMS:
+        raise CirculationError(400, f"At most {MAX_BATCH_ITEMS} books per request")
+    student = repos.students.get(student_id)
+    if student is None:
+        raise CirculationError(404, "Student not found in database")
+    requested = len(set(book_ids))
+    if student['borrowed_books'] + requested > MAX_BOOKS_PER_STUDENT:
+        raise CirculationError(
+            400,
+            f"Borrow limit reached. You have {student['borrowed_books']}/{MAX_BOOKS_PER_STUDENT} books "
+            f"and asked for {requested} more."
+        )
+
+    seen = set()
+    codes = iter(repos.transactions.reserve_codes(requested))
+
+    def borrow(book_id):
+        if book_id in seen:
+            raise CirculationError(400, f"Book {book_id} appears earlier in the request")
+        seen.add(book_id)
+        loan = borrow_book(repos, student_id, book_id, now, next(codes))
+        return {'status': 'borrowed', 'transaction_id': loan['transaction_id'], 'due_date': loan['due_date'],
+                'book': loan['book']}
+
+    results = _each_in_savepoint(repos, book_ids, borrow)
+    return [{'book_id': book_id, **result} for book_id, result in zip(book_ids, results)]
+
+
+def return_books(repos, transaction_ids, student_id=None, now=None):
+    """Close several open loans in the caller's transaction; one result per loan, in order"""
+    if len(transaction_ids) > MAX_BATCH_ITEMS:
+        raise CirculationError(400, f"At most {MAX_BATCH_ITEMS} loans per request")
+
+    def give_back(transaction_id):
+        loan = return_book(repos, transaction_id, student_id, now)
+        return {'status': 'returned', 'book_id': loan['book_id'], 'fine_amount': loan['fine_amount']}
+
+    results = _each_in_savepoint(repos, transaction_ids, give_back)
+    return [{'transaction_id': transaction_id, **result} for transaction_id, result in zip(transaction_ids, results)]
@@ -0,0 +1,197 @@
+import asyncio
+import contextvars
+import functools
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from database import get_db_connection
+from db_pool import READ_POOL_SIZE, read_connection
+from metrics import DB_BUSY_ERRORS, DB_BUSY_RETRIES, DB_DURATION, DB_POOL_WAIT, is_busy_error
+
+# One worker per pooled read-only connection, so a worker never waits on the pool.
+DB_READ_WORKERS = int(os.environ.get('DB_READ_WORKERS', str(READ_POOL_SIZE)))
+
+# Write transactions wait this long for the lock per attempt, then back off
+# and retry, instead of sitting in SQLite's busy handler for up to 30s. Most
+# waits end inside one attempt; the retries (about 3s in all) are for a bulk
+# job holding the lock, after which the caller gets WriteBusy.
+WRITE_BUSY_TIMEOUT_MS = int(os.environ.get('DB_WRITE_BUSY_TIMEOUT_MS', '250'))
+WRITE_RETRIES = int(os.environ.get('DB_WRITE_RETRIES', '10'))
+WRITE_BACKOFF = float(os.environ.get('DB_WRITE_BACKOFF', '0.01'))
+WRITE_BACKOFF_MAX = float(os.environ.get('DB_WRITE_BACKOFF_MAX', '0.1'))
+# Threads for circulate_db, each with a write connection of its own. Enough
+# for every request that is waiting on a hot title: one stuck in the backoff
+# must not keep a holder's return from reaching the lock.
+CIRCULATION_WORKERS = int(os.environ.get('DB_CIRCULATION_WORKERS', '32'))
+
+_read_executor = None
+_circulation_executor = None
+_circulation = threading.local()
+_circulation_connections = []
+_circulation_lock = threading.Lock()
+
+
+class WriteBusy(Exception):
+    """Raised when the write lock was not granted within the retry budget."""
+
+
+def get_read_executor():
+    """Return the thread pool that runs ``read_db`` work on read-only connections."""
+    global _read_executor
+    if _read_executor is None:
+        _read_executor = ThreadPoolExecutor(max_workers=DB_READ_WORKERS, thread_name_prefix='db-read')
+    return _read_executor
+
+
+def get_circulation_executor():
+    """Return the thread pool that runs ``circulate_db`` work"""
+    global _circulation_executor
+    if _circulation_executor is None:
+        _circulation_executor = ThreadPoolExecutor(max_workers=CIRCULATION_WORKERS,
+                                                   thread_name_prefix='db-circulation')
+    return _circulation_executor
+
+
+def shutdown_executor():
+    global _read_executor, _circulation_executor
+    for executor in (_read_executor, _circulation_executor):
+        if executor is not None:
+            executor.shutdown(wait=True)
+    _read_executor = _circulation_executor = None
+    with _circulation_lock:
+        for conn in _circulation_connections:
+            conn.close()
+        _circulation_connections.clear()
+
+
+def _run_unit_of_work(fn, args, kwargs):
+    operation = getattr(fn, '__name__', 'unknown')
+    requested = time.perf_counter()
+    with read_connection() as conn:
+        start = time.perf_counter()
+        DB_POOL_WAIT.observe(start - requested, 'read')
+        try:
+            result = fn(conn, *args, **kwargs)
+            if conn.in_transaction:
+                conn.commit()
+            return result
+        except Exception as error:
+            # Units of work may turn a busy error into an HTTPException (503);
+            # the original error is still the exception's context.
+            cause = error
+            while cause is not None and not isinstance(cause, sqlite3.OperationalError):
+                cause = cause.__cause__ or cause.__context__
+            if cause is not None and is_busy_error(cause):
+                DB_BUSY_ERRORS.inc(operation)
+            raise
+        finally:
+            DB_DURATION.observe(time.perf_counter() - start, 'read', operation)
+
+
+async def read_db(fn, *args, **kwargs):
+    """Run ``fn(conn, *args, **kwargs)`` on a read-only pooled connection off the event loop.
+
+    ``fn`` is a plain synchronous function; its exception (including
+    ``HTTPException``) propagates to the caller. The connection is opened
+    with ``mode=ro`` and ``query_only``, so ``fn`` cannot write; each
+    statement reads the latest committed WAL snapshot and never waits for
+    the writer.
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(_run_unit_of_work, fn, args, kwargs)
+    # Run in a copy of the caller's context so request-scoped values such as
+    # the request ID are visible to code (and logging) on the DB thread.
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_read_executor(), context.run, call)
+
+
+def _circulation_connection():
+    conn = getattr(_circulation, 'conn', None)
+    if conn is None:
+        conn = _circulation.conn = get_write_connection()
+        with _circulation_lock:
+            _circulation_connections.append(conn)
+    return conn
+
+
+def run_circulation(fn, args, kwargs):
+    """What ``circulate_db`` runs on a circulation thread"""
+    operation = getattr(fn, '__name__', 'unknown')
+    start = time.perf_counter()
+    try:
+        return write_transaction(_circulation_connection(), fn, *args, **kwargs)
+    finally:
+        DB_DURATION.observe(time.perf_counter() - start, 'circulation', operation)
+
+
+async def circulate_db(fn, *args, **kwargs):
+    """Run ``fn(conn, *args, **kwargs)`` in a write transaction of its own, off the writer.
+
+    For borrows and returns. When a title is hot, a copy is free again only
+    once its holder's return commits; on the writer that return waits for a
+    group commit shared with everything queued meanwhile. Here each unit of
+    work takes the lock itself with ``write_transaction`` (jittered retry,
+    then WriteBusy), on a circulation thread's own write connection.
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(run_circulation, fn, args, kwargs)
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_circulation_executor(), context.run, call)
+
+
+def begin_immediate(conn, operation):
+    """BEGIN IMMEDIATE, retrying a busy lock with jittered backoff; raises WriteBusy.
+
+    Each attempt waits for the lock as long as the connection's busy timeout,
+    so write connections are opened with WRITE_BUSY_TIMEOUT_MS rather than
+    switching the PRAGMA back and forth around every transaction.
+    """
+    for attempt in range(WRITE_RETRIES + 1):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            return
+        except sqlite3.OperationalError as error:
+            if not is_busy_error(error):
+                raise
+            if attempt == WRITE_RETRIES:
+                DB_BUSY_ERRORS.inc(operation)
+                raise WriteBusy(f'Write lock not granted after {WRITE_RETRIES} retries') from error
+        DB_BUSY_RETRIES.inc(operation)
+        # Full jitter, so writers that collided do not retry in lockstep.
+        time.sleep(random.uniform(0, min(WRITE_BACKOFF_MAX, WRITE_BACKOFF * 2 ** attempt)))
+
+
+def get_write_connection():
+    """A connection of its own for ``write_transaction``, with the short write busy timeout"""
+    return get_db_connection(WRITE_BUSY_TIMEOUT_MS)
+
+
+def write_transaction(conn, fn, *args, **kwargs):
+    """Run ``fn(conn, *args, **kwargs)`` in a write transaction and commit it.
+
+    The write lock is taken up front with BEGIN IMMEDIATE. A lock that is not
+    granted within the connection's busy timeout (WRITE_BUSY_TIMEOUT_MS on a
+    connection from ``get_write_connection``) is retried with jittered
+    exponential backoff; ``WriteBusy`` is raised once WRITE_RETRIES are used up. If ``fn``
+    raises, everything it wrote is rolled back. When the caller already has a
+    transaction open, ``fn`` simply runs inside it.
+    """
+    if conn.in_transaction:
+        return fn(conn, *args, **kwargs)
+    begin_immediate(conn, getattr(fn, '__name__', 'unknown'))
+    try:
+        result = fn(conn, *args, **kwargs)
+        conn.commit()
+        return result
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def fetch_all(conn, query, params=()):
+    """Unit of work for a single read: ``await read_db(fetch_all, sql, params)``."""
+    return conn.execute(query, params).fetchall()
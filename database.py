@@ -2,29 +2,74 @@
 
 import sqlite3
 import bcrypt
-from datetime import datetime, timedelta
+from datetime import datetime
 import os
-import random
+from urllib.request import pathname2url
 
-DATABASE_NAME = 'library.db'
+DATABASE_NAME = os.environ.get('DB_PATH', 'library.db')
+BUSY_TIMEOUT_MS = 30000
+# Read connections: memory-mapped I/O and a page cache per connection (in KiB).
+READ_MMAP_SIZE = int(os.environ.get('DB_READ_MMAP_SIZE', str(256 * 1024 * 1024)))
+READ_CACHE_SIZE_KB = int(os.environ.get('DB_READ_CACHE_SIZE_KB', str(64 * 1024)))
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
 
+# Everything about a student except the password hash.
+STUDENT_COLUMNS = 'id, registration_no, username, name, email, phone, role, borrowed_books, fine_amount, accrued_fine, created_at'
 
-def get_db_connection():
-    """Get database connection with optimized settings for concurrency."""
-    conn = sqlite3.connect(DATABASE_NAME, timeout=30, check_same_thread=False)
+
+def configure_connection(conn, busy_timeout_ms=BUSY_TIMEOUT_MS):
+    """Apply the per-connection settings every library connection needs."""
     conn.row_factory = sqlite3.Row
     try:
         conn.execute("PRAGMA journal_mode=WAL;")
-        conn.execute("PRAGMA busy_timeout = 30000;")
+        conn.execute(f"PRAGMA busy_timeout = {busy_timeout_ms};")
         conn.execute("PRAGMA synchronous = NORMAL;")
     except Exception as e:
         print(f"Warning: Could not set PRAGMA: {e}", flush=True)
     return conn
 
 
-def hash_password(password):
-    """Hash password using bcrypt"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+def configure_read_connection(conn):
+    """Settings for a read-only connection: reads only, tuned for large scans."""
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS};")
+    conn.execute("PRAGMA query_only = ON;")
+    conn.execute(f"PRAGMA mmap_size = {READ_MMAP_SIZE};")
+    conn.execute(f"PRAGMA cache_size = -{READ_CACHE_SIZE_KB};")
+    conn.execute("PRAGMA temp_store = MEMORY;")
+    return conn
+
+
+def get_db_connection(busy_timeout_ms=BUSY_TIMEOUT_MS):
+    """Get database connection with optimized settings for concurrency."""
+    conn = sqlite3.connect(DATABASE_NAME, timeout=30, check_same_thread=False)
+    return configure_connection(conn, busy_timeout_ms)
+
+
+def get_read_connection(database=DATABASE_NAME):
+    """Read-only connection (``mode=ro``); it never takes the write lock."""
+    uri = f"file:{pathname2url(os.path.abspath(database))}?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, timeout=30, check_same_thread=False)
+    return configure_read_connection(conn)
+
+
+def to_epoch(value):
+    """Whole seconds since the epoch for an ISO timestamp or datetime.
+
+    Naive values are local time, which is how borrow, due and return dates
+    are written (``datetime.now()``). None stays None.
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return int(value.timestamp())
+
+
+def hash_password(password, rounds=None):
+    """Hash password using bcrypt with the configured work factor"""
+    salt = bcrypt.gensalt(rounds or BCRYPT_ROUNDS)
+    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
 
 
 def verify_password(password, hashed):
@@ -32,43 +77,53 @@ def verify_password(password, hashed):
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
 
-def generate_registration_number():
-    """Generate unique 8-digit registration number"""
-    conn = get_db_connection()
-    try:
-        while True:
-            reg_no = str(random.randint(10000000, 99999999))
-            existing = conn.execute('SELECT id FROM students WHERE registration_no = ?', (reg_no,)).fetchone()
-            if not existing:
-                return reg_no
-    finally:
-        conn.close()
-
-
-def get_next_transaction_id():
-    """Generate next transaction ID in form TXN0001 based on highest id."""
-    conn = get_db_connection()
-    try:
-        last_id_row = conn.execute('SELECT MAX(id) as max_id FROM transactions').fetchone()
-        max_id = last_id_row['max_id'] if last_id_row else None
-        if not max_id:
-            next_num = 1
-        else:
-            next_num = int(max_id) + 1
-        return f'TXN{str(next_num).zfill(4)}'
-    finally:
-        conn.close()
+DEFAULT_ADMINS = [
+    ('admin', 'admin123', 'System Administrator'),
+    ('librarian', 'lib@2025', 'Library Staff'),
+]
+DEFAULT_STUDENTS = [
+    ('Rahul Kumar', 'rahul.kumar', 'pass123', 'rahul.kumar@college.edu', '9876543210'),
+    ('Priya Sharma', 'priya.sharma', 'pass123', 'priya.sharma@college.edu', '9876543211'),
+    ('Amit Patel', 'amit.patel', 'pass123', 'amit.patel@college.edu', '9876543212'),
+]
+DEFAULT_BOOKS = [
+    ('Harry Potter and the Philosopher\'s Stone', 'J.K. Rowling', '9780439708180', 309, 12.99, 'Fantasy', 5),
+    ('The Hobbit', 'J.R.R. Tolkien', '9780547928227', 310, 10.99, 'Fantasy', 3),
+    ('1984', 'George Orwell', '9780451524935', 328, 9.99, 'Fiction', 4),
+    ('To Kill a Mockingbird', 'Harper Lee', '9780061120084', 324, 11.99, 'Fiction', 6),
+    ('Pride and Prejudice', 'Jane Austen', '9780141439518', 279, 8.99, 'Romance', 4),
+    ('The Great Gatsby', 'F. Scott Fitzgerald', '9780743273565', 180, 10.50, 'Fiction', 5),
+]
+
+
+def add_default_data(repos):
+    """Add the default admins, students and books through the repositories"""
+    for username, password, name in DEFAULT_ADMINS:
+        repos.admins.add(username, hash_password(password), name)
+    hashed = {}
+    for name, username, password, email, phone in DEFAULT_STUDENTS:
+        if password not in hashed:
+            hashed[password] = hash_password(password)
+        repos.students.add(username, hashed[password], name, email, phone)
+    repos.books.add_many(DEFAULT_BOOKS)
 
 
 def init_database():
     """Initialize database with tables and default data"""
+    from migrations import run_migrations
+    from repositories import SqliteRepositories
+
     conn = get_db_connection()
     cursor = conn.cursor()
 
     cursor.execute('DROP TABLE IF EXISTS transactions')
+    cursor.execute('DROP TABLE IF EXISTS books_fts')
+    cursor.execute('DROP TABLE IF EXISTS students_fts')
     cursor.execute('DROP TABLE IF EXISTS books')
     cursor.execute('DROP TABLE IF EXISTS students')
     cursor.execute('DROP TABLE IF EXISTS admins')
+    cursor.execute('DROP TABLE IF EXISTS library_stats')
+    cursor.execute('DROP TABLE IF EXISTS sequences')
 
     cursor.execute('''
         CREATE TABLE admins (
@@ -130,47 +185,10 @@ def init_database():
         )
     ''')
 
-    admin_password = hash_password('admin123')
-    librarian_password = hash_password('lib@2025')
+    conn.execute('PRAGMA user_version = 0')
+    run_migrations(conn)
 
-    cursor.execute('''
-        INSERT INTO admins (username, password, name, role)
-        VALUES (?, ?, ?, ?)
-    ''', ('admin', admin_password, 'System Administrator', 'admin'))
-
-    cursor.execute('''
-        INSERT INTO admins (username, password, name, role)
-        VALUES (?, ?, ?, ?)
-    ''', ('librarian', librarian_password, 'Library Staff', 'admin'))
-
-    default_students = [
-        ('Rahul Kumar', 'rahul.kumar', 'pass123', 'rahul.kumar@college.edu', '9876543210'),
-        ('Priya Sharma', 'priya.sharma', 'pass123', 'priya.sharma@college.edu', '9876543211'),
-        ('Amit Patel', 'amit.patel', 'pass123', 'amit.patel@college.edu', '9876543212'),
-    ]
-
-    student_password = hash_password('pass123')
-
-    for name, username, _, email, phone in default_students:
-        reg_no = generate_registration_number()
-        cursor.execute('''
-            INSERT INTO students (registration_no, username, password, name, email, phone, role)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (reg_no, username, student_password, name, email, phone, 'student'))
-
-    default_books = [
-        ('Harry Potter and the Philosopher\'s Stone', 'J.K. Rowling', '9780439708180', 309, 12.99, 'Fantasy', 5, 5),
-        ('The Hobbit', 'J.R.R. Tolkien', '9780547928227', 310, 10.99, 'Fantasy', 3, 3),
-        ('1984', 'George Orwell', '9780451524935', 328, 9.99, 'Fiction', 4, 4),
-        ('To Kill a Mockingbird', 'Harper Lee', '9780061120084', 324, 11.99, 'Fiction', 6, 6),
-        ('Pride and Prejudice', 'Jane Austen', '9780141439518', 279, 8.99, 'Romance', 4, 4),
-        ('The Great Gatsby', 'F. Scott Fitzgerald', '9780743273565', 180, 10.50, 'Fiction', 5, 5),
-    ]
-
-    cursor.executemany('''
-        INSERT INTO books (title, author, isbn, pages, price, category, quantity, available)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', default_books)
+    add_default_data(SqliteRepositories(conn))
 
     conn.commit()
     conn.close()
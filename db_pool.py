@@ -0,0 +1,223 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from database import DATABASE_NAME, configure_connection, get_read_connection
+
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '8'))
+READ_POOL_SIZE = int(os.environ.get('DB_READ_POOL_SIZE', str(POOL_SIZE)))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '30'))
+HEALTH_CHECK_INTERVAL = float(os.environ.get('DB_POOL_HEALTH_CHECK_INTERVAL', '30'))
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection became free within the timeout."""
+
+
+class ConnectionPool:
+    """Fixed-size pool of pre-configured SQLite connections.
+
+    Connections are opened lazily up to ``size`` and the PRAGMAs are applied
+    once when a connection is created, not on every checkout. A connection
+    that has been idle for longer than ``health_check_interval`` seconds is
+    probed with ``SELECT 1`` before it is handed out and replaced if broken.
+    With ``readonly`` the connections are opened with ``mode=ro`` and the
+    read tuning from ``configure_read_connection``.
+    """
+
+    def __init__(self, database=DATABASE_NAME, size=POOL_SIZE, timeout=POOL_TIMEOUT,
+                 health_check_interval=HEALTH_CHECK_INTERVAL, readonly=False):
+        self.database = database
+        self.readonly = readonly
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._closed = False
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'connections_opened': 0,
+            'connections_replaced': 0,
+            'health_checks': 0,
+        }
+
+    def _connect(self):
+        if self.readonly:
+            conn = get_read_connection(self.database)
+        else:
+            conn = sqlite3.connect(self.database, timeout=30, check_same_thread=False)
+            configure_connection(conn)
+        with self._lock:
+            self._stats['connections_opened'] += 1
+        return conn
+
+    def _is_healthy(self, conn):
+        with self._lock:
+            self._stats['health_checks'] += 1
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def acquire(self):
+        """Check out a connection, waiting up to ``timeout`` seconds for one."""
+        if self._closed:
+            raise RuntimeError('Connection pool is closed')
+
+        entry = None
+        try:
+            entry = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._created < self.size
+                if can_open:
+                    self._created += 1
+            if can_open:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+                entry = (conn, time.monotonic())
+            else:
+                with self._lock:
+                    self._stats['waits'] += 1
+                try:
+                    entry = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._stats['timeouts'] += 1
+                    raise PoolTimeout(f'No database connection available after {self.timeout}s')
+
+        conn, idle_since = entry
+        if time.monotonic() - idle_since > self.health_check_interval and not self._is_healthy(conn):
+            self._discard(conn)
+            try:
+                conn = self._connect()
+            except Exception:
+                # The broken connection's slot is free again.
+                with self._lock:
+                    self._created -= 1
+                raise
+            with self._lock:
+                self._stats['connections_replaced'] += 1
+
+        with self._lock:
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool, rolling back any open transaction."""
+        with self._lock:
+            self._in_use -= 1
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            with self._lock:
+                self._created -= 1
+            return
+        if self._closed:
+            self._discard(conn)
+            with self._lock:
+                self._created -= 1
+            return
+        self._idle.put((conn, time.monotonic()))
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'size': self.size,
+                'open': self._created,
+                'in_use': self._in_use,
+                'idle': self._idle.qsize(),
+            })
+        return stats
+
+    def close(self):
+        """Close all idle connections; checked-out ones are closed on release."""
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+            with self._lock:
+                self._created -= 1
+
+
+_pool = None
+_read_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def get_read_pool():
+    """Return the process-wide read-only pool, creating it on first use."""
+    global _read_pool
+    if _read_pool is None:
+        with _pool_lock:
+            if _read_pool is None:
+                _read_pool = ConnectionPool(size=READ_POOL_SIZE, readonly=True)
+    return _read_pool
+
+
+def close_pool():
+    """Close both pools."""
+    global _pool, _read_pool
+    with _pool_lock:
+        for pool in (_pool, _read_pool):
+            if pool is not None:
+                pool.close()
+        _pool = _read_pool = None
+
+
+@contextmanager
+def db_connection():
+    """Borrow a pooled connection for the duration of a ``with`` block."""
+    with get_pool().connection() as conn:
+        yield conn
+
+
+@contextmanager
+def read_connection():
+    """Borrow a read-only pooled connection for the duration of a ``with`` block."""
+    with get_read_pool().connection() as conn:
+        yield conn
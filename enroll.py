@@ -0,0 +1,153 @@
+"""Bulk student enrollment from a roster file.
+
+The roster is read in batches. For each batch, usernames that are already
+taken are dropped first, so no bcrypt time is spent on them. The remaining
+passwords are then hashed across the hashing process pool. Finally the
+batch is inserted in one storage write, together with a block of
+registration numbers. Every roster line produces one result record as soon
+as its batch is done; students missing a password get a generated one,
+and it is returned only in that result.
+"""
+import asyncio
+import json
+import secrets
+import sys
+
+from book_import import detect_format, iter_records, text_field
+
+# Roster rows per write unit of work.
+ENROLL_BATCH_SIZE = 256
+REQUIRED_FIELDS = ('username', 'name', 'email', 'phone')
+
+
+def generate_password():
+    return secrets.token_urlsafe(9)
+
+
+def clean_roster_record(record):
+    """Validate one roster record; returns (username, password, name, email, phone)"""
+    if not isinstance(record, dict):
+        raise ValueError('Expected a JSON object')
+    username = text_field(record, 'username', required=True)
+    name = text_field(record, 'name', required=True)
+    email = text_field(record, 'email', required=True)
+    phone = text_field(record, 'phone', required=True)
+    # Passwords are taken verbatim; an empty one means generate a password.
+    password = record.get('password')
+    password = str(password) if password not in (None, '') else None
+    return (username, password, name, email, phone)
+
+
+def iter_roster(stream, fmt):
+    """Roster rows parsed from an upload, as ``(line, row, error)``"""
+    return iter_records(stream, fmt, clean_roster_record, REQUIRED_FIELDS)
+
+
+def taken_usernames(repos, usernames):
+    """The subset of ``usernames`` already used by a student or an admin"""
+    return repos.students.existing_usernames(usernames) | repos.admins.existing_usernames(usernames)
+
+
+def insert_students(repos, students):
+    """Insert prepared (username, hashed, name, email, phone) rows as one unit of work.
+
+    Usernames are checked again in the write, since one may have been
+    registered while the batch was hashing. Returns {username: registration_no}
+    for the students inserted.
+    """
+    taken = taken_usernames(repos, [student[0] for student in students])
+    fresh = [student for student in students if student[0] not in taken]
+    numbers = repos.students.add_many(fresh)
+    return {student[0]: number for number, student in zip(numbers, fresh)}
+
+
+async def enroll_batch(batch, storage, hasher):
+    """Enroll one batch of (line, row) pairs; returns a result record per line.
+
+    ``storage`` runs the lookups and the insert (see repositories.py) and
+    ``hasher`` is a PasswordHasher.
+    """
+    results = {}
+    taken = await storage.read(taken_usernames, list({row[0] for _, row in batch}))
+    pending, seen = [], set()
+    for line, row in batch:
+        username = row[0]
+        if username in taken:
+            results[line] = {'line': line, 'status': 'error', 'error': f'Username {username} already exists'}
+        elif username in seen:
+            results[line] = {'line': line, 'status': 'error', 'error': f'Username {username} appears earlier in the file'}
+        else:
+            seen.add(username)
+            pending.append((line, row, row[1] is None))
+
+    passwords = [row[1] or generate_password() for _, row, _ in pending]
+    hashes = await hasher.hash_many(passwords)
+    numbers = await storage.write(insert_students, [
+        (row[0], hashed) + row[2:] for (_, row, _), hashed in zip(pending, hashes)
+    ])
+
+    for (line, row, generated), password in zip(pending, passwords):
+        username = row[0]
+        if username in numbers:
+            results[line] = {
+                'line': line,
+                'status': 'enrolled',
+                'username': username,
+                'registration_no': numbers[username],
+                'password': password if generated else None,
+            }
+        else:
+            results[line] = {'line': line, 'status': 'error', 'error': f'Username {username} already exists'}
+    return [results[line] for line, _ in batch]
+
+
+async def enroll_students(rows, storage, hasher, batch_size=ENROLL_BATCH_SIZE):
+    """Enroll every roster row, yielding one result record per line in file order.
+
+    Ends with ``{'summary': {...}}``. Batches that committed stay enrolled if
+    a later one fails.
+    """
+    summary = {'rows': 0, 'enrolled': 0, 'errors': 0}
+    rows = iter(rows)
+
+    def next_batch():
+        batch = []
+        for line, row, error in rows:
+            batch.append((line, row, error))
+            if len(batch) >= batch_size:
+                break
+        return batch
+
+    while True:
+        batch = await asyncio.to_thread(next_batch)
+        if not batch:
+            break
+        valid = [(line, row) for line, row, error in batch if error is None]
+        enrolled = iter(await enroll_batch(valid, storage, hasher) if valid else [])
+        for line, row, error in batch:
+            result = next(enrolled) if error is None else {'line': line, 'status': 'error', 'error': error}
+            summary['rows'] += 1
+            summary['enrolled' if result['status'] == 'enrolled' else 'errors'] += 1
+            yield result
+    yield {'summary': summary}
+
+
+async def _main(path):
+    from hashing import password_hasher
+    from repositories import SqliteStorage
+
+    storage = SqliteStorage()
+    try:
+        with open(path, 'rb') as roster:
+            async for result in enroll_students(iter_roster(roster, detect_format(path)), storage, password_hasher):
+                print(json.dumps(result), flush=True)
+    finally:
+        password_hasher.shutdown()
+        storage.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('usage: python enroll.py <roster.csv|roster.jsonl> > credentials.ndjson')
+        sys.exit(2)
+    asyncio.run(_main(sys.argv[1]))
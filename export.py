@@ -0,0 +1,58 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, time, timedelta
+from itertools import islice
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+EXPORT_MEDIA_TYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+# Rows encoded per chunk written to the client.
+EXPORT_FETCH_SIZE = 1000
+
+
+def _encode_csv(rows, header=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(header)
+    writer.writerows(rows)
+    return buffer.getvalue().encode('utf-8')
+
+
+def _encode_ndjson(rows, columns):
+    return ''.join(json.dumps(dict(zip(columns, row))) + '\n' for row in rows).encode('utf-8')
+
+
+def export_transactions(repos, fmt='csv', date_from=None, date_to=None, compress=False):
+    """Stream the transaction ledger as encoded chunks of CSV or NDJSON.
+
+    A generator unit of work for ``storage.stream``. ``date_from`` and
+    ``date_to`` are inclusive dates matched against the borrow time. Rows are
+    read EXPORT_FETCH_SIZE at a time from ``repos.transactions.ledger()``, so
+    memory holds a single chunk and the first bytes go out as soon as the
+    first chunk is read. With ``compress`` the stream is a gzip file.
+    """
+    borrowed_from = datetime.combine(date_from, time.min) if date_from is not None else None
+    borrowed_before = datetime.combine(date_to + timedelta(days=1), time.min) if date_to is not None else None
+    columns, rows = repos.transactions.ledger(borrowed_from, borrowed_before)
+    rows = iter(rows)
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def emit(data):
+        if compressor is None:
+            return data
+        # Sync-flush every chunk so compressed bytes reach the client as each
+        # chunk is read instead of waiting for zlib's window to fill.
+        return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    if fmt == 'csv':
+        yield emit(_encode_csv([], header=columns))
+    while True:
+        chunk = list(islice(rows, EXPORT_FETCH_SIZE))
+        if not chunk:
+            break
+        yield emit(_encode_csv(chunk) if fmt == 'csv' else _encode_ndjson(chunk, columns))
+    if compressor:
+        yield compressor.flush()
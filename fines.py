@@ -0,0 +1,105 @@
+"""Fine rules and the batch accrual job.
+
+A fine is charged on return: FINE_PER_DAY for every whole day past due.
+Between returns, the accrual job brings ``students.accrued_fine`` up to what
+each student's open overdue loans have run up so far, and stores the library
+total in ``library_stats``. A loan's own accrued fine is a pure function of
+its due_ts, so it is computed inside the pass rather than stored: the whole
+job is one grouped aggregate over the (status, due_ts, student_id) index and
+an UPDATE of the students whose total changed.
+"""
+import os
+import sys
+import time
+
+FINE_PER_DAY = 10
+SECONDS_PER_DAY = 86400
+# Seconds between accrual runs in the API process; 0 turns the job off.
+FINE_ACCRUAL_INTERVAL = int(os.environ.get('FINE_ACCRUAL_INTERVAL', '3600'))
+
+ACCRUAL_SCHEMA = [
+    'ALTER TABLE students ADD COLUMN accrued_fine REAL NOT NULL DEFAULT 0',
+    'ALTER TABLE library_stats ADD COLUMN accrued_fines REAL NOT NULL DEFAULT 0',
+    'ALTER TABLE library_stats ADD COLUMN fines_accrued_at INTEGER',
+    # Covers the accrual aggregate; its (status, due_ts) prefix still serves
+    # the overdue listing, so it replaces that index.
+    'CREATE INDEX IF NOT EXISTS idx_transactions_status_due_student ON transactions(status, due_ts, student_id)',
+    'DROP INDEX IF EXISTS idx_transactions_status_due_ts',
+]
+
+# The fine a loan has accrued at epoch ``:now``; the same floor rule as
+# days_overdue().
+ACCRUED_FINE_SQL = f'((:now - due_ts) / {SECONDS_PER_DAY}) * {FINE_PER_DAY}'
+
+
+def days_overdue(due_ts, now_ts):
+    """Whole days past due; the overdue listing uses the same rule in SQL"""
+    return max(0, now_ts - due_ts) // SECONDS_PER_DAY
+
+
+def create_accrual_columns(conn):
+    for statement in ACCRUAL_SCHEMA:
+        conn.execute(statement)
+
+
+def accrue_fines(conn, now_ts=None):
+    """Bring every student's accrued fine up to ``now_ts`` in the caller's write transaction.
+
+    Returns {'overdue_loans', 'students_updated', 'total_accrued', 'accrued_at'}.
+    """
+    now_ts = int(time.time()) if now_ts is None else int(now_ts)
+    params = {'now': now_ts}
+    students = conn.execute(
+        f'''UPDATE students SET accrued_fine = totals.amount
+            FROM (SELECT student_id, SUM({ACCRUED_FINE_SQL}) AS amount FROM transactions
+                  WHERE status = 'borrowed' AND due_ts < :now
+                  GROUP BY student_id) AS totals
+            WHERE students.id = totals.student_id AND students.accrued_fine != totals.amount''',
+        params
+    ).rowcount
+    # Students whose overdue loans have all been returned since the last run.
+    students += conn.execute(
+        '''UPDATE students SET accrued_fine = 0
+           WHERE accrued_fine != 0 AND id NOT IN (
+               SELECT student_id FROM transactions WHERE status = 'borrowed' AND due_ts < :now)''',
+        params
+    ).rowcount
+    loans = conn.execute(
+        "SELECT COUNT(*) FROM transactions WHERE status = 'borrowed' AND due_ts < :now", params
+    ).fetchone()[0]
+    total = conn.execute('SELECT COALESCE(SUM(accrued_fine), 0) FROM students').fetchone()[0]
+    conn.execute(
+        'UPDATE library_stats SET accrued_fines = ?, fines_accrued_at = ? WHERE id = 1',
+        (total, now_ts)
+    )
+    return {'overdue_loans': loans, 'students_updated': students, 'total_accrued': total, 'accrued_at': now_ts}
+
+
+def release_accrued_fine(conn, student_id, due_ts):
+    """Take a returned loan out of the accrued totals.
+
+    The loan leaves the student's total and the library total at the amount
+    the last accrual run counted for it; the fine actually charged is booked
+    separately into ``fine_amount``.
+    """
+    accrued_at = conn.execute('SELECT fines_accrued_at FROM library_stats WHERE id = 1').fetchone()[0]
+    amount = days_overdue(due_ts, accrued_at) * FINE_PER_DAY if accrued_at else 0
+    if amount:
+        conn.execute('UPDATE students SET accrued_fine = MAX(accrued_fine - ?, 0) WHERE id = ?', (amount, student_id))
+        conn.execute('UPDATE library_stats SET accrued_fines = MAX(accrued_fines - ?, 0) WHERE id = 1', (amount,))
+
+
+if __name__ == '__main__':
+    from data_access import write_transaction
+    from database import get_db_connection
+
+    if sys.argv[1:] not in ([], ['accrue']):
+        print('usage: python fines.py [accrue]')
+        sys.exit(2)
+    conn = get_db_connection()
+    try:
+        result = write_transaction(conn, accrue_fines)
+        print(f"Accrued fines over {result['overdue_loans']} overdue loans: "
+              f"{result['students_updated']} students updated, {result['total_accrued']} outstanding")
+    finally:
+        conn.close()
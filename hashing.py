@@ -0,0 +1,122 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from database import BCRYPT_ROUNDS, hash_password, verify_password
+from metrics import HASH_DURATION
+
+HASH_WORKERS = int(os.environ.get('HASH_WORKERS', str(os.cpu_count() or 1)))
+# Jobs allowed to wait for a free worker before new ones are turned away.
+HASH_QUEUE_LIMIT = int(os.environ.get('HASH_QUEUE_LIMIT', '256'))
+
+
+# Passwords per worker job in hash_many: enough to amortise the pickling
+# round trip, few enough that a login queued behind a bulk job is not kept
+# waiting for long.
+HASH_MANY_CHUNK = int(os.environ.get('HASH_MANY_CHUNK', '8'))
+
+
+def worker_start_method():
+    """forkserver where the platform has it (not Windows), otherwise spawn.
+
+    Not fork: the app process already runs the writer and pool threads, and
+    a forked child could inherit a lock one of them held.
+    """
+    return 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def hash_passwords(passwords, rounds):
+    return [hash_password(password, rounds) for password in passwords]
+
+
+class HashingBusy(Exception):
+    """Raised when the admission queue is full and a hash job is rejected."""
+
+
+class PasswordHasher:
+    """bcrypt hashing and verification on a pool of worker processes.
+
+    bcrypt is CPU-bound, so running it in processes lets a login burst use
+    every core instead of one. Admission is bounded: at most ``workers`` jobs
+    run while up to ``queue_limit`` more wait their turn; anything beyond that
+    fails fast with ``HashingBusy`` instead of piling up until clients time out.
+    Must be used from the event loop thread.
+    """
+
+    def __init__(self, workers=HASH_WORKERS, queue_limit=HASH_QUEUE_LIMIT, rounds=BCRYPT_ROUNDS):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.rounds = rounds
+        self._executor = None
+        self._pending = 0
+        self._stats = {'hashed': 0, 'verified': 0, 'rejected': 0}
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context(worker_start_method()))
+        return self._executor
+
+    async def _submit(self, fn, *args):
+        if self._pending >= self.workers + self.queue_limit:
+            self._stats['rejected'] += 1
+            raise HashingBusy('Password hashing queue is full')
+        return await self._run(fn, *args)
+
+    async def _run(self, fn, *args):
+        self._pending += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self._pending -= 1
+            HASH_DURATION.observe(time.perf_counter() - start, fn.__name__)
+
+    async def hash(self, password):
+        hashed = await self._submit(hash_password, password, self.rounds)
+        self._stats['hashed'] += 1
+        return hashed
+
+    async def hash_many(self, passwords):
+        """Hash a batch of passwords on every worker; returns hashes in order.
+
+        The batch is split into jobs of HASH_MANY_CHUNK passwords and at most
+        ``workers`` of them are in flight at once, so a bulk job never fills
+        the admission queue and logins still get a worker between chunks.
+        """
+        chunks = [passwords[i:i + HASH_MANY_CHUNK] for i in range(0, len(passwords), HASH_MANY_CHUNK)]
+        hashed = []
+        for start in range(0, len(chunks), self.workers):
+            window = chunks[start:start + self.workers]
+            results = await asyncio.gather(*(self._run(hash_passwords, chunk, self.rounds) for chunk in window))
+            for result in results:
+                hashed.extend(result)
+        self._stats['hashed'] += len(hashed)
+        return hashed
+
+    async def verify(self, password, hashed):
+        result = await self._submit(verify_password, password, hashed)
+        self._stats['verified'] += 1
+        return result
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats.update({
+            'workers': self.workers,
+            'queue_limit': self.queue_limit,
+            'rounds': self.rounds,
+            'running': min(self._pending, self.workers),
+            'queued': max(0, self._pending - self.workers),
+        })
+        return stats
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
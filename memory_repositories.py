@@ -0,0 +1,639 @@
+"""The repositories of repositories.py on plain dicts, for tests and benchmarks.
+
+Every table is a dict of rows by id plus the indexes its queries need: a
+dict per unique column and sorted lists of ``(key..., id)`` tuples searched
+with bisect, the in-memory counterpart of SQLite's B-tree indexes. Partial
+indexes (open loans only) simply leave other rows out.
+
+A ``MemoryStore`` serializes units of work with one lock. Every change
+records how to undo itself, so a unit of work that raises, or a savepoint
+that is rolled back, leaves the store as it was. Nothing is persisted.
+
+    storage = MemoryStorage()
+    await storage.write(fn, ...)   # same contract as SqliteStorage
+
+``STORAGE=memory`` runs the API on one (see repositories.create_storage).
+"""
+import bisect
+import re
+import threading
+import time
+import unicodedata
+from contextlib import contextmanager
+
+from allocators import format_transaction_id, permute_registration_number
+from database import to_epoch
+from fines import FINE_PER_DAY, SECONDS_PER_DAY, days_overdue
+from pagination import MAX_PAGE_SIZE, decode_cursor, encode_cursor
+from repositories import (
+    BOOK_COLUMNS,
+    STUDENT_UPDATE_COLUMNS,
+    AdminsRepo,
+    BooksRepo,
+    DuplicateKey,
+    StudentsRepo,
+    TransactionsRepo,
+)
+from search import DEFAULT_SEARCH_LIMIT, MIN_PREFIX_LENGTH, RANK_CANDIDATES, TRIGRAM_MIN_LENGTH, normalize_isbn
+
+# Default values, in the column order of the SQLite tables.
+BOOK_DEFAULTS = {'title': None, 'author': None, 'isbn': None, 'pages': None, 'price': None,
+                 'category': None, 'quantity': 1, 'available': 1}
+STUDENT_DEFAULTS = {'registration_no': None, 'username': None, 'password': None, 'name': None, 'email': None,
+                    'phone': None, 'role': 'student', 'borrowed_books': 0, 'fine_amount': 0.0}
+TRANSACTION_DEFAULTS = {'transaction_id': None, 'student_id': None, 'student_registration_no': None,
+                        'book_id': None, 'borrow_date': None, 'due_date': None, 'return_date': None,
+                        'status': 'borrowed', 'fine_amount': 0.0}
+ADMIN_DEFAULTS = {'username': None, 'password': None, 'name': None, 'role': 'admin'}
+
+# Column weights for ranking matches; the same as the bm25 weights in search.py.
+BOOK_WEIGHTS = (('title', 10.0), ('author', 5.0), ('isbn', 1.0))
+STUDENT_WEIGHTS = (('name', 5.0), ('email', 2.0), ('username', 3.0))
+STUDENT_PUBLIC = ('id', 'registration_no', 'username', 'name', 'email', 'phone', 'role', 'borrowed_books',
+                  'fine_amount', 'accrued_fine', 'created_at')
+
+_HIGHEST = '\U0010ffff'
+
+
+def _now_timestamp():
+    # The format of SQLite's CURRENT_TIMESTAMP.
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+
+
+def _fold(text):
+    """Lower-case and strip diacritics, like the unicode61 tokenizer"""
+    decomposed = unicodedata.normalize('NFKD', str(text or '').casefold())
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def _words(text):
+    return re.findall(r'\w+', _fold(text))
+
+
+class Table:
+    """Rows by id, with unique and sorted indexes kept in step"""
+
+    def __init__(self, store, defaults, unique=(), indexes=None, trailing=None):
+        self.store = store
+        self.defaults = defaults
+        # Columns the SQLite table adds after created_at (by later migrations).
+        self.trailing = trailing or {}
+        self.rows = {}
+        self.next_id = 1
+        self.unique = {column: {} for column in unique}
+        self.keys = indexes or {}
+        self.indexes = {name: [] for name in self.keys}
+
+    @property
+    def columns(self):
+        """Column names in the order of the SQLite table"""
+        return ['id', *self.defaults, 'created_at', *self.trailing]
+
+    def get(self, row_id):
+        row = self.rows.get(row_id)
+        return dict(row) if row is not None else None
+
+    def find(self, column, value):
+        row_id = self.unique[column].get(value)
+        return self.get(row_id) if row_id is not None else None
+
+    def range(self, index, low, high):
+        """Index entries with low <= entry < high, in index order"""
+        entries = self.indexes[index]
+        return entries[bisect.bisect_left(entries, low):bisect.bisect_left(entries, high)]
+
+    def insert(self, values):
+        row = {'id': self.next_id, **self.defaults, 'created_at': _now_timestamp(), **self.trailing}
+        row.update(values)
+        self._check_unique(row)
+        self.next_id += 1
+        self._put(row)
+        self.store.on_rollback(lambda: self._remove(row['id']))
+        return dict(row)
+
+    def update(self, row_id, changes):
+        old = self.rows.get(row_id)
+        if old is None:
+            return None
+        new = {**old, **changes}
+        self._check_unique(new)
+        self._replace(old, new)
+        self.store.on_rollback(lambda: self._replace(new, old))
+        return dict(new)
+
+    def delete(self, row_id):
+        old = self.rows.get(row_id)
+        if old is not None:
+            self._remove(row_id)
+            self.store.on_rollback(lambda: self._put(old))
+
+    def _check_unique(self, row):
+        for column, index in self.unique.items():
+            holder = index.get(row[column])
+            if holder is not None and holder != row['id']:
+                raise DuplicateKey(f'UNIQUE constraint failed: {column}')
+
+    def _put(self, row):
+        self.rows[row['id']] = row
+        self._index(row)
+
+    def _remove(self, row_id):
+        self._unindex(self.rows.pop(row_id))
+
+    def _replace(self, old, new):
+        # In place, so the rows dict stays in id (insertion) order.
+        self._unindex(old)
+        self.rows[new['id']] = new
+        self._index(new)
+
+    def _index(self, row):
+        for column, index in self.unique.items():
+            index[row[column]] = row['id']
+        for name, key in self.keys.items():
+            entry = key(row)
+            if entry is not None:
+                bisect.insort(self.indexes[name], entry + (row['id'],))
+
+    def _unindex(self, row):
+        for column, index in self.unique.items():
+            del index[row[column]]
+        for name, key in self.keys.items():
+            entry = key(row)
+            if entry is not None:
+                entries = self.indexes[name]
+                del entries[bisect.bisect_left(entries, entry + (row['id'],))]
+
+
+def _open(key):
+    """Index only loans that are still open"""
+    return lambda row: key(row) if row['status'] == 'borrowed' else None
+
+
+class MemoryStore:
+    def __init__(self):
+        self.books = Table(self, BOOK_DEFAULTS, unique=('isbn',), indexes={
+            'created': lambda row: (row['created_at'],),
+            'title': lambda row: (row['title'],),
+        })
+        self.students = Table(self, STUDENT_DEFAULTS, unique=('username', 'registration_no'), indexes={
+            'created': lambda row: (row['created_at'],),
+            'username': lambda row: (row['username'],),
+            'registration_no': lambda row: (row['registration_no'],),
+        }, trailing={'accrued_fine': 0.0})
+        self.transactions = Table(self, TRANSACTION_DEFAULTS, unique=('transaction_id',), indexes={
+            'created': lambda row: (row['created_at'],),
+            'student': lambda row: (row['student_id'], row['created_at']),
+            'open_due': _open(lambda row: (row['due_ts'],)),
+            'open_student': _open(lambda row: (row['student_id'], row['borrow_date'])),
+            'open_book': _open(lambda row: (row['book_id'],)),
+            'open_pair': _open(lambda row: (row['student_id'], row['book_id'])),
+        }, trailing={'borrow_ts': None, 'due_ts': None, 'return_ts': None})
+        self.admins = Table(self, ADMIN_DEFAULTS, unique=('username',))
+        self.counters = {'transaction': 0, 'registration_no': 0, 'total_fines': 0.0,
+                         'accrued_fines': 0.0, 'fines_accrued_at': None}
+        self.repositories = MemoryRepositories(self)
+        self._lock = threading.RLock()
+        self._undo = []
+        self._depth = 0
+
+    def on_rollback(self, undo):
+        self._undo.append(undo)
+
+    def set(self, counter, value):
+        """Set a counter in the current transaction"""
+        old = self.counters[counter]
+        self.counters[counter] = value
+        self.on_rollback(lambda: self.counters.__setitem__(counter, old))
+
+    def bump(self, counter, amount):
+        """Add to a counter in the current transaction; returns the new value"""
+        old = self.counters[counter]
+        self.counters[counter] = old + amount
+        self.on_rollback(lambda: self.counters.__setitem__(counter, old))
+        return old + amount
+
+    @contextmanager
+    def transaction(self):
+        """Hold the store for a unit of work; if the block raises, undo what it wrote.
+
+        Nested use acts as a savepoint: only the inner block is undone.
+        """
+        with self._lock:
+            mark = len(self._undo)
+            self._depth += 1
+            try:
+                yield self.repositories
+            except BaseException:
+                while len(self._undo) > mark:
+                    self._undo.pop()()
+                raise
+            finally:
+                self._depth -= 1
+                if not self._depth:
+                    self._undo.clear()
+
+    def run(self, fn, *args, **kwargs):
+        """Run ``fn(repos, *args, **kwargs)`` as one transaction"""
+        with self.transaction() as repos:
+            return fn(repos, *args, **kwargs)
+
+
+def _newest_first(table, limit, cursor, shape=dict):
+    """A keyset page over the table's (created_at, id) index, rows passed through ``shape``"""
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    entries = table.indexes['created']
+    end = len(entries)
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        end = bisect.bisect_left(entries, (created_at, row_id))
+    rows = []
+    for position in range(end - 1, -1, -1):
+        row = shape(table.rows[entries[position][-1]])
+        if row is not None:
+            rows.append(row)
+            if len(rows) > limit:
+                break
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+    return rows, next_cursor
+
+
+class MemoryBooksRepo(BooksRepo):
+    def __init__(self, store):
+        self.store = store
+        self.table = store.books
+
+    def get(self, book_id):
+        return self.table.get(book_id)
+
+    def find_by_isbn_or_title(self, isbn, title):
+        found = self.table.find('isbn', isbn)
+        if found is None:
+            matches = self.table.range('title', (title,), (title, float('inf')))
+            found = self.table.get(matches[0][-1]) if matches else None
+        return found
+
+    def list_all(self):
+        return [dict(self.table.rows[entry[-1]]) for entry in reversed(self.table.indexes['created'])]
+
+    def list_page(self, limit, cursor=None):
+        return _newest_first(self.table, limit, cursor)
+
+    def list_by_title(self):
+        return [dict(self.table.rows[entry[-1]]) for entry in self.table.indexes['title']]
+
+    def search(self, text, limit=DEFAULT_SEARCH_LIMIT):
+        isbn = normalize_isbn(text)
+        if len(isbn) == 13 and isbn.isdigit():
+            found = self.table.find('isbn', isbn)
+            if found is not None:
+                return [found]
+
+        terms = _words(text)
+        if not terms:
+            return []
+        whole, prefix = set(terms[:-1]), terms[-1]
+        if len(prefix) < MIN_PREFIX_LENGTH:
+            # As in search.to_fts_query: too short to be a prefix, so a whole word.
+            whole.add(prefix)
+            prefix = None
+
+        def matches(word):
+            return word in whole or (prefix is not None and word.startswith(prefix))
+
+        def contains_query(words):
+            return whole <= words and (prefix is None or any(word.startswith(prefix) for word in words))
+
+        hits = []
+        for row in reversed(self.table.rows.values()):
+            columns = {column: _words(row[column]) for column, _ in BOOK_WEIGHTS}
+            if not contains_query({word for values in columns.values() for word in values}):
+                continue
+            score = sum(weight for column, weight in BOOK_WEIGHTS if any(map(matches, columns[column])))
+            hits.append((score, row))
+        if len(hits) > RANK_CANDIDATES:
+            # Too broad to rank, as in search.py: title matches, then the rest, newest first.
+            hits.sort(key=lambda hit: not contains_query(set(_words(hit[1]['title']))))
+        else:
+            hits.sort(key=lambda hit: -hit[0])
+        return [dict(row) for _, row in hits[:limit]]
+
+    def existing_isbns(self, isbns):
+        return {isbn for isbn in isbns if isbn in self.table.unique['isbn']}
+
+    def add(self, title, author, isbn, pages, price, category, quantity):
+        return self.table.insert({'title': title, 'author': author, 'isbn': isbn, 'pages': pages, 'price': price,
+                                  'category': category, 'quantity': quantity, 'available': quantity})
+
+    def add_many(self, books):
+        for book in books:
+            self.add(*book)
+
+    def update(self, book_id, changes):
+        _check_columns('books', BOOK_COLUMNS, changes)
+        return self.table.update(book_id, changes)
+
+    def delete(self, book_id):
+        self.table.delete(book_id)
+
+    def take_copy(self, book_id):
+        row = self.table.rows.get(book_id)
+        if row is None or row['available'] <= 0:
+            return None
+        self.table.update(book_id, {'available': row['available'] - 1})
+        return {'id': row['id'], 'title': row['title'], 'author': row['author']}
+
+    def return_copy(self, book_id):
+        row = self.table.rows.get(book_id)
+        if row is not None:
+            self.table.update(book_id, {'available': row['available'] + 1})
+
+
+class MemoryStudentsRepo(StudentsRepo):
+    def __init__(self, store):
+        self.store = store
+        self.table = store.students
+
+    def get(self, student_id):
+        return self.table.get(student_id)
+
+    def get_by_username(self, username):
+        return self.table.find('username', username)
+
+    def list_all(self):
+        return [_public(self.table.rows[entry[-1]]) for entry in reversed(self.table.indexes['created'])]
+
+    def list_page(self, limit, cursor=None):
+        return _newest_first(self.table, limit, cursor, _public)
+
+    def search(self, text, limit=DEFAULT_SEARCH_LIMIT):
+        text = text.strip()
+        if not text:
+            return []
+        results, seen = [], set()
+
+        def add(rows):
+            for row in rows:
+                if row['id'] not in seen and len(results) < limit:
+                    seen.add(row['id'])
+                    results.append(_public(row))
+
+        add(row for row in (self.table.find('registration_no', text), self.table.find('username', text)) if row)
+
+        if len(text) >= TRIGRAM_MIN_LENGTH:
+            needle = text.casefold()
+            hits = []
+            for row in reversed(self.table.rows.values()):
+                score = sum(weight for column, weight in STUDENT_WEIGHTS if needle in row[column].casefold())
+                if score:
+                    hits.append((score, row))
+            hits.sort(key=lambda hit: -hit[0])
+            add(row for _, row in hits)
+        else:
+            for column in ('username', 'registration_no'):
+                entries = self.table.range(column, (text,), (text + _HIGHEST,))
+                add(self.table.rows[entry[-1]] for entry in entries[:limit])
+        return results
+
+    def existing_usernames(self, usernames):
+        return {username for username in usernames if username in self.table.unique['username']}
+
+    def add(self, username, password, name, email, phone):
+        # Same permuted sequence as allocators.allocate_registration_numbers().
+        while True:
+            registration_no = permute_registration_number(self.store.bump('registration_no', 1))
+            if self.table.find('registration_no', registration_no) is None:
+                break
+        return self.table.insert({'registration_no': registration_no, 'username': username, 'password': password,
+                                  'name': name, 'email': email, 'phone': phone})
+
+    def add_many(self, students):
+        return [self.add(*student)['registration_no'] for student in students]
+
+    def update(self, student_id, changes):
+        _check_columns('students', STUDENT_UPDATE_COLUMNS, changes)
+        return self.table.update(student_id, changes)
+
+    def delete(self, student_id):
+        self.table.delete(student_id)
+
+    def take_borrow_slot(self, student_id, limit):
+        row = self.table.rows.get(student_id)
+        if row is None or row['borrowed_books'] >= limit:
+            return None
+        row = self.table.update(student_id, {'borrowed_books': row['borrowed_books'] + 1})
+        return {'registration_no': row['registration_no'], 'name': row['name'],
+                'borrowed_books': row['borrowed_books']}
+
+    def release_borrow_slot(self, student_id, fine_amount):
+        row = self.table.rows.get(student_id)
+        if row is not None:
+            self.table.update(student_id, {'borrowed_books': row['borrowed_books'] - 1,
+                                           'fine_amount': row['fine_amount'] + fine_amount})
+
+    def release_accrued_fine(self, student_id, due_ts):
+        accrued_at = self.store.counters['fines_accrued_at']
+        amount = days_overdue(due_ts, accrued_at) * FINE_PER_DAY if accrued_at else 0
+        row = self.table.rows.get(student_id)
+        if amount and row is not None:
+            self.table.update(student_id, {'accrued_fine': max(row['accrued_fine'] - amount, 0)})
+            self.store.bump('accrued_fines', -min(amount, self.store.counters['accrued_fines']))
+
+
+class MemoryTransactionsRepo(TransactionsRepo):
+    def __init__(self, store):
+        self.store = store
+        self.table = store.transactions
+
+    def _ledger_row(self, row):
+        # An inner join: loans of a deleted book or student are left out.
+        student = self.store.students.rows.get(row['student_id'])
+        book = self.store.books.rows.get(row['book_id'])
+        if student is None or book is None:
+            return None
+        return {**row, 'student_name': student['name'], 'registration_no': student['registration_no'],
+                'book_title': book['title']}
+
+    def _with_book(self, row, **columns):
+        book = self.store.books.rows.get(row['book_id'])
+        if book is None:
+            return None
+        return {**row, **{alias: book[column] for alias, column in columns.items()}}
+
+    def get(self, transaction_id):
+        return self.table.get(transaction_id)
+
+    def list_all(self):
+        rows = (self._ledger_row(self.table.rows[entry[-1]]) for entry in reversed(self.table.indexes['created']))
+        return [row for row in rows if row is not None]
+
+    def list_page(self, limit, cursor=None):
+        return _newest_first(self.table, limit, cursor, self._ledger_row)
+
+    def ledger(self, borrowed_from=None, borrowed_before=None):
+        columns = self.table.columns + ['student_name', 'registration_no', 'book_title']
+        low, high = to_epoch(borrowed_from), to_epoch(borrowed_before)
+        rows = []
+        for row in self.table.rows.values():
+            if (low is not None and row['borrow_ts'] < low) or (high is not None and row['borrow_ts'] >= high):
+                continue
+            row = self._ledger_row(row)
+            if row is not None:
+                rows.append(tuple(row[column] for column in columns))
+        return columns, rows
+
+    def overdue(self, now_ts):
+        rows = []
+        for entry in self.table.range('open_due', (float('-inf'),), (now_ts,)):
+            row = self._ledger_row(self.table.rows[entry[-1]])
+            if row is not None:
+                row['days_overdue'] = (now_ts - row['due_ts']) // SECONDS_PER_DAY
+                rows.append(row)
+        return rows
+
+    def open_for_student(self, student_id):
+        entries = self.table.range('open_student', (student_id,), (student_id, _HIGHEST))
+        rows = (self._with_book(self.table.rows[entry[-1]], book_title='title', book_author='author', isbn='isbn')
+                for entry in reversed(entries))
+        return [row for row in rows if row is not None]
+
+    def history_for_student(self, student_id):
+        entries = self.table.range('student', (student_id,), (student_id, _HIGHEST))
+        rows = (self._with_book(self.table.rows[entry[-1]], title='title', author='author')
+                for entry in reversed(entries))
+        return [row for row in rows if row is not None]
+
+    def has_open_loans(self, book_id=None, student_id=None):
+        if book_id is not None:
+            return bool(self.table.range('open_book', (book_id,), (book_id + 1,)))
+        return bool(self.table.range('open_student', (student_id,), (student_id + 1,)))
+
+    def reserve_codes(self, count):
+        last = self.store.bump('transaction', count)
+        return [format_transaction_id(number) for number in range(last - count + 1, last + 1)]
+
+    def open_loan(self, student_id, registration_no, book_id, borrow_date, due_date, transaction_code=None):
+        if transaction_code is None:
+            transaction_code = format_transaction_id(self.store.bump('transaction', 1))
+        if self.table.range('open_pair', (student_id, book_id), (student_id, book_id + 1)):
+            return None
+        row = self.table.insert({
+            'transaction_id': transaction_code, 'student_id': student_id,
+            'student_registration_no': registration_no, 'book_id': book_id,
+            'borrow_date': borrow_date.isoformat(), 'due_date': due_date.isoformat(),
+            'borrow_ts': to_epoch(borrow_date), 'due_ts': to_epoch(due_date),
+        })
+        return {'id': row['id'], 'transaction_id': transaction_code}
+
+    def close_loan(self, transaction_id, student_id, return_date):
+        row = self.table.rows.get(transaction_id)
+        if row is None or row['status'] != 'borrowed' or (student_id is not None and row['student_id'] != student_id):
+            return None
+        now_ts = to_epoch(return_date)
+        fine = float(days_overdue(row['due_ts'], now_ts) * FINE_PER_DAY)
+        self.table.update(transaction_id, {'status': 'returned', 'return_date': return_date.isoformat(),
+                                           'return_ts': now_ts, 'fine_amount': fine})
+        self.store.bump('total_fines', fine)
+        return {'book_id': row['book_id'], 'student_id': row['student_id'], 'due_ts': row['due_ts'],
+                'fine_amount': fine}
+
+
+class MemoryAdminsRepo(AdminsRepo):
+    def __init__(self, store):
+        self.table = store.admins
+
+    def get_by_username(self, username):
+        return self.table.find('username', username)
+
+    def existing_usernames(self, usernames):
+        return {username for username in usernames if username in self.table.unique['username']}
+
+    def add(self, username, password, name, role='admin'):
+        return self.table.insert({'username': username, 'password': password, 'name': name, 'role': role})
+
+
+class MemoryRepositories:
+    def __init__(self, store):
+        self.store = store
+        self.books = MemoryBooksRepo(store)
+        self.students = MemoryStudentsRepo(store)
+        self.transactions = MemoryTransactionsRepo(store)
+        self.admins = MemoryAdminsRepo(store)
+
+    def savepoint(self):
+        return self.store.transaction()
+
+    def stats(self, now_ts):
+        transactions = self.store.transactions
+        return {
+            'total_books': len(self.store.books.rows),
+            'total_students': len(self.store.students.rows),
+            'active_borrows': len(transactions.indexes['open_due']),
+            'total_transactions': len(transactions.rows),
+            'total_fines': self.store.counters['total_fines'],
+            'accrued_fines': self.store.counters['accrued_fines'],
+            'fines_accrued_at': self.store.counters['fines_accrued_at'],
+            'overdue_books': bisect.bisect_left(transactions.indexes['open_due'], (now_ts,)),
+        }
+
+    def accrue_fines(self, now_ts):
+        """fines.accrue_fines over the open-loans-by-due index"""
+        totals = {}
+        overdue = self.store.transactions.range('open_due', (float('-inf'),), (now_ts,))
+        for entry in overdue:
+            row = self.store.transactions.rows[entry[-1]]
+            totals[row['student_id']] = totals.get(row['student_id'], 0) + days_overdue(row['due_ts'], now_ts) * FINE_PER_DAY
+        students = self.store.students
+        updated = 0
+        for student_id, row in list(students.rows.items()):
+            amount = totals.get(student_id, 0)
+            if row['accrued_fine'] != amount:
+                students.update(student_id, {'accrued_fine': float(amount)})
+                updated += 1
+        total = float(sum(row['accrued_fine'] for row in students.rows.values()))
+        self.store.set('accrued_fines', total)
+        self.store.set('fines_accrued_at', now_ts)
+        return {'overdue_loans': len(overdue), 'students_updated': updated, 'total_accrued': total,
+                'accrued_at': now_ts}
+
+
+def _public(row):
+    return {column: row[column] for column in STUDENT_PUBLIC}
+
+
+def _check_columns(table, columns, changes):
+    unknown = set(changes) - set(columns)
+    if unknown:
+        raise ValueError(f"Cannot update {table} column(s): {', '.join(sorted(unknown))}")
+
+
+class MemoryStorage:
+    """Runs repository units of work against a MemoryStore.
+
+    Units of work run inline on the event loop: everything is in memory, so
+    there is nothing to wait for but the store's lock.
+    """
+
+    name = 'memory'
+
+    def __init__(self, store=None):
+        self.store = store or MemoryStore()
+
+    async def read(self, fn, *args, **kwargs):
+        return self.store.run(fn, *args, **kwargs)
+
+    async def write(self, fn, *args, **kwargs):
+        return self.store.run(fn, *args, **kwargs)
+
+    async def circulate(self, fn, *args, **kwargs):
+        return self.store.run(fn, *args, **kwargs)
+
+    def stream(self, fn, *args, **kwargs):
+        # The store's lock cannot be held across the threads a streaming
+        # response is iterated on, so the whole stream is produced at once.
+        yield from self.store.run(lambda repos: list(fn(repos, *args, **kwargs)))
+
+    def close(self):
+        pass
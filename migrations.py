@@ -0,0 +1,116 @@
+"""Versioned schema migrations.
+
+Each migration has a version number, a description and a function that takes
+a connection. The highest applied version is stored in the database header
+(``PRAGMA user_version``), so checking whether anything is pending is a single
+header read. Every migration runs in its own transaction together with the
+version bump: it either applies completely or not at all.
+
+Add new migrations at the end of MIGRATIONS with the next version number;
+never edit one that has shipped.
+"""
+from allocators import create_registration_sequence, create_sequences_table
+from database import to_epoch
+from fines import create_accrual_columns
+from search import create_books_search_generation, create_books_search_index, create_students_search_index, normalize_isbn
+from stats import create_stats_table
+
+
+def _transaction_indexes(conn):
+    # Open borrows per student, open borrows per book, and the overdue scan.
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_student_status ON transactions(student_id, status)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_book_status ON transactions(book_id, status)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_status_due ON transactions(status, due_date)')
+
+
+def _listing_indexes(conn):
+    # Keyset pagination for the admin listings: newest first, ties broken by id.
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_books_created_at ON books(created_at, id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_students_created_at ON students(created_at, id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_created_at ON transactions(created_at, id)')
+
+
+def _transaction_timestamps(conn):
+    # Epoch-second copies of the ISO date columns. The overdue check becomes
+    # an integer range scan on (status, due_ts) instead of parsing every row.
+    for column in ('borrow_ts', 'due_ts', 'return_ts'):
+        conn.execute(f'ALTER TABLE transactions ADD COLUMN {column} INTEGER')
+    conn.create_function('to_epoch', 1, to_epoch, deterministic=True)
+    conn.execute(
+        '''UPDATE transactions SET borrow_ts = to_epoch(borrow_date),
+                                   due_ts = to_epoch(due_date),
+                                   return_ts = to_epoch(return_date)'''
+    )
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_status_due_ts ON transactions(status, due_ts)')
+    conn.execute('DROP INDEX IF EXISTS idx_transactions_status_due')
+
+
+def _normalize_isbns(conn):
+    # The add-book form used to store ISBNs as typed (978-0-...). Store the
+    # bare digits the importer and the search use; a row whose bare ISBN is
+    # already taken keeps its spelling rather than fail the migration.
+    conn.create_function('normalize_isbn', 1, normalize_isbn, deterministic=True)
+    conn.execute('UPDATE OR IGNORE books SET isbn = normalize_isbn(isbn) WHERE isbn != normalize_isbn(isbn)')
+
+
+def _borrow_time_index(conn):
+    # The ledger export's date range, as an integer range scan on borrow_ts.
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_borrow_ts ON transactions(borrow_ts)')
+
+
+MIGRATIONS = [
+    (1, 'transaction hot-path indexes', _transaction_indexes),
+    (2, 'keyset pagination indexes', _listing_indexes),
+    (3, 'books full-text search index', create_books_search_index),
+    (4, 'students trigram search index', create_students_search_index),
+    (5, 'incrementally maintained dashboard counters', create_stats_table),
+    (6, 'in-transaction sequence allocator', create_sequences_table),
+    (7, 'permuted registration number sequence', create_registration_sequence),
+    (8, 'epoch timestamps and overdue index', _transaction_timestamps),
+    (9, 'accrued fine columns', create_accrual_columns),
+    (10, 'book search cache generation', create_books_search_generation),
+    (11, 'bare-digit ISBNs', _normalize_isbns),
+    (12, 'ledger export borrow time index', _borrow_time_index),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def run_migrations(conn):
+    """Apply every pending migration; returns [(version, description), ...] applied"""
+    if current_version(conn) >= LATEST_VERSION:
+        return []
+
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Re-read under the write lock in case another process migrated first.
+            if current_version(conn) >= version:
+                conn.rollback()
+                continue
+            migrate(conn)
+            conn.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append((version, description))
+    return applied
+
+
+if __name__ == '__main__':
+    from database import get_db_connection
+
+    conn = get_db_connection()
+    try:
+        applied = run_migrations(conn)
+        for version, description in applied:
+            print(f'Applied migration {version}: {description}')
+        print(f'Schema is at version {current_version(conn)}')
+    finally:
+        conn.close()
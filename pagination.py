@@ -0,0 +1,55 @@
+import base64
+import json
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client sends a cursor we did not issue."""
+
+
+def encode_cursor(*values):
+    """Pack the sort key of the last row on a page into an opaque token."""
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size=2):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError) as e:
+        raise InvalidCursor('Malformed cursor') from e
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor('Malformed cursor')
+    # Only what encode_cursor writes for a sort key: a JSON string or number.
+    if not all(isinstance(value, (str, int, float)) and not isinstance(value, bool) for value in values):
+        raise InvalidCursor('Malformed cursor')
+    return values
+
+
+def fetch_page(conn, select, sort_column, id_column, limit, cursor=None, params=()):
+    """Fetch one page of ``select`` ordered newest first by (sort_column, id_column).
+
+    ``select`` is a query without WHERE/ORDER BY/LIMIT. Pages continue strictly
+    after the cursor's row, so with an index on (sort_column, id) every page is
+    a bounded index range scan no matter how deep the client has paged.
+    Returns ``(rows, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    query = select
+    params = list(params)
+    if cursor:
+        query += f' WHERE ({sort_column}, {id_column}) < (?, ?)'
+        params.extend(decode_cursor(cursor))
+    query += f' ORDER BY {sort_column} DESC, {id_column} DESC LIMIT ?'
+    params.append(limit + 1)
+
+    rows = conn.execute(query, params).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last[sort_column.split('.')[-1]], last[id_column.split('.')[-1]])
+    return rows, next_cursor
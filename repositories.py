@@ -0,0 +1,649 @@
+"""Storage behind the API: repositories for books, students and loans.
+
+Routes and the circulation rules never build SQL themselves. A unit of
+work is a plain function ``fn(repos, *args)`` that talks to the repositories
+in ``repos`` (``repos.books``, ``repos.students``, ``repos.transactions``,
+``repos.admins``) and is handed to a storage backend:
+
+    await storage.read(fn, ...)        a read-only snapshot
+    await storage.write(fn, ...)       one write transaction, rolled back if fn raises
+    await storage.circulate(fn, ...)   the same, for a borrow or return of a hot title
+    storage.stream(fn, ...)            iterate a generator unit of work, for downloads
+
+``SqliteStorage`` is the production backend: reads run on the read-only
+pool (``data_access.read_db``), writes on the group-committing writer
+thread (``writer.write_db``), and borrows and returns of a contended
+title in a write transaction of their own (``data_access.circulate_db``),
+so that its few copies do not wait for group commits.
+``memory_repositories`` has the same repositories on dicts and sorted
+indexes, for tests and benchmarks; ``test_repository_conformance`` checks
+that both behave the same.
+``create_storage()`` picks the backend from the STORAGE environment
+variable (``sqlite`` or ``memory``), so the whole API can run in memory.
+
+BooksRepo, StudentsRepo, TransactionsRepo and AdminsRepo are abstract base
+classes, so a backend that leaves a method out fails when it is built, not
+halfway through a request.
+
+Rows come back as mappings keyed by column name (``sqlite3.Row`` here,
+dicts in memory); ``dict(row)`` works on either. The bulk jobs (book
+import, roster enrollment, fine accrual, the ledger export) go through the
+storage too, a batch per unit of work.
+"""
+import functools
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+from allocators import (
+    LOOKUP_CHUNK,
+    allocate_registration_numbers,
+    allocate_transaction_ids,
+    generate_registration_number,
+)
+from data_access import circulate_db, read_db, shutdown_executor
+from database import STUDENT_COLUMNS, get_read_connection, to_epoch
+from db_pool import close_pool
+from fines import FINE_PER_DAY, SECONDS_PER_DAY, accrue_fines, release_accrued_fine
+from pagination import fetch_page
+from search import DEFAULT_SEARCH_LIMIT, search_books, search_students
+from writer import shutdown_writer, write_db
+
+# Storage backend for the API: 'sqlite' or 'memory' (see create_storage).
+STORAGE_BACKEND = os.environ.get('STORAGE', 'sqlite')
+
+BOOK_COLUMNS = ('title', 'author', 'isbn', 'pages', 'price', 'category', 'quantity', 'available')
+STUDENT_UPDATE_COLUMNS = ('name', 'email', 'phone', 'password')
+
+# The fine for a loan returned at epoch ``:now``: days_overdue() * FINE_PER_DAY.
+RETURN_FINE_SQL = f'(MAX(0, :now - due_ts) / {SECONDS_PER_DAY}) * {FINE_PER_DAY}'
+
+LEDGER_SELECT = '''SELECT t.*, s.name as student_name, s.registration_no, b.title as book_title
+                   FROM transactions t
+                   JOIN students s ON t.student_id = s.id
+                   JOIN books b ON t.book_id = b.id'''
+
+
+class DuplicateKey(Exception):
+    """Raised when an insert or update would repeat a unique value (ISBN, username, ...)"""
+
+
+class BooksRepo(ABC):
+    @abstractmethod
+    def get(self, book_id):
+        """The book row, or None"""
+
+    @abstractmethod
+    def find_by_isbn_or_title(self, isbn, title):
+        """Any book with this ISBN or exactly this title, or None"""
+
+    @abstractmethod
+    def list_all(self):
+        """Every book, newest first (created_at, id)"""
+
+    @abstractmethod
+    def list_page(self, limit, cursor=None):
+        """One keyset page of ``list_all()``; returns (rows, next_cursor)"""
+
+    @abstractmethod
+    def list_by_title(self):
+        """Every book in title order, for the student catalog"""
+
+    @abstractmethod
+    def search(self, text, limit=DEFAULT_SEARCH_LIMIT):
+        """Exact ISBN match, else books matching every word (the last one as a prefix)"""
+
+    @abstractmethod
+    def existing_isbns(self, isbns):
+        """The subset of ``isbns`` already in the catalog"""
+
+    @abstractmethod
+    def add(self, title, author, isbn, pages, price, category, quantity):
+        """Insert a book with every copy available; returns the new row"""
+
+    @abstractmethod
+    def add_many(self, books):
+        """Insert (title, author, isbn, pages, price, category, quantity) rows, every copy available"""
+
+    @abstractmethod
+    def update(self, book_id, changes):
+        """Apply ``{column: value}`` (columns from BOOK_COLUMNS); returns the row, or None"""
+
+    @abstractmethod
+    def delete(self, book_id):
+        ...
+
+    @abstractmethod
+    def take_copy(self, book_id):
+        """Take one available copy; returns {'id', 'title', 'author'}, or None if there is none"""
+
+    @abstractmethod
+    def return_copy(self, book_id):
+        ...
+
+
+class StudentsRepo(ABC):
+    @abstractmethod
+    def get(self, student_id):
+        """The full student row, password hash included, or None"""
+
+    @abstractmethod
+    def get_by_username(self, username):
+        ...
+
+    @abstractmethod
+    def list_all(self):
+        """Every student without the password column, newest first"""
+
+    @abstractmethod
+    def list_page(self, limit, cursor=None):
+        ...
+
+    @abstractmethod
+    def search(self, text, limit=DEFAULT_SEARCH_LIMIT):
+        """Exact registration number or username first, then substring (or, under
+        three characters, prefix) matches; no password column"""
+
+    @abstractmethod
+    def existing_usernames(self, usernames):
+        """The subset of ``usernames`` already used by a student"""
+
+    @abstractmethod
+    def add(self, username, password, name, email, phone):
+        """Insert a student with a freshly allocated registration number; returns the row"""
+
+    @abstractmethod
+    def add_many(self, students):
+        """Insert (username, password, name, email, phone) rows with a block of
+        registration numbers; returns the numbers, in order"""
+
+    @abstractmethod
+    def update(self, student_id, changes):
+        """Apply ``{column: value}`` (columns from STUDENT_UPDATE_COLUMNS); returns the row, or None"""
+
+    @abstractmethod
+    def delete(self, student_id):
+        ...
+
+    @abstractmethod
+    def take_borrow_slot(self, student_id, limit):
+        """Count one more borrowed book if the student is under ``limit``.
+
+        Returns {'registration_no', 'name', 'borrowed_books'} after the
+        increment, or None if the student is unknown or at the limit.
+        """
+
+    @abstractmethod
+    def release_borrow_slot(self, student_id, fine_amount):
+        """One borrowed book fewer, and ``fine_amount`` added to the student's fines"""
+
+    @abstractmethod
+    def release_accrued_fine(self, student_id, due_ts):
+        """Take a returned loan out of the accrued fine totals (see fines.py)"""
+
+
+class TransactionsRepo(ABC):
+    @abstractmethod
+    def get(self, transaction_id):
+        ...
+
+    @abstractmethod
+    def list_all(self):
+        """The ledger, newest first, with student_name, registration_no and book_title"""
+
+    @abstractmethod
+    def list_page(self, limit, cursor=None):
+        ...
+
+    @abstractmethod
+    def ledger(self, borrowed_from=None, borrowed_before=None):
+        """The ledger in id order, for export: returns (columns, rows).
+
+        Rows are tuples in ``columns`` order, with the columns of
+        ``list_all()``; ``rows`` may be a cursor, read lazily. With
+        ``borrowed_from`` / ``borrowed_before`` (datetimes) only loans
+        borrowed in that half-open range are included.
+        """
+
+    @abstractmethod
+    def overdue(self, now_ts):
+        """Open loans due before ``now_ts``, earliest due first, with days_overdue"""
+
+    @abstractmethod
+    def open_for_student(self, student_id):
+        """A student's open loans, latest borrow first, with book_title, book_author and isbn"""
+
+    @abstractmethod
+    def history_for_student(self, student_id):
+        """All of a student's loans, newest first, with title and author"""
+
+    @abstractmethod
+    def has_open_loans(self, book_id=None, student_id=None):
+        """True if any loan of the book (or by the student) is still open"""
+
+    @abstractmethod
+    def reserve_codes(self, count):
+        """Allocate ``count`` transaction codes at once, for ``open_loan(transaction_code=...)``"""
+
+    @abstractmethod
+    def open_loan(self, student_id, registration_no, book_id, borrow_date, due_date, transaction_code=None):
+        """Record a new loan with ``transaction_code``, or else the next code.
+
+        Returns {'id', 'transaction_id'}, or None if the student already has
+        this book on loan.
+        """
+
+    @abstractmethod
+    def close_loan(self, transaction_id, student_id, return_date):
+        """Mark an open loan returned and charge its fine.
+
+        With ``student_id`` the loan must belong to that student. Returns
+        {'book_id', 'student_id', 'due_ts', 'fine_amount'}, or None if there
+        is no such open loan.
+        """
+
+
+class AdminsRepo(ABC):
+    @abstractmethod
+    def get_by_username(self, username):
+        ...
+
+    @abstractmethod
+    def existing_usernames(self, usernames):
+        """The subset of ``usernames`` already used by an admin"""
+
+    @abstractmethod
+    def add(self, username, password, name, role='admin'):
+        ...
+
+
+class SqliteBooksRepo(BooksRepo):
+    def __init__(self, conn):
+        self.conn = conn
+
+    def get(self, book_id):
+        return self.conn.execute('SELECT * FROM books WHERE id = ?', (book_id,)).fetchone()
+
+    def find_by_isbn_or_title(self, isbn, title):
+        return self.conn.execute('SELECT * FROM books WHERE isbn = ? OR title = ?', (isbn, title)).fetchone()
+
+    def list_all(self):
+        return self.conn.execute('SELECT * FROM books ORDER BY created_at DESC, id DESC').fetchall()
+
+    def list_page(self, limit, cursor=None):
+        return fetch_page(self.conn, 'SELECT * FROM books', 'created_at', 'id', limit, cursor)
+
+    def list_by_title(self):
+        return self.conn.execute('SELECT * FROM books ORDER BY title ASC, id ASC').fetchall()
+
+    def search(self, text, limit=DEFAULT_SEARCH_LIMIT):
+        return search_books(self.conn, text, limit)
+
+    def existing_isbns(self, isbns):
+        return _existing(self.conn, 'books', 'isbn', isbns)
+
+    def add(self, title, author, isbn, pages, price, category, quantity):
+        try:
+            return _returning(
+                self.conn,
+                '''INSERT INTO books (title, author, isbn, pages, price, category, quantity, available)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?) RETURNING *''',
+                (title, author, isbn, pages, price, category, quantity, quantity)
+            )
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKey(str(e)) from e
+
+    def add_many(self, books):
+        try:
+            self.conn.executemany(
+                '''INSERT INTO books (title, author, isbn, pages, price, category, quantity, available)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                (tuple(book) + (book[6],) for book in books)
+            )
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKey(str(e)) from e
+
+    def update(self, book_id, changes):
+        if changes:
+            _update(self.conn, 'books', BOOK_COLUMNS, book_id, changes)
+        return self.get(book_id)
+
+    def delete(self, book_id):
+        self.conn.execute('DELETE FROM books WHERE id = ?', (book_id,))
+
+    def take_copy(self, book_id):
+        return _returning(
+            self.conn,
+            'UPDATE books SET available = available - 1 WHERE id = ? AND available > 0 RETURNING id, title, author',
+            (book_id,)
+        )
+
+    def return_copy(self, book_id):
+        self.conn.execute('UPDATE books SET available = available + 1 WHERE id = ?', (book_id,))
+
+
+class SqliteStudentsRepo(StudentsRepo):
+    def __init__(self, conn):
+        self.conn = conn
+
+    def get(self, student_id):
+        return self.conn.execute('SELECT * FROM students WHERE id = ?', (student_id,)).fetchone()
+
+    def get_by_username(self, username):
+        return self.conn.execute('SELECT * FROM students WHERE username = ?', (username,)).fetchone()
+
+    def list_all(self):
+        return self.conn.execute(
+            f'SELECT {STUDENT_COLUMNS} FROM students ORDER BY created_at DESC, id DESC'
+        ).fetchall()
+
+    def list_page(self, limit, cursor=None):
+        return fetch_page(self.conn, f'SELECT {STUDENT_COLUMNS} FROM students', 'created_at', 'id', limit, cursor)
+
+    def search(self, text, limit=DEFAULT_SEARCH_LIMIT):
+        return search_students(self.conn, text, limit)
+
+    def existing_usernames(self, usernames):
+        return _existing(self.conn, 'students', 'username', usernames)
+
+    def add(self, username, password, name, email, phone):
+        registration_no = generate_registration_number(self.conn)
+        try:
+            return _returning(
+                self.conn,
+                '''INSERT INTO students (registration_no, username, password, name, email, phone, role)
+                   VALUES (?, ?, ?, ?, ?, ?, 'student') RETURNING *''',
+                (registration_no, username, password, name, email, phone)
+            )
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKey(str(e)) from e
+
+    def add_many(self, students):
+        numbers = allocate_registration_numbers(self.conn, len(students)) if students else []
+        try:
+            self.conn.executemany(
+                '''INSERT INTO students (registration_no, username, password, name, email, phone, role)
+                   VALUES (?, ?, ?, ?, ?, ?, 'student')''',
+                [(number,) + tuple(student) for number, student in zip(numbers, students)]
+            )
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKey(str(e)) from e
+        return numbers
+
+    def update(self, student_id, changes):
+        if changes:
+            _update(self.conn, 'students', STUDENT_UPDATE_COLUMNS, student_id, changes)
+        return self.get(student_id)
+
+    def delete(self, student_id):
+        self.conn.execute('DELETE FROM students WHERE id = ?', (student_id,))
+
+    def take_borrow_slot(self, student_id, limit):
+        return _returning(
+            self.conn,
+            '''UPDATE students SET borrowed_books = borrowed_books + 1
+               WHERE id = ? AND borrowed_books < ?
+               RETURNING registration_no, name, borrowed_books''',
+            (student_id, limit)
+        )
+
+    def release_borrow_slot(self, student_id, fine_amount):
+        self.conn.execute(
+            'UPDATE students SET borrowed_books = borrowed_books - 1, fine_amount = fine_amount + ? WHERE id = ?',
+            (fine_amount, student_id)
+        )
+
+    def release_accrued_fine(self, student_id, due_ts):
+        release_accrued_fine(self.conn, student_id, due_ts)
+
+
+class SqliteTransactionsRepo(TransactionsRepo):
+    def __init__(self, conn):
+        self.conn = conn
+
+    def get(self, transaction_id):
+        return self.conn.execute('SELECT * FROM transactions WHERE id = ?', (transaction_id,)).fetchone()
+
+    def list_all(self):
+        return self.conn.execute(LEDGER_SELECT + ' ORDER BY t.created_at DESC, t.id DESC').fetchall()
+
+    def list_page(self, limit, cursor=None):
+        return fetch_page(self.conn, LEDGER_SELECT, 't.created_at', 't.id', limit, cursor)
+
+    def ledger(self, borrowed_from=None, borrowed_before=None):
+        query, conditions, params = LEDGER_SELECT, [], []
+        if borrowed_from is not None:
+            conditions.append('t.borrow_ts >= ?')
+            params.append(to_epoch(borrowed_from))
+        if borrowed_before is not None:
+            conditions.append('t.borrow_ts < ?')
+            params.append(to_epoch(borrowed_before))
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        # A date range is an integer range scan on idx_transactions_borrow_ts
+        # that sorts only the matching rows; without one, rowid order streams
+        # straight off the table. Plain tuples: the export writes them as they are.
+        cursor = self.conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(query + ' ORDER BY t.id', params)
+        return [column[0] for column in cursor.description], cursor
+
+    def overdue(self, now_ts):
+        # Range scan on (status, due_ts), already in due order. Integer
+        # division floors exactly like days_overdue().
+        return self.conn.execute(
+            f'''SELECT t.*, s.name as student_name, s.registration_no, b.title as book_title,
+                       (? - t.due_ts) / {SECONDS_PER_DAY} as days_overdue
+                FROM transactions t
+                JOIN students s ON t.student_id = s.id
+                JOIN books b ON t.book_id = b.id
+                WHERE t.status = 'borrowed' AND t.due_ts < ?
+                ORDER BY t.due_ts ASC''',
+            (now_ts, now_ts)
+        ).fetchall()
+
+    def open_for_student(self, student_id):
+        return self.conn.execute(
+            '''SELECT t.*, b.title as book_title, b.author as book_author, b.isbn
+               FROM transactions t
+               JOIN books b ON t.book_id = b.id
+               WHERE t.student_id = ? AND t.status = 'borrowed'
+               ORDER BY t.borrow_date DESC, t.id DESC''',
+            (student_id,)
+        ).fetchall()
+
+    def history_for_student(self, student_id):
+        return self.conn.execute(
+            '''SELECT t.*, b.title, b.author
+               FROM transactions t
+               JOIN books b ON t.book_id = b.id
+               WHERE t.student_id = ?
+               ORDER BY t.created_at DESC, t.id DESC''',
+            (student_id,)
+        ).fetchall()
+
+    def has_open_loans(self, book_id=None, student_id=None):
+        column, value = ('book_id', book_id) if book_id is not None else ('student_id', student_id)
+        return self.conn.execute(
+            f"SELECT 1 FROM transactions WHERE {column} = ? AND status = 'borrowed' LIMIT 1", (value,)
+        ).fetchone() is not None
+
+    def reserve_codes(self, count):
+        return allocate_transaction_ids(self.conn, count)
+
+    def open_loan(self, student_id, registration_no, book_id, borrow_date, due_date, transaction_code=None):
+        if transaction_code is None:
+            [transaction_code] = allocate_transaction_ids(self.conn)
+        # No RETURNING: the row count and lastrowid say the same for less
+        # work on the hottest insert in the app.
+        cursor = self.conn.execute(
+            '''INSERT INTO transactions
+               (transaction_id, student_id, student_registration_no, book_id, borrow_date, due_date, borrow_ts, due_ts, status)
+               SELECT ?, ?, ?, ?, ?, ?, ?, ?, 'borrowed'
+               WHERE NOT EXISTS (
+                   SELECT 1 FROM transactions WHERE student_id = ? AND book_id = ? AND status = 'borrowed')''',
+            (transaction_code, student_id, registration_no, book_id,
+             borrow_date.isoformat(), due_date.isoformat(), to_epoch(borrow_date), to_epoch(due_date),
+             student_id, book_id)
+        )
+        if cursor.rowcount == 0:
+            return None
+        return {'id': cursor.lastrowid, 'transaction_id': transaction_code}
+
+    def close_loan(self, transaction_id, student_id, return_date):
+        return _returning(
+            self.conn,
+            f'''UPDATE transactions
+                SET status = 'returned', return_date = :return_date, return_ts = :now,
+                    fine_amount = {RETURN_FINE_SQL}
+                WHERE id = :id AND status = 'borrowed' AND (:student_id IS NULL OR student_id = :student_id)
+                RETURNING book_id, student_id, due_ts, fine_amount''',
+            {'id': transaction_id, 'student_id': student_id,
+             'return_date': return_date.isoformat(), 'now': to_epoch(return_date)}
+        )
+
+
+class SqliteAdminsRepo(AdminsRepo):
+    def __init__(self, conn):
+        self.conn = conn
+
+    def get_by_username(self, username):
+        return self.conn.execute('SELECT * FROM admins WHERE username = ?', (username,)).fetchone()
+
+    def existing_usernames(self, usernames):
+        return _existing(self.conn, 'admins', 'username', usernames)
+
+    def add(self, username, password, name, role='admin'):
+        try:
+            return _returning(
+                self.conn,
+                'INSERT INTO admins (username, password, name, role) VALUES (?, ?, ?, ?) RETURNING *',
+                (username, password, name, role)
+            )
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKey(str(e)) from e
+
+
+class SqliteRepositories:
+    """The repositories for one connection, plus what spans them"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.books = SqliteBooksRepo(conn)
+        self.students = SqliteStudentsRepo(conn)
+        self.transactions = SqliteTransactionsRepo(conn)
+        self.admins = SqliteAdminsRepo(conn)
+
+    @contextmanager
+    def savepoint(self):
+        """Undo everything written inside the block if it raises; the exception propagates"""
+        self.conn.execute('SAVEPOINT repositories')
+        try:
+            yield self
+        except BaseException:
+            self.conn.execute('ROLLBACK TO repositories')
+            raise
+        finally:
+            self.conn.execute('RELEASE repositories')
+
+    def stats(self, now_ts):
+        """Dashboard counters; all but overdue_books are kept current by triggers"""
+        stats = self.conn.execute(
+            '''SELECT total_books, total_students, active_borrows, total_transactions, total_fines,
+                      accrued_fines, fines_accrued_at,
+                      (SELECT COUNT(*) FROM transactions
+                       WHERE status = 'borrowed' AND due_ts < ?) AS overdue_books
+               FROM library_stats WHERE id = 1''',
+            (now_ts,)
+        ).fetchone()
+        return dict(stats)
+
+    def accrue_fines(self, now_ts):
+        """Bring accrued fines up to ``now_ts``; see fines.accrue_fines"""
+        return accrue_fines(self.conn, now_ts)
+
+
+def _returning(conn, query, params):
+    # Step the statement to completion so it is finished before the commit.
+    rows = conn.execute(query, params).fetchall()
+    return rows[0] if rows else None
+
+
+def _existing(conn, table, column, values):
+    # Indexed IN lookups, kept under SQLite's host-parameter limit.
+    values = list(values)
+    found = set()
+    for start in range(0, len(values), LOOKUP_CHUNK):
+        chunk = values[start:start + LOOKUP_CHUNK]
+        placeholders = ', '.join('?' * len(chunk))
+        found.update(row[0] for row in conn.execute(
+            f'SELECT {column} FROM {table} WHERE {column} IN ({placeholders})', chunk
+        ))
+    return found
+
+
+def _update(conn, table, columns, row_id, changes):
+    unknown = set(changes) - set(columns)
+    if unknown:
+        raise ValueError(f"Cannot update {table} column(s): {', '.join(sorted(unknown))}")
+    assignments = ', '.join(f'{column} = ?' for column in changes)
+    try:
+        conn.execute(f'UPDATE {table} SET {assignments} WHERE id = ?', [*changes.values(), row_id])
+    except sqlite3.IntegrityError as e:
+        raise DuplicateKey(str(e)) from e
+
+
+def with_repositories(fn):
+    """Adapt ``fn(repos, ...)`` into a unit of work ``fn(conn, ...)`` for read_db/write_db/circulate_db"""
+    @functools.wraps(fn)
+    def unit_of_work(conn, *args, **kwargs):
+        return fn(SqliteRepositories(conn), *args, **kwargs)
+    return unit_of_work
+
+
+class SqliteStorage:
+    """Runs repository units of work against library.db"""
+
+    name = 'sqlite'
+
+    async def read(self, fn, *args, **kwargs):
+        return await read_db(with_repositories(fn), *args, **kwargs)
+
+    async def write(self, fn, *args, **kwargs):
+        return await write_db(with_repositories(fn), *args, **kwargs)
+
+    async def circulate(self, fn, *args, **kwargs):
+        """A borrow or return, in a write transaction of its own rather than on the writer"""
+        return await circulate_db(with_repositories(fn), *args, **kwargs)
+
+    def stream(self, fn, *args, **kwargs):
+        """Iterate the generator ``fn(repos, ...)`` on a read-only connection of its own.
+
+        A plain iterator, for StreamingResponse to drive from its thread
+        pool; a long download never holds a pooled connection. A client that
+        disconnects leaves it unfinished, so the response must close() it
+        (``background=BackgroundTask(stream.close)``), or the connection
+        stays open until the generator is garbage collected.
+        """
+        conn = get_read_connection()
+        try:
+            yield from fn(SqliteRepositories(conn), *args, **kwargs)
+        finally:
+            conn.close()
+
+    def close(self):
+        """Finish queued writes, then stop the DB threads and close the pools"""
+        shutdown_writer()
+        shutdown_executor()
+        close_pool()
+
+
+def create_storage(backend=STORAGE_BACKEND):
+    """The storage backend named ``backend``: 'sqlite' (library.db) or 'memory'"""
+    if backend == 'sqlite':
+        return SqliteStorage()
+    if backend == 'memory':
+        from memory_repositories import MemoryStorage
+        return MemoryStorage()
+    raise ValueError(f'Unknown storage backend: {backend!r}')
@@ -0,0 +1,334 @@
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+from database import STUDENT_COLUMNS
+
+DEFAULT_SEARCH_LIMIT = 50
+SEARCH_CACHE_SIZE = int(os.environ.get('SEARCH_CACHE_SIZE', '1000'))
+# bm25 scores every match, so it is only used for queries with at most this
+# many matches. Broader queries list title matches first, then the rest,
+# newest first within each; both come straight off the index in rowid order.
+RANK_CANDIDATES = 2000
+# A last word shorter than this would be a prefix of too many words (there
+# is no one-character prefix index), so it is matched as a whole word.
+MIN_PREFIX_LENGTH = 2
+
+# External-content FTS5 index over books: the text lives only in `books`, the
+# index stores postings keyed by books.id. Prefix indexes on 2 and 3 characters
+# keep search-as-you-type queries from scanning whole term ranges.
+BOOKS_FTS_SCHEMA = [
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+           title, author, isbn,
+           content='books', content_rowid='id',
+           tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+       )''',
+    '''CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+           INSERT INTO books_fts(rowid, title, author, isbn)
+           VALUES (new.id, new.title, new.author, new.isbn);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+           INSERT INTO books_fts(books_fts, rowid, title, author, isbn)
+           VALUES ('delete', old.id, old.title, old.author, old.isbn);
+       END''',
+    # Only the indexed columns: availability changes on every borrow/return
+    # and must not touch the index.
+    '''CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE OF title, author, isbn ON books BEGIN
+           INSERT INTO books_fts(books_fts, rowid, title, author, isbn)
+           VALUES ('delete', old.id, old.title, old.author, old.isbn);
+           INSERT INTO books_fts(rowid, title, author, isbn)
+           VALUES (new.id, new.title, new.author, new.isbn);
+       END''',
+]
+
+# bm25 column weights: title matches rank above author, author above ISBN.
+BOOKS_RANK = 'bm25(books_fts, 10.0, 5.0, 1.0)'
+
+# Trigram index over the free-text student fields gives substring matching
+# ("kum" finds "Rahul Kumar") from three characters on. Registration number
+# and username are UNIQUE columns, so exact lookups on them are already
+# served by their automatic indexes.
+STUDENTS_FTS_SCHEMA = [
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS students_fts USING fts5(
+           name, email, username,
+           content='students', content_rowid='id',
+           tokenize='trigram'
+       )''',
+    '''CREATE TRIGGER IF NOT EXISTS students_fts_insert AFTER INSERT ON students BEGIN
+           INSERT INTO students_fts(rowid, name, email, username)
+           VALUES (new.id, new.name, new.email, new.username);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS students_fts_delete AFTER DELETE ON students BEGIN
+           INSERT INTO students_fts(students_fts, rowid, name, email, username)
+           VALUES ('delete', old.id, old.name, old.email, old.username);
+       END''',
+    # Borrow counts and fines change constantly and are not indexed.
+    '''CREATE TRIGGER IF NOT EXISTS students_fts_update AFTER UPDATE OF name, email, username ON students BEGIN
+           INSERT INTO students_fts(students_fts, rowid, name, email, username)
+           VALUES ('delete', old.id, old.name, old.email, old.username);
+           INSERT INTO students_fts(rowid, name, email, username)
+           VALUES (new.id, new.name, new.email, new.username);
+       END''',
+]
+
+STUDENTS_RANK = 'bm25(students_fts, 5.0, 2.0, 3.0)'
+TRIGRAM_MIN_LENGTH = 3
+
+# A random token replaced whenever a title, author or ISBN changes, by any
+# process. Cached book rankings are only valid for the token they were
+# computed under; availability updates leave it alone.
+BOOKS_SEARCH_GENERATION_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS books_search_generation (
+           id INTEGER PRIMARY KEY CHECK (id = 1),
+           token BLOB NOT NULL
+       )''',
+    'INSERT OR IGNORE INTO books_search_generation (id, token) VALUES (1, randomblob(8))',
+    '''CREATE TRIGGER IF NOT EXISTS books_search_generation_insert AFTER INSERT ON books BEGIN
+           UPDATE books_search_generation SET token = randomblob(8) WHERE id = 1;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS books_search_generation_delete AFTER DELETE ON books BEGIN
+           UPDATE books_search_generation SET token = randomblob(8) WHERE id = 1;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS books_search_generation_update AFTER UPDATE OF title, author, isbn ON books BEGIN
+           UPDATE books_search_generation SET token = randomblob(8) WHERE id = 1;
+       END''',
+]
+
+
+class SearchCache:
+    """Bounded LRU of ranked book ids per query, for one index generation.
+
+    Even bounded (see RANK_CANDIDATES), a ranking reads thousands of index
+    entries on a large catalog; popular queries are also the repeated ones. Only
+    the ids are cached: rows are read fresh, so availability is never stale.
+    Entries from an older generation are dropped on the first lookup that
+    sees a new one.
+    """
+
+    def __init__(self, maxsize=SEARCH_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._generation = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'evictions': 0}
+
+    def get(self, generation, key):
+        with self._lock:
+            if generation != self._generation:
+                if self._entries:
+                    self._entries.clear()
+                    self._stats['invalidations'] += 1
+                self._generation = generation
+            ids = self._entries.get(key)
+            if ids is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return ids
+
+    def put(self, generation, key, ids):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = tuple(ids)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation = None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({'size': len(self._entries), 'maxsize': self.maxsize})
+        return stats
+
+
+search_cache = SearchCache()
+
+
+def create_books_search_index(conn):
+    """Create the books full-text index and its triggers, populating it if new"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'"
+    ).fetchone()
+    for statement in BOOKS_FTS_SCHEMA:
+        conn.execute(statement)
+    if not exists:
+        rebuild_books_search_index(conn)
+
+
+def rebuild_books_search_index(conn):
+    """Rebuild the books full-text index from the books table"""
+    conn.execute("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
+
+
+def create_books_search_generation(conn):
+    """Create the token that invalidates cached book rankings, and its triggers"""
+    for statement in BOOKS_SEARCH_GENERATION_SCHEMA:
+        conn.execute(statement)
+
+
+def create_students_search_index(conn):
+    """Create the students trigram index and its triggers, populating it if new"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'students_fts'"
+    ).fetchone()
+    for statement in STUDENTS_FTS_SCHEMA:
+        conn.execute(statement)
+    if not exists:
+        rebuild_students_search_index(conn)
+
+
+def rebuild_students_search_index(conn):
+    """Rebuild the students trigram index from the students table"""
+    conn.execute("INSERT INTO students_fts(students_fts) VALUES ('rebuild')")
+
+
+def normalize_isbn(value):
+    return re.sub(r'[-\s]', '', value)
+
+
+def to_fts_query(text):
+    """Turn free text into an FTS5 query; the last word is still being typed,
+    so it is prefix-matched (from MIN_PREFIX_LENGTH characters on) while
+    earlier words must match whole."""
+    words = re.findall(r'\w+', text)
+    terms = [f'"{word}"' for word in words]
+    if terms and len(words[-1]) >= MIN_PREFIX_LENGTH:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_books(conn, text, limit=DEFAULT_SEARCH_LIMIT):
+    """Ranked book search: exact ISBN first, then prefix full-text match."""
+    isbn = normalize_isbn(text)
+    if len(isbn) == 13 and isbn.isdigit():
+        rows = conn.execute('SELECT * FROM books WHERE isbn = ?', (isbn,)).fetchall()
+        if rows:
+            return rows
+
+    fts_query = to_fts_query(text)
+    if not fts_query:
+        return []
+    # Read the generation before ranking: a change committed in between moves
+    # the token on, so a ranking is never filed under a newer one than it saw.
+    generation = conn.execute('SELECT token FROM books_search_generation WHERE id = 1').fetchone()[0]
+    key = (fts_query, limit)
+    ids = search_cache.get(generation, key)
+    if ids is None:
+        ids = _ranked_book_ids(conn, fts_query, limit)
+        search_cache.put(generation, key, ids)
+    if not ids:
+        return []
+    rows = conn.execute(
+        f"SELECT * FROM books WHERE id IN ({', '.join('?' * len(ids))})", ids
+    ).fetchall()
+    by_id = {row['id']: row for row in rows}
+    return [by_id[book_id] for book_id in ids if book_id in by_id]
+
+
+def _ranked_book_ids(conn, fts_query, limit):
+    """Ids of the best ``limit`` matches, scoring at most RANK_CANDIDATES of them"""
+    broad = conn.execute(
+        'SELECT 1 FROM books_fts WHERE books_fts MATCH ? ORDER BY rowid DESC LIMIT 1 OFFSET ?',
+        (fts_query, RANK_CANDIDATES)
+    ).fetchone()
+    if broad is None:
+        return [row[0] for row in conn.execute(
+            f'SELECT rowid FROM books_fts WHERE books_fts MATCH ? ORDER BY {BOOKS_RANK} LIMIT ?',
+            (fts_query, limit)
+        )]
+    ids = [row[0] for row in conn.execute(
+        'SELECT rowid FROM books_fts WHERE books_fts MATCH ? ORDER BY rowid DESC LIMIT ?',
+        (f'{{title}} : ({fts_query})', limit)
+    )]
+    if len(ids) < limit:
+        seen = set(ids)
+        ids.extend(book_id for (book_id,) in conn.execute(
+            'SELECT rowid FROM books_fts WHERE books_fts MATCH ? ORDER BY rowid DESC LIMIT ?',
+            (fts_query, limit + len(ids))
+        ) if book_id not in seen)
+    return ids[:limit]
+
+
+def search_students(conn, text, limit=DEFAULT_SEARCH_LIMIT):
+    """Ranked student search without the password column.
+
+    Exact registration number or username matches come first, then substring
+    matches on name, email and username ranked by bm25. Queries shorter than
+    a trigram fall back to prefix ranges on the username and registration
+    number indexes.
+    """
+    text = text.strip()
+    if not text:
+        return []
+
+    results, seen = [], set()
+
+    def add(rows):
+        for row in rows:
+            if row['id'] not in seen and len(results) < limit:
+                seen.add(row['id'])
+                results.append(row)
+
+    add(conn.execute(
+        f'SELECT {STUDENT_COLUMNS} FROM students WHERE registration_no = ? OR username = ?',
+        (text, text)
+    ).fetchall())
+
+    if len(text) >= TRIGRAM_MIN_LENGTH:
+        phrase = '"' + text.replace('"', '""') + '"'
+        # Every match is ranked, then the top rows are joined back to students.
+        add(conn.execute(
+            f'''SELECT {STUDENT_COLUMNS} FROM (
+                    SELECT rowid AS student_id, {STUDENTS_RANK} AS score FROM students_fts
+                    WHERE students_fts MATCH ?
+                    ORDER BY score
+                    LIMIT ?
+                ) AS hits
+                JOIN students ON students.id = hits.student_id
+                ORDER BY hits.score''',
+            (phrase, limit + len(results))
+        ).fetchall())
+    else:
+        upper = text + '\U0010ffff'
+        for column in ('username', 'registration_no'):
+            add(conn.execute(
+                f'''SELECT {STUDENT_COLUMNS} FROM students
+                    WHERE {column} >= ? AND {column} < ?
+                    ORDER BY {column} LIMIT ?''',
+                (text, upper, limit)
+            ).fetchall())
+
+    return results
+
+
+if __name__ == '__main__':
+    from database import get_db_connection
+
+    if sys.argv[1:] != ['rebuild']:
+        print('usage: python search.py rebuild')
+        sys.exit(2)
+    conn = get_db_connection()
+    try:
+        create_books_search_index(conn)
+        rebuild_books_search_index(conn)
+        create_books_search_generation(conn)
+        create_students_search_index(conn)
+        rebuild_students_search_index(conn)
+        conn.commit()
+        books = conn.execute('SELECT COUNT(*) FROM books').fetchone()[0]
+        students = conn.execute('SELECT COUNT(*) FROM students').fetchone()[0]
+        print(f'Rebuilt search indexes ({books} books, {students} students)')
+    finally:
+        conn.close()
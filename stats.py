@@ -0,0 +1,109 @@
+import sys
+
+# Counters kept in the single library_stats row, with the aggregate each one
+# must equal. Triggers keep them current on every insert, update and delete,
+# so the dashboard reads one row instead of scanning three tables.
+COUNTERS = {
+    'total_books': 'SELECT COUNT(*) FROM books',
+    'total_students': 'SELECT COUNT(*) FROM students',
+    'active_borrows': "SELECT COUNT(*) FROM transactions WHERE status = 'borrowed'",
+    'total_transactions': 'SELECT COUNT(*) FROM transactions',
+    'total_fines': 'SELECT COALESCE(SUM(fine_amount), 0) FROM transactions WHERE fine_amount > 0',
+}
+
+STATS_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS library_stats (
+           id INTEGER PRIMARY KEY CHECK (id = 1),
+           total_books INTEGER NOT NULL DEFAULT 0,
+           total_students INTEGER NOT NULL DEFAULT 0,
+           active_borrows INTEGER NOT NULL DEFAULT 0,
+           total_transactions INTEGER NOT NULL DEFAULT 0,
+           total_fines REAL NOT NULL DEFAULT 0
+       )''',
+    'INSERT OR IGNORE INTO library_stats (id) VALUES (1)',
+    '''CREATE TRIGGER IF NOT EXISTS stats_books_insert AFTER INSERT ON books BEGIN
+           UPDATE library_stats SET total_books = total_books + 1 WHERE id = 1;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS stats_books_delete AFTER DELETE ON books BEGIN
+           UPDATE library_stats SET total_books = total_books - 1 WHERE id = 1;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS stats_students_insert AFTER INSERT ON students BEGIN
+           UPDATE library_stats SET total_students = total_students + 1 WHERE id = 1;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS stats_students_delete AFTER DELETE ON students BEGIN
+           UPDATE library_stats SET total_students = total_students - 1 WHERE id = 1;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS stats_transactions_insert AFTER INSERT ON transactions BEGIN
+           UPDATE library_stats SET
+               total_transactions = total_transactions + 1,
+               active_borrows = active_borrows + (new.status = 'borrowed'),
+               total_fines = total_fines + MAX(COALESCE(new.fine_amount, 0), 0)
+           WHERE id = 1;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS stats_transactions_update AFTER UPDATE OF status, fine_amount ON transactions BEGIN
+           UPDATE library_stats SET
+               active_borrows = active_borrows + (new.status = 'borrowed') - (old.status = 'borrowed'),
+               total_fines = total_fines + MAX(COALESCE(new.fine_amount, 0), 0) - MAX(COALESCE(old.fine_amount, 0), 0)
+           WHERE id = 1;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS stats_transactions_delete AFTER DELETE ON transactions BEGIN
+           UPDATE library_stats SET
+               total_transactions = total_transactions - 1,
+               active_borrows = active_borrows - (old.status = 'borrowed'),
+               total_fines = total_fines - MAX(COALESCE(old.fine_amount, 0), 0)
+           WHERE id = 1;
+       END''',
+]
+
+
+def create_stats_table(conn):
+    """Create the library_stats row and its triggers, seeded from the live tables"""
+    for statement in STATS_SCHEMA:
+        conn.execute(statement)
+    recompute_stats(conn)
+
+
+def compute_stats(conn):
+    """Counter values recomputed from scratch with full aggregates"""
+    return {name: conn.execute(query).fetchone()[0] for name, query in COUNTERS.items()}
+
+
+def recompute_stats(conn):
+    values = compute_stats(conn)
+    assignments = ', '.join(f'{name} = ?' for name in values)
+    conn.execute(f'UPDATE library_stats SET {assignments} WHERE id = 1', list(values.values()))
+    return values
+
+
+def verify_stats(conn, fix=False):
+    """Compare the stored counters with full aggregates.
+
+    Returns {counter: (stored, actual)} for every counter that drifted; with
+    ``fix=True`` the stored row is overwritten with the actual values.
+    """
+    stored = dict(conn.execute(f'SELECT {", ".join(COUNTERS)} FROM library_stats WHERE id = 1').fetchone())
+    actual = compute_stats(conn)
+    drift = {}
+    for name, value in actual.items():
+        if round(stored[name] or 0, 2) != round(value or 0, 2):
+            drift[name] = (stored[name], value)
+    if drift and fix:
+        recompute_stats(conn)
+    return drift
+
+
+if __name__ == '__main__':
+    from database import get_db_connection
+
+    fix = '--fix' in sys.argv[1:]
+    conn = get_db_connection()
+    try:
+        drift = verify_stats(conn, fix=fix)
+        conn.commit()
+        if not drift:
+            print('library_stats matches the live tables')
+        for name, (stored, actual) in drift.items():
+            print(f'{name}: stored {stored}, actual {actual}' + (' (fixed)' if fix else ''))
+        sys.exit(1 if drift and not fix else 0)
+    finally:
+        conn.close()
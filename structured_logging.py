@@ -0,0 +1,245 @@
+"""Structured JSON logging that stays off the request path.
+
+Loggers under ``library`` hand records to a bounded in-memory queue; a
+background listener thread formats them as one JSON object per line and
+writes them to stdout. The request thread only runs the cheap filters and
+the enqueue:
+
+- every record carries the current request ID (see RequestContextMiddleware)
+- per-level sampling keeps a fraction of the records at that level
+- per-level rate limits cap records per second; the next record that gets
+  through reports how many were suppressed
+- if the queue is full the record is dropped and counted, never waited on
+
+Configured from the environment: LOG_LEVEL, LOG_SAMPLING (e.g.
+``DEBUG=0.01,INFO=1``), LOG_RATE_LIMITS (records per second, e.g.
+``DEBUG=50,INFO=1000``) and LOG_QUEUE_SIZE.
+"""
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+LOGGER_NAME = 'library'
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_SAMPLING = os.environ.get('LOG_SAMPLING', 'DEBUG=1,INFO=1')
+LOG_RATE_LIMITS = os.environ.get('LOG_RATE_LIMITS', 'DEBUG=100,INFO=1000')
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+
+REQUEST_ID_HEADER = 'x-request-id'
+# Client-supplied request IDs are echoed into logs, so only accept plain ones.
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+request_id_var = contextvars.ContextVar('request_id', default=None)
+
+_stats = {'enqueued': 0, 'sampled_out': 0, 'rate_limited': 0, 'queue_full': 0}
+_stats_lock = threading.Lock()
+_listener = None
+
+
+def _count(key):
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def get_logger(name):
+    """Logger for a part of the application, e.g. get_logger('auth')"""
+    return logging.getLogger(f'{LOGGER_NAME}.{name}')
+
+
+def parse_levels(spec, cast=float):
+    """'DEBUG=0.1,INFO=1' -> {logging.DEBUG: 0.1, logging.INFO: 1.0}"""
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, value = item.partition('=')
+        levels[logging.getLevelName(name.strip().upper())] = cast(value)
+    return levels
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep each record with the probability configured for its level"""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno, 1.0)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        _count('sampled_out')
+        return False
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per level: at most ``limits[level]`` records per second"""
+
+    def __init__(self, limits):
+        super().__init__()
+        self.limits = limits
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        limit = self.limits.get(record.levelno)
+        if not limit:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, suppressed = self._buckets.get(record.levelno, (limit, now, 0))
+            tokens = min(limit, tokens + (now - updated) * limit)
+            if tokens < 1:
+                self._buckets[record.levelno] = (tokens, now, suppressed + 1)
+                _count('rate_limited')
+                return False
+            self._buckets[record.levelno] = (tokens - 1, now, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops and counts records when the queue is full"""
+
+    def prepare(self, record):
+        # Resolve the message and traceback here; the record crosses threads.
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            _count('enqueued')
+        except queue.Full:
+            _count('queue_full')
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if getattr(record, 'suppressed', 0):
+            entry['suppressed'] = record.suppressed
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+def start_logging(stream=None):
+    """Attach the queue handler to the ``library`` logger and start the writer thread"""
+    global _listener
+    if _listener is not None:
+        return _listener
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(RequestIdFilter())
+    handler.addFilter(SamplingFilter(parse_levels(LOG_SAMPLING)))
+    handler.addFilter(RateLimitFilter(parse_levels(LOG_RATE_LIMITS, int)))
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+    logger.addHandler(handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is None:
+        return
+    logger = logging.getLogger(LOGGER_NAME)
+    for handler in list(logger.handlers):
+        if isinstance(handler, DroppingQueueHandler):
+            logger.removeHandler(handler)
+    _listener.stop()
+    _listener = None
+
+
+def logging_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+class RequestContextMiddleware:
+    """Give every HTTP request an ID and write one access log record for it.
+
+    The ID is taken from an incoming X-Request-ID header when it looks sane,
+    otherwise generated. It is stored in ``request_id_var`` for the duration
+    of the request and echoed back in the X-Request-ID response header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.logger = get_logger('access')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope.get('headers', []):
+            if name == REQUEST_ID_HEADER.encode('latin-1'):
+                candidate = value.decode('latin-1')
+                if REQUEST_ID_PATTERN.match(candidate):
+                    request_id = candidate
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_with_request_id(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+                headers = list(message.get('headers', []))
+                headers.append((REQUEST_ID_HEADER.encode('latin-1'), request_id.encode('latin-1')))
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            self.logger.info('request', extra={'fields': {
+                'method': scope['method'],
+                'path': scope['path'],
+                'status': status_code,
+                'duration_ms': round((time.perf_counter() - start) * 1000, 3),
+            }})
+            request_id_var.reset(token)
@@ -0,0 +1,77 @@
+"""Tests for the streamed ledger export in app.py.
+
+    python -m pytest test_export.py
+"""
+import asyncio
+import contextlib
+import io
+import os
+import sqlite3
+
+import pytest
+
+import app
+import database
+import export
+import repositories
+from circulation import borrow_book
+from data_access import write_transaction
+from repositories import SqliteStorage, with_repositories
+
+
+@pytest.fixture
+def opened(tmp_path, monkeypatch):
+    """Every read connection storage.stream opens, on a fresh library.db with three loans"""
+    path = os.path.join(tmp_path, 'library.db')
+    monkeypatch.setattr(database, 'DATABASE_NAME', path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.init_database()
+
+    def lend(repos):
+        student = repos.students.add('meera.nair', 'hash', 'Meera Nair', 'meera.nair@college.edu', '9876500000')
+        for i in range(3):
+            book = repos.books.add(f'Export {i}', 'Bench Author', f'97800000002{i:02d}', 100, 9.99, 'Fiction', 1)
+            borrow_book(repos, student['id'], book['id'])
+
+    conn = database.get_db_connection()
+    write_transaction(conn, with_repositories(lend))
+    conn.close()
+
+    connections = []
+
+    def get_read_connection():
+        connections.append(database.get_read_connection(path))
+        return connections[-1]
+
+    monkeypatch.setattr(repositories, 'get_read_connection', get_read_connection)
+    monkeypatch.setattr(app, 'storage', SqliteStorage())
+    # One loan per chunk, so the client can leave with chunks still unread.
+    monkeypatch.setattr(export, 'EXPORT_FETCH_SIZE', 1)
+    return connections
+
+
+def test_abandoned_export_closes_connection(opened):
+    async def download():
+        response = await app.admin_export_transactions('csv', None, None, False, {})
+        bodies = []
+        disconnected = asyncio.Event()
+
+        async def receive():
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.body':
+                bodies.append(message['body'])
+                # The client goes away after the first chunk (the CSV header).
+                disconnected.set()
+                await asyncio.sleep(0.5)
+
+        await response({'type': 'http', 'asgi': {'spec_version': '2.3'}}, receive, send)
+        return bodies
+
+    bodies = asyncio.run(download())
+    assert len(bodies) == 1, 'stream abandoned after the header'
+    assert len(opened) == 1, 'one read connection for the stream'
+    with pytest.raises(sqlite3.ProgrammingError):
+        opened[0].execute('SELECT 1')
@@ -0,0 +1,38 @@
+"""Tests for the password hashing pool in hashing.py.
+
+    python -m pytest test_hashing.py
+"""
+import asyncio
+import multiprocessing
+
+import pytest
+
+import hashing
+from hashing import PasswordHasher, worker_start_method
+
+
+def test_start_method_exists_here():
+    assert worker_start_method() in multiprocessing.get_all_start_methods()
+
+
+def test_start_method_without_forkserver(monkeypatch):
+    # Windows offers spawn only.
+    monkeypatch.setattr(hashing.multiprocessing, 'get_all_start_methods', lambda: ['spawn'])
+    assert worker_start_method() == 'spawn'
+
+
+@pytest.mark.parametrize('methods', [None, ['spawn']], ids=['this-platform', 'spawn-only'])
+def test_executor_hashes_and_verifies(monkeypatch, methods):
+    if methods is not None:
+        monkeypatch.setattr(hashing.multiprocessing, 'get_all_start_methods', lambda: methods)
+    hasher = PasswordHasher(workers=1, rounds=4)
+    try:
+        assert hasher._get_executor()._mp_context.get_start_method() == worker_start_method()
+
+        async def round_trip():
+            hashed = await hasher.hash('pass123')
+            return await hasher.verify('pass123', hashed), await hasher.verify('wrong', hashed)
+
+        assert asyncio.run(round_trip()) == (True, False)
+    finally:
+        hasher.shutdown()
@@ -0,0 +1,449 @@
+"""Conformance tests for the storage backends in repositories.py.
+
+Every test runs against each backend on a fresh, empty store, so the
+SQLite repositories and the in-memory ones are held to the same contract:
+the same rows, orders, refusals and rollbacks. Ids are not compared across
+backends, only within a test.
+
+    python -m pytest test_repository_conformance.py
+    python -m pytest test_repository_conformance.py -k memory
+"""
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+import database
+from circulation import CirculationError, borrow_book, borrow_books, check_borrow, check_return, contended, return_book
+from data_access import write_transaction
+from export import export_transactions
+from fines import FINE_PER_DAY
+from memory_repositories import MemoryStore
+from pagination import InvalidCursor, encode_cursor
+from repositories import DuplicateKey, SqliteRepositories, with_repositories
+from stats import recompute_stats
+
+
+def add_book(repos, title, isbn, quantity=2, author='Bench Author'):
+    return repos.books.add(title, author, isbn, 100, 9.99, 'Fiction', quantity)
+
+
+def add_student(repos, username, name='Bench Student'):
+    return repos.students.add(username, 'hash', name, f'{username}@college.edu', '9876500000')
+
+
+# Backends. The run fixture is run(fn, *args, **kwargs): one unit of work against a fresh store.
+
+@pytest.fixture(scope='session')
+def sqlite_template():
+    """The full schema (migrations, triggers, FTS) with no rows in it"""
+    path = os.path.join(tempfile.mkdtemp(prefix='library-conformance-'), 'library.db')
+    database_name, database.DATABASE_NAME = database.DATABASE_NAME, path
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            database.init_database()
+    finally:
+        database.DATABASE_NAME = database_name
+    conn = sqlite3.connect(path)
+    for table in ('transactions', 'books', 'students', 'admins'):
+        conn.execute(f'DELETE FROM {table}')
+    recompute_stats(conn)
+    conn.commit()
+    template = sqlite3.connect(':memory:', check_same_thread=False)
+    conn.backup(template)
+    conn.close()
+    yield template
+    template.close()
+
+
+@pytest.fixture(params=['sqlite', 'memory'])
+def run(request):
+    if request.param == 'memory':
+        yield MemoryStore().run
+        return
+    conn = sqlite3.connect(':memory:', check_same_thread=False)
+    request.getfixturevalue('sqlite_template').backup(conn)
+    conn.row_factory = sqlite3.Row
+
+    def run_sqlite(fn, *args, **kwargs):
+        return write_transaction(conn, with_repositories(fn), *args, **kwargs)
+    yield run_sqlite
+    conn.close()
+
+
+# Tests.
+
+def test_books_crud(run):
+    book = run(add_book, 'The Hobbit', '9780547928227', 3)
+    assert (book['title'], book['quantity'], book['available']) == ('The Hobbit', 3, 3), 'added book'
+    assert run(lambda repos: repos.books.get(book['id'])['isbn']) == '9780547928227', 'get'
+    by_isbn = run(lambda repos: repos.books.find_by_isbn_or_title('9780547928227', 'x'))
+    by_title = run(lambda repos: repos.books.find_by_isbn_or_title('x', 'The Hobbit'))
+    assert (by_isbn['id'], by_title['id']) == (book['id'], book['id']), 'find by isbn or title'
+    assert run(lambda repos: repos.books.find_by_isbn_or_title('x', 'y')) is None, 'find nothing'
+
+    updated = run(lambda repos: repos.books.update(book['id'], {'title': 'The Hobbit (2nd ed.)', 'available': 1}))
+    assert (updated['title'], updated['available'], updated['quantity']) == ('The Hobbit (2nd ed.)', 1, 3), 'update'
+    assert run(lambda repos: repos.books.update(book['id'] + 100, {'title': 'x'})) is None, 'update missing'
+    with pytest.raises(ValueError):
+        run(lambda repos: repos.books.update(book['id'], {'id': 7}))
+
+    run(lambda repos: repos.books.delete(book['id']))
+    assert run(lambda repos: repos.books.get(book['id'])) is None, 'get after delete'
+
+
+def test_duplicate_keys(run):
+    first = run(add_book, 'Dune', '9780441172719')
+    second = run(add_book, 'Emma', '9780141439587')
+    with pytest.raises(DuplicateKey):
+        run(add_book, 'Dune again', '9780441172719')
+    with pytest.raises(DuplicateKey):
+        run(lambda repos: repos.books.update(second['id'], {'isbn': first['isbn']}))
+    run(add_student, 'neha.gupta')
+    with pytest.raises(DuplicateKey):
+        run(add_student, 'neha.gupta')
+    run(lambda repos: repos.admins.add('desk', 'hash', 'Front Desk'))
+    with pytest.raises(DuplicateKey):
+        run(lambda repos: repos.admins.add('desk', 'hash', 'Other Desk'))
+
+
+def test_admins(run):
+    run(lambda repos: repos.admins.add('desk', 'hash', 'Front Desk'))
+    admin = run(lambda repos: repos.admins.get_by_username('desk'))
+    assert (admin['name'], admin['role']) == ('Front Desk', 'admin'), 'admin'
+    assert run(lambda repos: repos.admins.get_by_username('nobody')) is None, 'unknown admin'
+
+
+def test_bulk_adds(run):
+    run(add_book, 'Dune', '9780441172719')
+    run(lambda repos: repos.books.add_many([
+        ('Emma', 'Jane Austen', '9780141439587', 474, 8.99, 'Romance', 3),
+        ('Ulysses', 'James Joyce', '9780199535675', 732, None, None, 1),
+    ]))
+    assert run(lambda repos: repos.books.existing_isbns({'9780441172719', '9780199535675', '9780000000002'})) == \
+        {'9780441172719', '9780199535675'}, 'existing_isbns'
+    emma = run(lambda repos: repos.books.search('9780141439587'))[0]
+    assert (emma['title'], emma['quantity'], emma['available']) == ('Emma', 3, 3), 'add_many row'
+    with pytest.raises(DuplicateKey):
+        run(lambda repos: repos.books.add_many([('Dune again', 'Frank Herbert', '9780441172719', 1, 1.0, None, 1)]))
+
+    first = run(add_student, 'neha.gupta')
+    numbers = run(lambda repos: repos.students.add_many([
+        ('rahul.kumar', 'hash', 'Rahul Kumar', 'rahul@college.edu', '9876500001'),
+        ('priya.sharma', 'hash', 'Priya Sharma', 'priya@college.edu', '9876500002'),
+    ]))
+    assert [run(lambda repos: repos.students.get_by_username(username))['registration_no']
+            for username in ('rahul.kumar', 'priya.sharma')] == numbers, 'add_many numbers in order'
+    assert len({first['registration_no'], *numbers}) == 3, 'fresh registration numbers'
+    assert run(lambda repos: repos.students.add_many([])) == [], 'empty add_many'
+    run(lambda repos: repos.admins.add('desk', 'hash', 'Front Desk'))
+    assert run(lambda repos: repos.students.existing_usernames(['neha.gupta', 'desk', 'nobody'])) == \
+        {'neha.gupta'}, 'student usernames'
+    assert run(lambda repos: repos.admins.existing_usernames(['neha.gupta', 'desk', 'nobody'])) == \
+        {'desk'}, 'admin usernames'
+
+
+def test_newest_first_paging(run):
+    ids = [run(add_book, f'Title {i}', f'97800000000{i:02d}')['id'] for i in range(5)]
+    assert [row['id'] for row in run(lambda repos: repos.books.list_all())] == ids[::-1], 'list_all order'
+
+    seen, cursor = [], None
+    for _ in range(3):
+        rows, cursor = run(lambda repos: repos.books.list_page(2, cursor))
+        seen.extend(row['id'] for row in rows)
+    assert seen == ids[::-1], 'pages'
+    assert cursor is None, 'cursor after the last page'
+    for malformed in ('not-a-cursor', encode_cursor(1), encode_cursor([], {}), encode_cursor(None, ids[0])):
+        with pytest.raises(InvalidCursor):
+            run(lambda repos: repos.books.list_page(2, malformed))
+
+
+def test_catalog_by_title(run):
+    for title, isbn in (('Zen', '9780000000001'), ('Atlas', '9780000000002'), ('Middlemarch', '9780000000003')):
+        run(add_book, title, isbn)
+    catalog = run(lambda repos: repos.books.list_by_title())
+    assert [row['title'] for row in catalog] == ['Atlas', 'Middlemarch', 'Zen'], 'catalog order'
+
+
+def test_copies(run):
+    book = run(add_book, '1984', '9780451524935', 2)
+    taken = [run(lambda repos: repos.books.take_copy(book['id'])) for _ in range(3)]
+    copy = {'id': book['id'], 'title': '1984', 'author': 'Bench Author'}
+    assert [dict(row) if row else None for row in taken] == [copy, copy, None], 'take_copy'
+    assert run(lambda repos: repos.books.take_copy(book['id'] + 100)) is None, 'take_copy of a missing book'
+    run(lambda repos: repos.books.return_copy(book['id']))
+    assert run(lambda repos: repos.books.get(book['id'])['available']) == 1, 'available after return_copy'
+
+
+def test_book_search(run):
+    run(add_book, 'The Hobbit', '9780547928227', author='J.R.R. Tolkien')
+    run(add_book, 'The Fellowship of the Ring', '9780547928210', author='J.R.R. Tolkien')
+    run(add_book, 'Brave New World', '9780060850524', author='Aldous Huxley')
+
+    def titles(text):
+        return sorted(row['title'] for row in run(lambda repos: repos.books.search(text)))
+
+    assert titles('hobb') == ['The Hobbit'], 'prefix'
+    assert titles('tolkien') == ['The Fellowship of the Ring', 'The Hobbit'], 'author'
+    assert titles('tolkien ring') == ['The Fellowship of the Ring'], 'two terms'
+    assert titles('978-0-06-085052-4') == ['Brave New World'], 'isbn'
+    assert titles('dickens') == [], 'no match'
+
+
+def test_book_search_short_and_broad(run, monkeypatch):
+    run(add_book, 'Ring Cycle', '9780000000001', author='A Wagner')
+    run(add_book, 'Lord of the Rings', '9780000000002', author='R Tolkien')
+    run(add_book, 'Collected Letters', '9780000000003', author='R Ringer')
+    run(add_book, 'Rings of Saturn', '9780000000004', author='W Sebald')
+
+    def titles(text, limit=50):
+        return [row['title'] for row in run(lambda repos: repos.books.search(text, limit))]
+
+    assert sorted(titles('r')) == ['Collected Letters', 'Lord of the Rings'], 'one letter is a whole word'
+    # Too broad to rank: title matches newest first, then the rest.
+    monkeypatch.setattr('search.RANK_CANDIDATES', 2)
+    monkeypatch.setattr('memory_repositories.RANK_CANDIDATES', 2)
+    assert titles('ring', 3) == ['Rings of Saturn', 'Lord of the Rings', 'Ring Cycle'], 'broad'
+    assert titles('ring') == ['Rings of Saturn', 'Lord of the Rings', 'Ring Cycle', 'Collected Letters'], 'broad'
+
+
+def test_students(run):
+    first = run(add_student, 'rahul.kumar', 'Rahul Kumar')
+    second = run(add_student, 'priya.sharma', 'Priya Sharma')
+    assert first['registration_no'] != second['registration_no'], 'distinct registration numbers'
+    assert (first['role'], first['borrowed_books'], first['fine_amount']) == ('student', 0, 0.0), 'defaults'
+    assert run(lambda repos: repos.students.get_by_username('priya.sharma')['id']) == second['id'], 'by username'
+
+    listed = run(lambda repos: repos.students.list_all())
+    assert [row['id'] for row in listed] == [second['id'], first['id']], 'list_all order'
+    assert not any('password' in dict(row) for row in listed), 'password hidden from listings'
+    rows, _ = run(lambda repos: repos.students.list_page(1))
+    assert not 'password' in dict(rows[0]), 'password hidden from pages'
+
+    updated = run(lambda repos: repos.students.update(first['id'], {'phone': '9000000000'}))
+    assert updated['phone'] == '9000000000', 'update'
+    with pytest.raises(ValueError):
+        run(lambda repos: repos.students.update(first['id'], {'borrowed_books': 9}))
+
+
+def test_student_search(run):
+    first = run(add_student, 'rahul.kumar', 'Rahul Kumar')
+    run(add_student, 'priya.sharma', 'Priya Sharma')
+
+    def usernames(text):
+        return [row['username'] for row in run(lambda repos: repos.students.search(text))]
+
+    assert usernames('priya.sharma') == ['priya.sharma'], 'exact username'
+    assert usernames(first['registration_no']) == ['rahul.kumar'], 'exact registration number'
+    assert usernames('kumar') == ['rahul.kumar'], 'substring'
+    assert usernames('ra') == ['rahul.kumar'], 'short prefix'
+    assert usernames('   ') == [], 'blank'
+
+
+def test_borrow_slots(run):
+    student = run(add_student, 'amit.patel', 'Amit Patel')
+    slots = [run(lambda repos: repos.students.take_borrow_slot(student['id'], 2)) for _ in range(3)]
+    assert [row['borrowed_books'] if row else None for row in slots] == [1, 2, None], 'take_borrow_slot'
+    assert slots[0]['name'] == 'Amit Patel', 'slot row'
+    run(lambda repos: repos.students.release_borrow_slot(student['id'], 15.0))
+    row = run(lambda repos: repos.students.get(student['id']))
+    assert (row['borrowed_books'], row['fine_amount']) == (1, 15.0), 'after release_borrow_slot'
+
+
+def test_loans(run):
+    book = run(add_book, 'Emma', '9780141439587')
+    student = run(add_student, 'amit.patel', 'Amit Patel')
+    now = datetime.now().replace(microsecond=0)
+    borrowed = now - timedelta(days=10)
+
+    loan = run(lambda repos: repos.transactions.open_loan(
+        student['id'], student['registration_no'], book['id'], borrowed, borrowed + timedelta(days=7)))
+    assert run(lambda repos: repos.transactions.open_loan(
+        student['id'], student['registration_no'], book['id'], now, now)) is None, 'second open loan of one book'
+    assert run(lambda repos: repos.transactions.has_open_loans(book_id=book['id'])), 'open loans by book'
+    assert run(lambda repos: repos.transactions.has_open_loans(student_id=student['id'])), 'open loans by student'
+
+    open_loans = run(lambda repos: repos.transactions.open_for_student(student['id']))
+    assert [(row['id'], row['book_title'], row['isbn']) for row in open_loans] == \
+        [(loan['id'], 'Emma', '9780141439587')], 'open_for_student'
+    overdue = run(lambda repos: repos.transactions.overdue(int(now.timestamp())))
+    assert [(row['id'], row['days_overdue'], row['student_name']) for row in overdue] == \
+        [(loan['id'], 3, 'Amit Patel')], 'overdue'
+
+    assert run(lambda repos: repos.transactions.close_loan(loan['id'], student['id'] + 100, now)) is None, \
+        'close another student\'s loan'
+    closed = run(lambda repos: repos.transactions.close_loan(loan['id'], student['id'], now))
+    assert (closed['book_id'], closed['fine_amount']) == (book['id'], 3 * FINE_PER_DAY), 'close_loan'
+    assert run(lambda repos: repos.transactions.close_loan(loan['id'], None, now)) is None, 'close twice'
+    assert not run(lambda repos: repos.transactions.has_open_loans(book_id=book['id'])), 'no open loans'
+
+    history = run(lambda repos: repos.transactions.history_for_student(student['id']))
+    assert [(row['id'], row['status'], row['title']) for row in history] == \
+        [(loan['id'], 'returned', 'Emma')], 'history'
+    ledger = run(lambda repos: repos.transactions.list_all())
+    assert [(row['transaction_id'], row['book_title'], row['registration_no']) for row in ledger] == \
+        [(loan['transaction_id'], 'Emma', student['registration_no'])], 'ledger'
+
+
+def test_ledger_export(run):
+    book = run(add_book, 'Emma', '9780141439587')
+    student = run(add_student, 'amit.patel', 'Amit Patel')
+    day = datetime(2025, 3, 10, 15, 30)
+    loans = []
+    for borrowed in (day - timedelta(days=1), day, day + timedelta(days=1)):
+        if loans:
+            run(lambda repos: repos.transactions.close_loan(loans[-1]['id'], None, borrowed))
+        loans.append(run(lambda repos: repos.transactions.open_loan(
+            student['id'], student['registration_no'], book['id'], borrowed, borrowed + timedelta(days=14))))
+
+    columns, rows = run(lambda repos: [list(part) for part in repos.transactions.ledger(
+        datetime(2025, 3, 10), datetime(2025, 3, 11))])
+    assert columns[-3:] == ['student_name', 'registration_no', 'book_title'], 'ledger columns'
+    assert [row[columns.index('transaction_id')] for row in rows] == [loans[1]['transaction_id']], 'ledger range'
+    assert len(run(lambda repos: list(repos.transactions.ledger()[1]))) == 3, 'whole ledger'
+
+    csv_text = run(lambda repos: b''.join(export_transactions(repos, 'csv', day.date(), day.date()))).decode()
+    header, *lines = csv_text.splitlines()
+    assert header.split(',') == columns and len(lines) == 1, 'csv export of one day'
+    ndjson = run(lambda repos: b''.join(export_transactions(repos, 'ndjson', date_from=day.date()))).decode()
+    assert [line.count('"book_title": "Emma"') for line in ndjson.splitlines()] == [1, 1], 'ndjson export from a day'
+
+
+def test_ledger_range_plan(sqlite_template):
+    conn = sqlite3.connect(':memory:')
+    sqlite_template.backup(conn)
+    statements = []
+    conn.set_trace_callback(statements.append)
+    repos = SqliteRepositories(conn)
+    repos.transactions.ledger(datetime(2025, 3, 10), datetime(2025, 3, 11))
+    plan = ' '.join(row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + statements[-1]))
+    assert 'SEARCH t USING INDEX idx_transactions_borrow_ts (borrow_ts>? AND borrow_ts<?)' in plan, plan
+    conn.close()
+
+
+def test_circulation(run):
+    book = run(add_book, 'Persuasion', '9780141439686', 1)
+    other = run(add_book, 'Sense and Sensibility', '9780141439662', 1)
+    student = run(add_student, 'neha.gupta', 'Neha Gupta')
+
+    assert run(check_borrow, student['id'], book['id'])['available'] == 1, 'check_borrow passes'
+    loan = run(borrow_book, student['id'], book['id'])
+    assert (loan['book']['title'], loan['student']['borrowed_count']) == ('Persuasion', 1), 'borrow_book'
+    with pytest.raises(CirculationError) as refused:
+        run(check_borrow, student['id'], book['id'])
+    assert (refused.value.status_code, refused.value.detail.startswith("'Persuasion' is not available")) == (400, True)
+    with pytest.raises(CirculationError):
+        run(borrow_book, student['id'], book['id'])
+    assert run(lambda repos: repos.students.get(student['id'])['borrowed_books']) == 1, 'refused borrow rolled back'
+
+    results = run(borrow_books, student['id'], [other['id'], book['id']])
+    assert [result['status'] for result in results] == ['borrowed', 'error'], 'borrow_books'
+    assert run(lambda repos: repos.students.get(student['id'])['borrowed_books']) == 2, 'refused item rolled back'
+
+    with pytest.raises(CirculationError) as refused:
+        run(check_return, loan['id'], student['id'] + 1)
+    assert refused.value.status_code == 404, "check_return of someone else's loan"
+    assert contended(run(check_return, loan['id'], student['id'])), 'check_return passes'
+    returned = run(return_book, loan['id'], student['id'])
+    assert (returned['book_id'], returned['fine_amount']) == (book['id'], 0.0), 'return_book'
+    with pytest.raises(CirculationError) as refused:
+        run(check_return, loan['id'])
+    assert refused.value.status_code == 400, 'check_return of a returned loan'
+    assert run(lambda repos: (repos.books.get(book['id'])['available'],
+                              repos.students.get(student['id'])['borrowed_books'])) == (1, 1), 'after return'
+
+
+def test_reserved_codes(run):
+    books = [run(add_book, f'Title {i}', f'97800000001{i:02d}', 1) for i in range(3)]
+    student = run(add_student, 'rahul.kumar', 'Rahul Kumar')
+    codes = run(lambda repos: repos.transactions.reserve_codes(2))
+    assert len(set(codes)) == 2, 'distinct codes'
+
+    results = run(borrow_books, student['id'], [books[0]['id'], books[0]['id'], books[1]['id']])
+    assert [result['status'] for result in results] == ['borrowed', 'error', 'borrowed'], 'borrow_books'
+    batch_codes = [result['transaction_id'] for result in results if result['status'] == 'borrowed']
+    loan = run(borrow_book, student['id'], books[2]['id'])
+    assert sorted(codes + batch_codes + [loan['transaction_id']]) == codes + batch_codes + [loan['transaction_id']], \
+        'codes in allocation order'
+    assert len(set(codes + batch_codes + [loan['transaction_id']])) == 5, 'no code issued twice'
+
+
+def test_rollback(run):
+    def add_then_fail(repos):
+        add_book(repos, 'Ulysses', '9780199535675')
+        raise RuntimeError('abort')
+
+    with pytest.raises(RuntimeError):
+        run(add_then_fail)
+    assert run(lambda repos: repos.books.list_all()) == [], 'books after a failed unit of work'
+    run(add_book, 'Ulysses', '9780199535675')
+
+
+def test_savepoints(run):
+    def titles():
+        return [row['title'] for row in run(lambda repos: repos.books.list_all())]
+
+    def inner_fails(repos):
+        with contextlib.suppress(RuntimeError), repos.savepoint():
+            add_book(repos, 'Inner', '9780000000011')
+            raise RuntimeError('inner')
+        add_book(repos, 'Outer', '9780000000012')
+
+    run(inner_fails)
+    assert titles() == ['Outer'], 'inner savepoint undone'
+
+    def outer_fails(repos):
+        with repos.savepoint():
+            add_book(repos, 'Released', '9780000000013')
+        raise RuntimeError('outer')
+
+    with pytest.raises(RuntimeError):
+        run(outer_fails)
+    assert titles() == ['Outer'], 'released savepoint undone with its transaction'
+
+
+def test_stats(run):
+    book = run(add_book, 'Middlemarch', '9780141439549', 2)
+    student = run(add_student, 'amit.patel')
+    now = datetime.now().replace(microsecond=0)
+    late = run(lambda repos: repos.transactions.open_loan(
+        student['id'], student['registration_no'], book['id'], now - timedelta(days=9), now - timedelta(days=2)))
+    run(add_student, 'priya.sharma')
+
+    def snapshot():
+        values = run(lambda repos: repos.stats(int(now.timestamp())))
+        return {name: values[name] for name in
+                ('total_books', 'total_students', 'active_borrows', 'overdue_books', 'total_transactions', 'total_fines')}
+
+    assert snapshot() == {'total_books': 1, 'total_students': 2, 'active_borrows': 1, 'overdue_books': 1,
+                          'total_transactions': 1, 'total_fines': 0.0}, 'stats with a late loan'
+    run(lambda repos: repos.transactions.close_loan(late['id'], None, now))
+    assert snapshot() == {'total_books': 1, 'total_students': 2, 'active_borrows': 0, 'overdue_books': 0,
+                          'total_transactions': 1, 'total_fines': 2 * FINE_PER_DAY}, 'stats after the return'
+
+
+def test_accrue_fines(run):
+    book = run(add_book, 'Middlemarch', '9780141439549', 3)
+    late, early, returned = (run(add_student, username) for username in ('amit.patel', 'priya.sharma', 'rahul.kumar'))
+    now = datetime.now().replace(microsecond=0)
+    for student, due in ((late, now - timedelta(days=3, hours=1)), (early, now + timedelta(days=1)),
+                         (returned, now - timedelta(days=5))):
+        loan = run(lambda repos: repos.transactions.open_loan(
+            student['id'], student['registration_no'], book['id'], due - timedelta(days=14), due))
+    now_ts = int(now.timestamp())
+
+    result = run(lambda repos: repos.accrue_fines(now_ts))
+    assert result == {'overdue_loans': 2, 'students_updated': 2, 'total_accrued': 8 * FINE_PER_DAY,
+                      'accrued_at': now_ts}, 'first run'
+    run(lambda repos: repos.transactions.close_loan(loan['id'], None, now))
+    result = run(lambda repos: repos.accrue_fines(now_ts))
+    assert (result['overdue_loans'], result['students_updated'], result['total_accrued']) == \
+        (1, 1, 3 * FINE_PER_DAY), 'after a return'
+    assert [run(lambda repos: repos.students.get(student['id']))['accrued_fine'] for student in (late, early, returned)] \
+        == [3 * FINE_PER_DAY, 0, 0], 'accrued per student'
+    stats = run(lambda repos: repos.stats(now_ts))
+    assert (stats['accrued_fines'], stats['fines_accrued_at']) == (3 * FINE_PER_DAY, now_ts), 'library totals'
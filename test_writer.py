@@ -0,0 +1,75 @@
+"""Tests for the writer thread in writer.py: bulk jobs sharing it, and a busy write lock.
+
+    python -m pytest test_writer.py
+"""
+import asyncio
+import contextlib
+import io
+import os
+
+import pytest
+
+import data_access
+import database
+import writer
+from book_import import import_books
+from data_access import WriteBusy
+from metrics import DB_BUSY_ERRORS
+from repositories import SqliteStorage
+from writer import Writer
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    """SqliteStorage whose writes go to a fresh library.db in tmp_path"""
+    path = os.path.join(tmp_path, 'library.db')
+    monkeypatch.setattr(database, 'DATABASE_NAME', path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.init_database()
+    test_writer = Writer(database=path)
+    monkeypatch.setattr(writer, '_writer', test_writer)
+    # Short enough that a write stuck behind the whole import would fail.
+    monkeypatch.setattr(writer, 'WRITE_TIMEOUT', 5.0)
+    yield SqliteStorage()
+    test_writer.stop()
+
+
+def test_import_alongside_writes(storage):
+    books = 20000
+    rows = ((i + 2, (f'Imported {i}', 'Bulk Author', f'978{i:010d}', 100, 9.99, 'Fiction', 1), None)
+            for i in range(books))
+
+    async def writes():
+        added = []
+        for i in range(100):
+            # A WriterBusy or WriteTimeout here is what the API turns into a 503.
+            added.append(await storage.write(
+                lambda repos, n: repos.books.add(f'Desk {n}', 'Desk Author', f'979{n:010d}', 1, 1.0, None, 1), i))
+            await asyncio.sleep(0.001)
+        return added
+
+    async def run():
+        return await asyncio.gather(import_books(rows, storage, batch_size=500), writes())
+
+    report, added = asyncio.run(run())
+    assert (report['rows'], report['imported'], report['errors']) == (books, books, []), 'import report'
+    assert len(added) == 100, 'every concurrent write committed'
+    last_imported = asyncio.run(storage.write(
+        lambda repos: repos.conn.execute("SELECT MAX(id) FROM books WHERE author = 'Bulk Author'").fetchone()[0]))
+    assert added[0]['id'] < last_imported, 'writes went in between import batches'
+
+
+def test_busy_lock_counted(storage, monkeypatch):
+    monkeypatch.setattr(data_access, 'WRITE_RETRIES', 1)
+    monkeypatch.setattr(data_access, 'WRITE_BACKOFF', 0.001)
+    before = DB_BUSY_ERRORS.value('writer')
+    # Another process's bulk job, holding the write lock past every retry.
+    holder = database.get_db_connection()
+    holder.execute('BEGIN IMMEDIATE')
+    try:
+        with pytest.raises(WriteBusy):
+            asyncio.run(storage.write(lambda repos: repos.books.list_all()))
+    finally:
+        holder.rollback()
+        holder.close()
+    assert DB_BUSY_ERRORS.value('writer') == before + 1, 'WriteBusy counted as a busy error'
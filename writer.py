@@ -0,0 +1,224 @@
+"""One writer thread that owns the write connection and group-commits.
+
+Every mutating endpoint hands its unit of work to ``write_db``, except a
+borrow or return of a contended title (see ``data_access.circulate_db``).
+The work is queued for a single thread that holds its own SQLite
+connection. That thread takes everything waiting in the queue (up to
+WRITE_GROUP_MAX operations) and applies it in one write transaction:
+
+- each operation runs in its own savepoint, so one that raises is rolled
+  back alone and its caller gets the exception
+- the group is committed once, and only then are the callers' futures
+  resolved, so nobody sees a success that was not durable
+- if the commit itself fails, every operation in the group fails with it
+- if the thread itself dies, everything queued fails with the error and
+  the next write starts a new thread
+
+While a group is being committed the next one queues up, so the busier
+the API gets, the more operations share each lock acquisition and commit.
+Operations must not begin, commit or roll back themselves; code written
+for ``data_access.write_transaction`` runs unchanged, since that helper
+joins the transaction already open.
+
+Bulk jobs go through the writer too, so they never hold the write lock
+while queued writes time out. Book import and roster enrollment submit
+one batch (IMPORT_BATCH_SIZE, ENROLL_BATCH_SIZE rows) per operation, and
+other writes are committed in between. Fine accrual is a single
+operation: one aggregate pass takes about a second at 1M open loans,
+far inside WRITE_TIMEOUT.
+"""
+import asyncio
+import contextvars
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from data_access import WRITE_BUSY_TIMEOUT_MS, begin_immediate
+from database import DATABASE_NAME, configure_connection
+from metrics import DB_DURATION, WRITE_GROUP_SIZE
+
+WRITE_GROUP_MAX = int(os.environ.get('DB_WRITE_GROUP_MAX', '64'))
+# Writes allowed to wait for the writer before new ones are turned away.
+WRITE_QUEUE_SIZE = int(os.environ.get('DB_WRITE_QUEUE_SIZE', '1024'))
+# Seconds a caller waits for its write to be committed before giving up.
+WRITE_TIMEOUT = float(os.environ.get('DB_WRITE_TIMEOUT', '30'))
+
+_STOP = object()
+
+
+class WriterBusy(Exception):
+    """Raised when the write queue is full and an operation is rejected."""
+
+
+class WriteTimeout(Exception):
+    """Raised when a queued write was not committed within WRITE_TIMEOUT.
+
+    ``future`` is the write's Future, done once the writer has committed or
+    dropped it.
+    """
+
+    def __init__(self, message, future=None):
+        super().__init__(message)
+        self.future = future
+
+
+class Writer:
+    def __init__(self, database=DATABASE_NAME, group_max=WRITE_GROUP_MAX, queue_size=WRITE_QUEUE_SIZE):
+        self.database = database
+        self.group_max = group_max
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {'operations': 0, 'failed': 0, 'groups': 0, 'commits_failed': 0, 'rejected': 0, 'crashes': 0}
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue ``fn(conn, *args, **kwargs)``; returns a concurrent.futures.Future"""
+        self.start()
+        future = Future()
+        try:
+            self._queue.put_nowait((fn, args, kwargs, future, contextvars.copy_context()))
+        except queue.Full:
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise WriterBusy('Write queue is full')
+        return future
+
+    def stop(self):
+        """Finish everything queued so far, then close the connection"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({'queued': self._queue.qsize(), 'group_max': self.group_max})
+        return stats
+
+    def _run(self):
+        conn = None
+        group = []
+        try:
+            conn = configure_connection(sqlite3.connect(self.database, timeout=30), WRITE_BUSY_TIMEOUT_MS)
+            stopping = False
+            while not stopping:
+                group = [self._queue.get()]
+                if group[0] is _STOP:
+                    break
+                while len(group) < self.group_max:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    group.append(item)
+                self._commit_group(conn, group)
+        except BaseException as error:
+            # The thread is going away: let the next submit() start a new
+            # one, and fail everything it would have left waiting forever.
+            with self._lock:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+                self._stats['crashes'] += 1
+            self._fail_pending(group, error)
+            raise
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _fail_pending(self, group, error):
+        """Fail the futures of ``group`` and of everything still queued with ``error``"""
+        pending = list(group)
+        while True:
+            try:
+                pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for item in pending:
+            if item is not _STOP and not item[3].done():
+                item[3].set_exception(error)
+
+    def _commit_group(self, conn, group):
+        group = [item for item in group if item[3].set_running_or_notify_cancel()]
+        if not group:
+            return
+        WRITE_GROUP_SIZE.observe(len(group))
+        outcomes = []
+        try:
+            begin_immediate(conn, 'writer')
+            for fn, args, kwargs, future, context in group:
+                operation = getattr(fn, '__name__', 'unknown')
+                start = time.perf_counter()
+                conn.execute('SAVEPOINT write_op')
+                try:
+                    outcomes.append((future, context.run(fn, conn, *args, **kwargs), None))
+                except Exception as error:
+                    conn.execute('ROLLBACK TO write_op')
+                    outcomes.append((future, None, error))
+                conn.execute('RELEASE write_op')
+                DB_DURATION.observe(time.perf_counter() - start, 'writer', operation)
+            conn.commit()
+        except Exception as error:
+            # The transaction could not be begun or committed: nothing in the
+            # group was written, so every caller gets this error.
+            if conn.in_transaction:
+                conn.rollback()
+            with self._lock:
+                self._stats['commits_failed'] += 1
+                self._stats['failed'] += len(group)
+            for _, _, _, future, _ in group:
+                future.set_exception(error)
+            return
+
+        failed = sum(1 for _, _, error in outcomes if error is not None)
+        with self._lock:
+            self._stats['groups'] += 1
+            self._stats['operations'] += len(outcomes)
+            self._stats['failed'] += failed
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+_writer = Writer()
+
+
+def get_writer():
+    return _writer
+
+
+def shutdown_writer():
+    _writer.stop()
+
+
+async def write_db(fn, *args, **kwargs):
+    """Run ``fn(conn, *args, **kwargs)`` on the writer thread and await its committed result.
+
+    ``fn`` is a plain synchronous function that shares a transaction with
+    whatever else is queued; its writes are rolled back alone if it raises, and the exception
+    (including ``HTTPException``) propagates to the caller. Raises
+    WriteTimeout after WRITE_TIMEOUT seconds; a write that has not started by
+    then is dropped, one that has may still be committed.
+    """
+    future = _writer.submit(fn, *args, **kwargs)
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), WRITE_TIMEOUT)
+    except asyncio.TimeoutError:
+        if future.done() and not future.cancelled():
+            raise  # fn itself raised TimeoutError
+        raise WriteTimeout(f'Write not committed within {WRITE_TIMEOUT}s', future) from None